@@ -3,67 +3,118 @@
 """
 Jellyfin 剧集分类分析工具
 
-用于分析 Jellyfin 媒体库中剧集的 ParentId，
-帮助配置 weekly_rank_v2.py 中的 LIBRARY_ANIME 和 LIBRARY_TV。
+扫描 Jellyfin 中的全部剧集，按 ParentId 与 Path 所在目录分组统计，
+帮助配置 weekly_rank_v3.py 中的 LIBRARY_ANIME 和 LIBRARY_TV。
 
 使用方法：
 1. 配置 JELLYFIN_URL 和 JELLYFIN_API_KEY
-2. 修改 known_anime 和 known_tv 列表，添加你知道分类的剧集名称
-3. 运行脚本，查看输出的 ParentId
-4. 将相同 ParentId 的剧集对应的 ID 配置到 weekly_rank_v2.py
+2. 运行脚本：python analyze_series.py
+3. 按输出中每个 ParentId 的示例剧集判断它是番剧库还是电视剧库
+4. 将对应的 ParentId 配置到 weekly_rank_v3.py（或 .env）
+
+导出 JSON：python analyze_series.py --json libraries.json
 """
-import requests
 import json
+import argparse
+import posixpath
+from collections import defaultdict
+
+from report_common import fetch_all_series
 
 # ============ 配置区 ============
 JELLYFIN_URL = "https://your-jellyfin-server.com"
 JELLYFIN_API_KEY = "YOUR_JELLYFIN_API_KEY"
 
-# 已知的分类（用于分析 ParentId）
-# 添加一些你确定分类的剧集名称
-known_anime = ["你的番剧1", "你的番剧2"]
-known_tv = ["你的电视剧1", "你的电视剧2"]
+# 每页剧集数与并发请求数
+PAGE_SIZE = 500
+WORKERS = 4
+
+# 每个分组展示的示例剧集数
+SAMPLE_SIZE = 5
 # ================================
 
-all_series = known_anime + known_tv
+SERVER = {"name": "default", "jellyfin_url": JELLYFIN_URL, "jellyfin_api_key": JELLYFIN_API_KEY}
 
-print("=" * 60)
-print("Jellyfin 剧集 ParentId 分析工具")
-print("=" * 60)
-print("\n此工具用于获取剧集的 ParentId，帮助配置分类逻辑。")
-print("相同媒体库的剧集会有相同的 ParentId。\n")
 
-for series_name in all_series:
-    print(f"【{series_name}】")
-    
-    try:
-        url = f"{JELLYFIN_URL}/Items"
-        params = {
-            "searchTerm": series_name,
-            "Limit": 1,
-            "IncludeItemTypes": "Series",
-            "Recursive": "true",
-            "Fields": "ParentId,Path"
+def scan_series(page_size=PAGE_SIZE, workers=WORKERS):
+    """分页扫描全部剧集（与周榜建立剧集索引共用同一分页逻辑）"""
+    items = fetch_all_series(SERVER, page_size, workers)
+    print(f"  共 {len(items)} 部剧集")
+    return items
+
+
+def path_prefix(path):
+    """剧集所在目录（Path 的上一级）"""
+    if not path:
+        return "N/A"
+    return posixpath.dirname(path.replace("\\", "/").rstrip("/")) or "/"
+
+
+def summarize(items):
+    """按 ParentId 分组，统计剧集数、所在目录与示例剧集"""
+    groups = defaultdict(lambda: {"count": 0, "paths": defaultdict(int), "samples": []})
+    for item in items:
+        group = groups[item.get("ParentId") or "N/A"]
+        group["count"] += 1
+        group["paths"][path_prefix(item.get("Path"))] += 1
+        if len(group["samples"]) < SAMPLE_SIZE:
+            group["samples"].append(item.get("Name", ""))
+
+    return [
+        {
+            "parent_id": parent_id,
+            "series_count": group["count"],
+            "paths": dict(sorted(group["paths"].items(), key=lambda kv: kv[1], reverse=True)),
+            "samples": group["samples"],
         }
-        headers = {"X-Emby-Token": JELLYFIN_API_KEY}
-        r = requests.get(url, params=params, headers=headers, timeout=10)
-        
-        if r.status_code == 200 and r.json().get("Items"):
-            item = r.json()["Items"][0]
-            parent_id = item.get("ParentId", "N/A")
-            path = item.get("Path", "N/A")
-            
-            print(f"  ParentId: {parent_id}")
-            print(f"  Path: {path}")
-            print()
-        else:
-            print(f"  未找到\n")
+        for parent_id, group in sorted(groups.items(), key=lambda kv: kv[1]["count"], reverse=True)
+    ]
+
+
+def print_summary(libraries):
+    """打印 媒体库 -> 剧集数 汇总"""
+    for library in libraries:
+        print(f"【ParentId: {library['parent_id']}】 {library['series_count']} 部")
+        for path, count in library["paths"].items():
+            print(f"  Path: {path}  ({count})")
+        print(f"  示例: {', '.join(library['samples'])}")
+        print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Jellyfin 剧集 ParentId 分析工具")
+    parser.add_argument("--json", metavar="PATH", help="将汇总结果导出为 JSON 文件")
+    parser.add_argument("--page-size", type=int, default=PAGE_SIZE)
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("Jellyfin 剧集 ParentId 分析工具")
+    print("=" * 60)
+    print("\n扫描全部剧集，相同媒体库的剧集会有相同的 ParentId。\n")
+
+    try:
+        items = scan_series(args.page_size, args.workers)
     except Exception as e:
-        print(f"  错误: {e}\n")
-
-print("=" * 60)
-print("\n使用说明：")
-print("1. 番剧的 ParentId 应该相同 → 填入 LIBRARY_ANIME")
-print("2. 电视剧的 ParentId 应该相同 → 填入 LIBRARY_TV")
-print("3. 将这些 ID 配置到 weekly_rank_v2.py 中即可")
-print("=" * 60)
+        print(f"  错误: {e}")
+        return
+
+    libraries = summarize(items)
+    print()
+    print_summary(libraries)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(libraries, f, ensure_ascii=False, indent=2)
+        print(f"已导出: {args.json}\n")
+
+    print("=" * 60)
+    print("\n使用说明：")
+    print("1. 番剧所在分组的 ParentId → 填入 LIBRARY_ANIME")
+    print("2. 电视剧所在分组的 ParentId → 填入 LIBRARY_TV")
+    print("3. 也可以不填，weekly_rank_v3.py 会按 Path 关键字自动分类")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
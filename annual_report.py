@@ -7,16 +7,28 @@ Annual Playback Report Generator
 这不是一份统计报表，
 而是一段被系统温柔整理过的记忆。
 
+个人年度报告：python annual_report.py --users
+一次扫描全年汇总数据，为每位用户生成自己的年度报告。
+
 GitHub: https://github.com/zzstar101/jellyfin-playback-report
 """
 
-import sqlite3
-import requests
+import re
+import json
+import argparse
 import os
-from datetime import datetime, timedelta
-from PIL import Image, ImageDraw, ImageFont
-from io import BytesIO
+from datetime import datetime, timedelta, timezone
+from itertools import groupby
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import report_cache
+import report_common
+import poster_output
+from poster_layout import round_corners
+from report_common import (
+    search_jellyfin_item, resolve_item, merge_key, fetch_jellyfin_poster_bytes, open_image, get_user_name,
+)
 
 # =========================
 # 🔧 配置区（请修改为你的配置）
@@ -28,10 +40,21 @@ REPORT_YEAR = 2025
 # 数据库路径
 DB_PATH = "./cache/playback_reporting.db"
 
+# 本地汇总缓存（与周榜共用）
+CACHE_DB_PATH = "./cache/report_cache.db"
+
 # Jellyfin 服务器
 JELLYFIN_URL = "https://your-jellyfin-server.com"
 JELLYFIN_API_KEY = "YOUR_JELLYFIN_API_KEY"
 
+# 时区（相对 UTC 的小时数），以及播放数据库中 DateCreated 所在时区（None 表示相同）
+UTC_OFFSET_HOURS = 8
+SOURCE_UTC_OFFSET_HOURS = None
+
+# 多台 Jellyfin 服务器（可选），留空时只使用上面的单服务器配置
+# 每项包含 name / db_path / cache_db_path / jellyfin_url / jellyfin_api_key
+SERVERS = []
+
 # 站点名称
 SITE_NAME = "YOUR_SITE_NAME"
 
@@ -43,19 +66,141 @@ OUTPUT_DIR = "./posters"
 # Linux: "/usr/share/fonts/truetype/wqy/wqy-microhei.ttc"
 FONT_DIR = "C:/Windows/Fonts/"
 
+# 并行绘制进程数（1 为单进程顺序绘制）
+RENDER_WORKERS = os.cpu_count() or 1
+
+# 观看会话间隔（分钟）：同一用户两次播放相隔不超过该值时算作同一次观看
+SESSION_GAP_MINUTES = 30
+
 # =========================
 # 数据查询函数
 # =========================
 
-def query(sql, params=()):
-    """执行 SQL 查询"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cur = conn.cursor()
-    cur.execute(sql, params)
-    rows = cur.fetchall()
-    conn.close()
-    return rows
+def get_servers():
+    """服务器列表；未配置 SERVERS 时返回单服务器配置"""
+    if SERVERS:
+        return SERVERS
+    return [{
+        "name": "default",
+        "db_path": DB_PATH,
+        "cache_db_path": CACHE_DB_PATH,
+        "jellyfin_url": JELLYFIN_URL,
+        "jellyfin_api_key": JELLYFIN_API_KEY,
+    }]
+
+def get_server(name):
+    """按名称取服务器配置（结果中只保存服务器名，需要配置时再查找）"""
+    servers = get_servers()
+    return next((server for server in servers if server["name"] == name), servers[0])
+
+def query(sql, params=(), cache_db_path=None):
+    """查询本地汇总缓存（连接与周榜共用 report_common 的复用连接）"""
+    return report_common.query(sql, params, cache_db_path or CACHE_DB_PATH)
+
+def available_servers():
+    """汇总缓存已存在的服务器"""
+    return [server for server in get_servers() if os.path.exists(server["cache_db_path"])]
+
+def query_all(sql, params=()):
+    """在每台服务器的汇总缓存上并发执行同一查询，返回 [(server, rows)]"""
+    servers = available_servers()
+    if len(servers) <= 1:
+        return [(server, query(sql, params, server["cache_db_path"])) for server in servers]
+    with ThreadPoolExecutor(max_workers=len(servers)) as pool:
+        return list(zip(servers, pool.map(lambda s: query(sql, params, s["cache_db_path"]), servers)))
+
+def item_key(name, item_type, server, resolve=True):
+    """
+    作品的合并键（与周榜相同的 merge_key）：
+    resolve 时按 Jellyfin 中的 Tmdb / Imdb / Tvdb 编号，否则（单服务器）只按名称
+    """
+    kind = "Movie" if item_type == "Movie" else "Series"
+    return merge_key(kind, name, resolve_item(name, kind, server) if resolve else {})
+
+def merge_items(results, value):
+    """
+    按作品合并多台服务器的查询结果（行包含 ShowName / ItemType）并对 value 求和
+    多服务器时同一作品按编号合并，名称不同（如不同语言的元数据）也能合并
+    返回 [(合计, 名称, 类型, 贡献最多的服务器)]，名称与类型取贡献最多的那台
+    """
+    pairs = [(server, row) for server, rows in results for row in rows]
+    resolve = len(results) > 1
+    
+    def key_of(pair):
+        server, row = pair
+        return item_key(row["ShowName"] or "未知", row["ItemType"], server, resolve)
+    
+    if resolve:
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            keys = list(pool.map(key_of, pairs))
+    else:
+        keys = [key_of(pair) for pair in pairs]
+    
+    totals = defaultdict(int)
+    best = {}
+    for (server, row), k in zip(pairs, keys):
+        v = row[value] or 0
+        totals[k] += v
+        if k not in best or v > best[k][0]:
+            best[k] = (v, row["ShowName"] or "未知", row["ItemType"], server)
+    return [(totals[k], *best[k][1:]) for k in totals]
+
+def merge_sum(results, key, value):
+    """
+    按 key 合并多台服务器的查询结果并对 value 求和（用于日期、客户端等非作品字段）
+    返回 {key: (合计, 贡献最多的服务器)}
+    """
+    totals = defaultdict(int)
+    best = {}
+    for server, rows in results:
+        for row in rows:
+            k = row[key]
+            v = row[value] or 0
+            totals[k] += v
+            if k not in best or v > best[k][0]:
+                best[k] = (v, server)
+    return {k: (totals[k], best[k][1]) for k in totals}
+
+def sum_column(results, column):
+    """对多台服务器的单行查询结果求和"""
+    return sum((rows[0][column] or 0) for _, rows in results if rows)
+
+def year_epochs(year):
+    """全年对应的 UTC Epoch 区间 [起, 止)"""
+    utc_offset = int(UTC_OFFSET_HOURS * 3600)
+    return (report_cache.day_epoch(f"{year}-01-01", utc_offset),
+            report_cache.day_epoch(f"{year + 1}-01-01", utc_offset))
+
+def iter_year_sessions(year, server):
+    """流式产出某台服务器全年的观看会话（按 UserId、开始时间排序）"""
+    return report_cache.iter_sessions(
+        server["cache_db_path"], *year_epochs(year), int(SESSION_GAP_MINUTES * 60)
+    )
+
+def session_facts(stats, with_name=True):
+    """会话统计转为补充数据文字"""
+    if not stats:
+        return []
+    facts = []
+    longest = stats["longest"]
+    start = datetime.fromtimestamp(longest["Start"], timezone(timedelta(hours=UTC_OFFSET_HOURS)))
+    who = f"{longest['Name']} " if with_name else ""
+    facts.append(f"最长一次连看：{who}{start:%Y-%m-%d}（{sec_to_hm(longest['Duration'])}）")
+    streak = stats["streak"]
+    if streak and streak["Streak"] > 1:
+        who = f"{streak['Name']} " if with_name else ""
+        facts.append(f"一口气追剧：{who}《{streak['StreakName']}》连续 {streak['Streak']} 集")
+    if stats["avg_episodes"]:
+        facts.append(f"共 {stats['count']} 次观看，追剧时平均每次 {stats['avg_episodes']:.1f} 集")
+    return facts
+
+def poster_bytes(name, item_type, server):
+    """
+    作品封面的原始字节（经磁盘图片缓存），找不到时返回 None
+    报告数据中只保存字节，由绘制进程自行解码，避免把解码后的图片传入进程池
+    """
+    item_id = search_jellyfin_item(name, item_type, server)
+    return fetch_jellyfin_poster_bytes(item_id, server) if item_id else None
 
 def sec_to_hm(sec: int) -> str:
     """秒数转 Xh Xm 格式"""
@@ -67,51 +212,6 @@ def sec_to_hm(sec: int) -> str:
         return f"{h}h {m}m"
     return f"{m}m"
 
-def extract_name(item_name: str) -> str:
-    """从 Episode 名称提取剧名"""
-    if " - " in item_name:
-        return item_name.split(" - ")[0].strip()
-    return item_name.strip()
-
-# =========================
-# Jellyfin API
-# =========================
-
-def search_jellyfin_item(name, item_type="Series"):
-    """搜索 Jellyfin 媒体项"""
-    try:
-        url = f"{JELLYFIN_URL}/Items"
-        params = {
-            "searchTerm": name,
-            "IncludeItemTypes": item_type,
-            "Recursive": "true",
-            "Limit": 1
-        }
-        headers = {"X-Emby-Token": JELLYFIN_API_KEY}
-        r = requests.get(url, params=params, headers=headers, timeout=10)
-        if r.status_code == 200:
-            data = r.json()
-            items = data.get("Items", [])
-            if items:
-                return items[0].get("Id")
-    except:
-        pass
-    return None
-
-def get_poster(item_id):
-    """获取封面图片"""
-    if not item_id:
-        return None
-    url = f"{JELLYFIN_URL}/Items/{item_id}/Images/Primary"
-    headers = {"X-Emby-Token": JELLYFIN_API_KEY}
-    try:
-        r = requests.get(url, headers=headers, timeout=10)
-        if r.status_code == 200:
-            return Image.open(BytesIO(r.content))
-    except:
-        pass
-    return None
-
 # =========================
 # 数据统计
 # =========================
@@ -122,59 +222,53 @@ def get_annual_data(year):
     print("   注：不区分电影/电视剧/番剧，统一按播放时长排序")
     
     start_date = f"{year}-01-01"
-    end_date = f"{year}-12-31 23:59:59"
+    end_date = f"{year}-12-31"
+    
+    servers = get_servers()
     
     # 获取实际统计周期
-    date_range_row = query("""
-        SELECT MIN(DateCreated) AS FirstDate, MAX(DateCreated) AS LastDate
-        FROM PlaybackActivity
-        WHERE DateCreated >= ? AND DateCreated <= ?
+    date_range_rows = query_all("""
+        SELECT MIN(Day) AS FirstDate, MAX(Day) AS LastDate
+        FROM HourlyRollup
+        WHERE Day >= ? AND Day <= ?
     """, (start_date, end_date))
+    first_dates = [rows[0]["FirstDate"] for _, rows in date_range_rows if rows and rows[0]["FirstDate"]]
+    last_dates = [rows[0]["LastDate"] for _, rows in date_range_rows if rows and rows[0]["LastDate"]]
     
-    actual_start = date_range_row[0]["FirstDate"][:10] if date_range_row and date_range_row[0]["FirstDate"] else start_date[:10]
-    actual_end = date_range_row[0]["LastDate"][:10] if date_range_row and date_range_row[0]["LastDate"] else end_date[:10]
+    actual_start = min(first_dates)[:10] if first_dates else start_date[:10]
+    actual_end = max(last_dates)[:10] if last_dates else end_date[:10]
     
     stats_period = f"{actual_start} 至 {actual_end}"
     
-    # 每月 Top 3
+    # 每月 Top 3（多服务器时每台多取一些候选，合并后再取前 3）
     monthly_top3 = {}
+    candidates = 3 if len(servers) == 1 else 10
     
     for month in range(1, 13):
         month_start = f"{year}-{month:02d}-01"
         if month == 12:
-            month_end = f"{year}-12-31 23:59:59"
+            month_end = f"{year + 1}-01-01"
         else:
             month_end = f"{year}-{month+1:02d}-01"
         
-        rows = query("""
+        results = query_all("""
             SELECT
-                CASE 
-                    WHEN ItemType = 'Episode' THEN 
-                        SUBSTR(ItemName, 1, INSTR(ItemName || ' - ', ' - ') - 1)
-                    ELSE ItemName 
-                END AS ShowName,
+                MAX(DisplayName) AS ShowName,
                 ItemType,
                 SUM(PlayDuration) AS TotalDuration,
-                COUNT(*) AS PlayCount
-            FROM PlaybackActivity
-            WHERE DateCreated >= ? AND DateCreated < ?
-            GROUP BY ShowName
+                SUM(PlayCount) AS PlayCount
+            FROM DailyRollup
+            WHERE Day >= ? AND Day < ?
+            GROUP BY SeriesName
             ORDER BY TotalDuration DESC
-            LIMIT 3
-        """, (month_start, month_end))
+            LIMIT ?
+        """, (month_start, month_end, candidates))
+        
+        top3 = sorted(merge_items(results, "TotalDuration"), key=lambda item: item[0], reverse=True)[:3]
         
         month_data = []
-        for row in rows:
-            name = row["ShowName"] or "未知"
-            item_type = row["ItemType"]
-            duration = row["TotalDuration"] or 0
-            
-            if item_type == "Movie":
-                item_id = search_jellyfin_item(name, "Movie")
-            else:
-                item_id = search_jellyfin_item(name, "Series")
-            
-            poster = get_poster(item_id)
+        for duration, name, item_type, server in top3:
+            poster = poster_bytes(name, "Movie" if item_type == "Movie" else "Series", server)
             
             if poster:
                 month_data.append({
@@ -193,90 +287,64 @@ def get_annual_data(year):
     # 年度总结
     print("\n📈 统计年度总结...")
     
-    total_duration_row = query("""
-        SELECT SUM(PlayDuration) AS Total FROM PlaybackActivity
-        WHERE DateCreated >= ? AND DateCreated <= ?
-    """, (start_date, end_date))
-    total_duration = total_duration_row[0]["Total"] or 0
-    
-    total_items_row = query("""
-        SELECT COUNT(DISTINCT 
-            CASE 
-                WHEN ItemType = 'Episode' THEN 
-                    SUBSTR(ItemName, 1, INSTR(ItemName || ' - ', ' - ') - 1)
-                ELSE ItemName 
-            END
-        ) AS Total FROM PlaybackActivity
-        WHERE DateCreated >= ? AND DateCreated <= ?
-    """, (start_date, end_date))
-    total_items = total_items_row[0]["Total"] or 0
+    total_duration = sum_column(query_all("""
+        SELECT SUM(PlayDuration) AS Total FROM HourlyRollup
+        WHERE Day >= ? AND Day <= ?
+    """, (start_date, end_date)), "Total")
     
-    top_show_row = query("""
+    # 所有作品的年度时长（同一作品跨服务器按编号合并）
+    shows = merge_items(query_all("""
         SELECT
-            CASE 
-                WHEN ItemType = 'Episode' THEN 
-                    SUBSTR(ItemName, 1, INSTR(ItemName || ' - ', ' - ') - 1)
-                ELSE ItemName 
-            END AS ShowName,
+            MAX(DisplayName) AS ShowName,
+            MAX(ItemType) AS ItemType,
             SUM(PlayDuration) AS TotalDuration
-        FROM PlaybackActivity
-        WHERE DateCreated >= ? AND DateCreated <= ?
-        GROUP BY ShowName
-        ORDER BY TotalDuration DESC
-        LIMIT 1
-    """, (start_date, end_date))
+        FROM DailyRollup
+        WHERE Day >= ? AND Day <= ?
+        GROUP BY SeriesName
+    """, (start_date, end_date)), "TotalDuration")
+    total_items = len(shows)
     
     top_show = None
-    if top_show_row:
+    if shows:
+        duration, name, _, _ = max(shows, key=lambda item: item[0])
         top_show = {
-            "name": top_show_row[0]["ShowName"],
-            "duration": top_show_row[0]["TotalDuration"]
+            "name": name,
+            "duration": duration
         }
     
-    top_client_row = query("""
-        SELECT ClientName, COUNT(*) AS Cnt
-        FROM PlaybackActivity
-        WHERE DateCreated >= ? AND DateCreated <= ?
+    clients = merge_sum(query_all("""
+        SELECT ClientName, SUM(PlayCount) AS Cnt
+        FROM DailyRollup
+        WHERE Day >= ? AND Day <= ?
         GROUP BY ClientName
-        ORDER BY Cnt DESC
-        LIMIT 1
-    """, (start_date, end_date))
+    """, (start_date, end_date)), "ClientName", "Cnt")
     
     top_client = None
-    if top_client_row:
+    if clients:
+        name = max(clients, key=lambda k: clients[k][0])
         top_client = {
-            "name": top_client_row[0]["ClientName"] or "未知",
-            "count": top_client_row[0]["Cnt"]
+            "name": name or "未知",
+            "count": clients[name][0]
         }
     
-    top_user_row = query("""
+    # 用户按名称跨服务器合并；单服务器时只需解析时长最多的用户
+    users = defaultdict(int)
+    for server, rows in query_all("""
         SELECT UserId, SUM(PlayDuration) AS TotalDuration
-        FROM PlaybackActivity
-        WHERE DateCreated >= ? AND DateCreated <= ?
+        FROM DailyRollup
+        WHERE Day >= ? AND Day <= ? AND UserId != ''
         GROUP BY UserId
         ORDER BY TotalDuration DESC
-        LIMIT 1
-    """, (start_date, end_date))
+    """, (start_date, end_date)):
+        for row in (rows if len(servers) > 1 else rows[:1]):
+            users[get_user_name(row["UserId"], server)] += row["TotalDuration"] or 0
     
     top_user = None
-    if top_user_row and top_user_row[0]["UserId"]:
-        user_id = top_user_row[0]["UserId"]
-        user_duration = top_user_row[0]["TotalDuration"]
-        
-        try:
-            url = f"{JELLYFIN_URL}/Users/{user_id}"
-            headers = {"X-Emby-Token": JELLYFIN_API_KEY}
-            r = requests.get(url, headers=headers, timeout=10)
-            if r.status_code == 200:
-                user_name = r.json().get("Name", "未知用户")
-            else:
-                user_name = "未知用户"
-        except:
-            user_name = "未知用户"
-        
+    if users:
+        name = max(users, key=users.get)
         top_user = {
-            "name": user_name,
-            "duration": user_duration
+            "name": name,
+            "duration": users[name]
         }
     
     annual_summary = {
@@ -292,221 +360,411 @@ def get_annual_data(year):
     print("\n📋 统计补充数据...")
     extra_facts = []
     
-    night_rows = query("""
+    night_rows = query_all("""
         SELECT 
-            SUM(CASE WHEN CAST(strftime('%H', DateCreated) AS INTEGER) >= 22 
-                     OR CAST(strftime('%H', DateCreated) AS INTEGER) < 4 
+            SUM(CASE WHEN Hour >= 22 OR Hour < 4 
                 THEN PlayDuration ELSE 0 END) AS NightDuration,
             SUM(PlayDuration) AS TotalDuration
-        FROM PlaybackActivity
-        WHERE DateCreated >= ? AND DateCreated <= ?
+        FROM HourlyRollup
+        WHERE Day >= ? AND Day <= ?
     """, (start_date, end_date))
     
-    if night_rows and night_rows[0]["TotalDuration"]:
-        night_dur = night_rows[0]["NightDuration"] or 0
-        total_dur = night_rows[0]["TotalDuration"]
+    total_dur = sum_column(night_rows, "TotalDuration")
+    if total_dur:
+        night_dur = sum_column(night_rows, "NightDuration")
         night_percent = int(night_dur / total_dur * 100)
         if night_percent > 0:
             extra_facts.append(f"22:00–04:00 时段播放占比：{night_percent}%")
     
-    max_day_row = query("""
-        SELECT DATE(DateCreated) AS Day, SUM(PlayDuration) AS DayTotal
-        FROM PlaybackActivity
-        WHERE DateCreated >= ? AND DateCreated <= ?
-        GROUP BY DATE(DateCreated)
-        ORDER BY DayTotal DESC
-        LIMIT 1
+    days = merge_sum(query_all("""
+        SELECT Day, SUM(PlayDuration) AS DayTotal
+        FROM HourlyRollup
+        WHERE Day >= ? AND Day <= ?
+        GROUP BY Day
+    """, (start_date, end_date)), "Day", "DayTotal")
+    
+    if days:
+        max_day = max(days, key=lambda k: days[k][0])
+        max_day_dur = days[max_day][0]
+        if max_day_dur:
+            extra_facts.append(f"单日最长播放记录：{max_day}（{sec_to_hm(max_day_dur)}）")
+    
+    total_records_rows = query_all("""
+        SELECT SUM(PlayCount) AS Total FROM HourlyRollup
+        WHERE Day >= ? AND Day <= ?
     """, (start_date, end_date))
     
-    if max_day_row and max_day_row[0]["DayTotal"]:
-        max_day = max_day_row[0]["Day"]
-        max_day_dur = max_day_row[0]["DayTotal"]
-        extra_facts.append(f"单日最长播放记录：{max_day}（{sec_to_hm(max_day_dur)}）")
-    
-    total_records_row = query("""
-        SELECT COUNT(*) AS Total FROM PlaybackActivity
-        WHERE DateCreated >= ? AND DateCreated <= ?
-    """, (start_date, end_date))
-    
-    if total_records_row:
-        total_records = total_records_row[0]["Total"]
+    if any(rows for _, rows in total_records_rows):
+        total_records = sum_column(total_records_rows, "Total")
         extra_facts.append(f"年度播放记录总数：{total_records} 条")
     
+    # 观看会话：逐台服务器流式切分，只保留当前会话与汇总值（会话只记录服务器名）
+    def tagged_sessions():
+        for server in servers:
+            if os.path.exists(server["cache_db_path"]):
+                for session in iter_year_sessions(year, server):
+                    session["Server"] = server["name"]
+                    yield session
+    
+    sessions = report_cache.summarize_sessions(tagged_sessions())
+    if sessions:
+        for key in ("longest", "streak"):
+            if sessions[key]:
+                sessions[key]["Name"] = get_user_name(sessions[key]["UserId"], get_server(sessions[key]["Server"]))
+        extra_facts.extend(session_facts(sessions))
+    
     return monthly_top3, annual_summary, extra_facts
 
-# =========================
-# 海报绘制
-# =========================
+def get_heatmap(year):
+    """
+    年度 星期 × 小时 观看时长矩阵（7×24，单位秒，周一为第 0 行）
+    直接对小时汇总表的 (Weekday, Hour) 分桶求和（按 Epoch 索引做区间扫描），多服务器时逐格相加
+    """
+    grid = [[0] * 24 for _ in range(7)]
+    for _, rows in query_all("""
+        SELECT Weekday, Hour, SUM(PlayDuration) AS Duration
+        FROM HourlyRollup
+        WHERE Epoch >= ? AND Epoch < ?
+        GROUP BY Weekday, Hour
+    """, year_epochs(year)):
+        for r in rows:
+            grid[r["Weekday"]][r["Hour"]] += r["Duration"] or 0
+    return grid
 
-def add_rounded_corners(img, radius):
-    """为图片添加圆角"""
-    mask = Image.new('L', img.size, 0)
-    draw = ImageDraw.Draw(mask)
-    draw.rounded_rectangle([(0, 0), img.size], radius=radius, fill=255)
-    output = Image.new('RGBA', img.size, (0, 0, 0, 0))
-    output.paste(img.convert('RGBA'), mask=mask)
-    return output
-
-def draw_annual_report(year, monthly_top3, annual_summary, extra_facts):
-    """绘制年度报告海报"""
-    print("\n🎨 正在绘制海报...")
-    
-    W = 1080
-    margin = 60
-    
-    month_label_w = 65
-    poster_w = 170
-    poster_h = int(poster_w * 1.4)
-    poster_gap = 25
-    month_row_h = poster_h + 55
-    month_gap = 30
+def export_heatmap(heatmap, path):
+    """将热力图矩阵导出为 JSON"""
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"rows": WEEKDAY_NAMES, "hours": list(range(24)), "seconds": heatmap}, f, ensure_ascii=False)
+    return path
+
+def user_annual_reports(year, server, multi=False):
+    """统计单台服务器上所有用户的年度数据；multi 时用户名附带 @服务器名"""
+    start_date = f"{year}-01-01"
+    end_date = f"{year}-12-31"
     
-    header_h = 180
-    months_h = 12 * month_row_h + 11 * month_gap
-    summary_h = 400
-    extra_h = 60 + len(extra_facts) * 35
-    footer_h = 120
+    reports = []
     
-    H = header_h + months_h + summary_h + extra_h + footer_h + margin * 2
+    rows = query("""
+        SELECT
+            UserId,
+            CAST(SUBSTR(Day, 6, 2) AS INTEGER) AS Month,
+            MAX(DisplayName) AS ShowName,
+            ItemType,
+            ClientName,
+            MIN(Day) AS FirstDay,
+            MAX(Day) AS LastDay,
+            SUM(PlayDuration) AS TotalDuration,
+            SUM(PlayCount) AS PlayCount
+        FROM DailyRollup
+        WHERE Day >= ? AND Day <= ? AND UserId != ''
+        GROUP BY UserId, Month, SeriesName, ItemType, ClientName
+    """, (start_date, end_date), server["cache_db_path"])
     
-    img = Image.new('RGBA', (W, H))
-    draw = ImageDraw.Draw(img)
+    night_rows = query("""
+        SELECT
+            UserId,
+            SUM(CASE WHEN Hour >= 22 OR Hour < 4 
+                THEN PlayDuration ELSE 0 END) AS NightDuration,
+            SUM(PlayDuration) AS TotalDuration
+        FROM HourlyRollup
+        WHERE Day >= ? AND Day <= ? AND UserId != ''
+        GROUP BY UserId
+    """, (start_date, end_date), server["cache_db_path"])
+    nights = {row["UserId"]: row for row in night_rows}
+    
+    # 会话按 UserId 顺序产出，逐个用户汇总
+    sessions = {
+        user_id: report_cache.summarize_sessions(user_sessions)
+        for user_id, user_sessions in groupby(iter_year_sessions(year, server),
+                                              key=lambda s: s["UserId"])
+    }
     
-    # 深色渐变背景
-    for y in range(H):
-        t = y / H
+    users = defaultdict(lambda: {
+        "months": defaultdict(lambda: defaultdict(int)),
+        "shows": defaultdict(int),
+        "types": {},
+        "clients": defaultdict(int),
+        "duration": 0,
+        "plays": 0,
+        "first": end_date,
+        "last": start_date,
+    })
+    for row in rows:
+        user = users[row["UserId"]]
+        name = row["ShowName"] or "未知"
+        duration = row["TotalDuration"] or 0
+        user["months"][row["Month"]][name] += duration
+        user["shows"][name] += duration
+        user["types"][name] = row["ItemType"]
+        user["clients"][row["ClientName"] or "未知"] += row["PlayCount"]
+        user["duration"] += duration
+        user["plays"] += row["PlayCount"]
+        user["first"] = min(user["first"], row["FirstDay"])
+        user["last"] = max(user["last"], row["LastDay"])
+    
+    for user_id, user in users.items():
+        user_name = get_user_name(user_id, server)
+        if multi:
+            user_name = f"{user_name}@{server['name']}"
+        
+        monthly_top3 = {}
+        for month in range(1, 13):
+            shows = user["months"].get(month, {})
+            month_data = []
+            for name, duration in sorted(shows.items(), key=lambda kv: kv[1], reverse=True)[:3]:
+                item_type = "Movie" if user["types"][name] == "Movie" else "Series"
+                poster = poster_bytes(name, item_type, server)
+                if poster:
+                    month_data.append({
+                        "name": name,
+                        "duration": duration,
+                        "poster": poster
+                    })
+            monthly_top3[month] = month_data
+        
+        top_show = max(user["shows"], key=user["shows"].get)
+        top_client = max(user["clients"], key=user["clients"].get)
+        annual_summary = {
+            "stats_period": f"{user['first']} 至 {user['last']}",
+            "total_duration": user["duration"],
+            "total_items": len(user["shows"]),
+            "top_show": {"name": top_show, "duration": user["shows"][top_show]},
+            "top_user": None,
+            "top_client": {"name": top_client, "count": user["clients"][top_client]},
+        }
+        
+        extra_facts = [f"年度最爱：{top_show}（{sec_to_hm(user['shows'][top_show])}）"]
+        night = nights.get(user_id)
+        if night and night["TotalDuration"]:
+            night_percent = int((night["NightDuration"] or 0) / night["TotalDuration"] * 100)
+            extra_facts.append(f"22:00–04:00 时段播放占比：{night_percent}%")
+        extra_facts.append(f"年度播放记录总数：{user['plays']} 条")
+        extra_facts.extend(session_facts(sessions.get(user_id), with_name=False))
+        
+        reports.append({
+            "user_id": user_id,
+            "name": user_name,
+            "monthly_top3": monthly_top3,
+            "annual_summary": annual_summary,
+            "extra_facts": extra_facts,
+        })
+        print(f"  -> {user_name}: {sec_to_hm(user['duration'])}，{len(user['shows'])} 部作品")
+    return reports
+
+def get_user_annual_data(year):
+    """
+    统计所有用户的年度数据（个人年度报告）
+    每台服务器只对全年日汇总表做一次按 (用户, 月份, 作品, 客户端) 分组的扫描，
+    夜间占比来自一次按用户分组的小时汇总查询，随后在内存中按用户拆分；
+    剧集解析与封面在所有用户间共享缓存；多台服务器时并发统计
+    返回 [{"user_id", "name", "monthly_top3", "annual_summary", "extra_facts"}]
+    """
+    print(f"\n📊 正在统计 {year} 年个人播放数据...")
+    
+    servers = available_servers()
+    multi = len(get_servers()) > 1
+    if len(servers) > 1:
+        with ThreadPoolExecutor(max_workers=len(servers)) as pool:
+            chunks = list(pool.map(lambda server: user_annual_reports(year, server, multi), servers))
+    else:
+        chunks = [user_annual_reports(year, server, multi) for server in servers]
+    
+    reports = [report for chunk in chunks for report in chunk]
+    reports.sort(key=lambda r: r["annual_summary"]["total_duration"], reverse=True)
+    return reports
+
+# =========================
+# 海报绘制
+# =========================
+
+# 画布与版式参数
+W = 1080
+MARGIN = 60
+
+MONTH_LABEL_W = 65
+POSTER_W = 170
+POSTER_H = int(POSTER_W * 1.4)
+POSTER_GAP = 25
+MONTH_ROW_H = POSTER_H + 55
+MONTH_GAP = 30
+
+HEADER_H = 180
+MONTHS_H = 12 * MONTH_ROW_H + 11 * MONTH_GAP
+SUMMARY_H = 400
+HEATMAP_H = 280
+FOOTER_H = 120
+
+# 热力图格子
+HEAT_LABEL_W = 50
+HEAT_CELL_W = (W - MARGIN * 2 - HEAT_LABEL_W) // 24
+HEAT_CELL_H = 22
+HEAT_GAP = 4
+
+# 颜色
+TEXT_WHITE = (255, 255, 255)
+TEXT_GRAY = (140, 140, 155)
+TEXT_LIGHT = (190, 190, 200)
+ACCENT = (200, 170, 120)
+EMPTY_CARD = (40, 40, 55)
+MONTH_BG = (35, 35, 50)
+
+MONTH_NAMES = {
+    1: 'JAN', 2: 'FEB', 3: 'MAR', 4: 'APR',
+    5: 'MAY', 6: 'JUN', 7: 'JUL', 8: 'AUG',
+    9: 'SEP', 10: 'OCT', 11: 'NOV', 12: 'DEC'
+}
+
+WEEKDAY_NAMES = ["周一", "周二", "周三", "周四", "周五", "周六", "周日"]
+
+_font_cache = {}
+
+def load_font(name, size):
+    """加载字体（每个进程内只解析一次）"""
+    key = (name, size)
+    if key not in _font_cache:
+        from PIL import ImageFont
+        _font_cache[key] = ImageFont.truetype(FONT_DIR + name, size)
+    return _font_cache[key]
+
+def gradient_band(top, height, total_h):
+    """绘制整张海报深色渐变背景中 [top, top + height) 的一段"""
+    from PIL import Image, ImageDraw
+    band = Image.new('RGBA', (W, height))
+    draw = ImageDraw.Draw(band)
+    for y in range(height):
+        t = (top + y) / total_h
         r = int(18 + 8 * t)
         g = int(18 + 12 * t)
         b = int(35 + 18 * t)
         draw.line((0, y, W, y), fill=(r, g, b))
-    
-    # 字体
-    title_font = ImageFont.truetype(FONT_DIR + "msyhbd.ttc", 38)
-    subtitle_font = ImageFont.truetype(FONT_DIR + "msyh.ttc", 16)
-    year_font = ImageFont.truetype(FONT_DIR + "msyh.ttc", 14)
-    month_font = ImageFont.truetype(FONT_DIR + "msyhbd.ttc", 18)
-    month_en_font = ImageFont.truetype(FONT_DIR + "msyh.ttc", 11)
-    name_font = ImageFont.truetype(FONT_DIR + "msyh.ttc", 11)
-    dur_font = ImageFont.truetype(FONT_DIR + "msyh.ttc", 10)
-    rank_font = ImageFont.truetype(FONT_DIR + "msyh.ttc", 12)
-    summary_title_font = ImageFont.truetype(FONT_DIR + "msyhbd.ttc", 14)
-    summary_value_font = ImageFont.truetype(FONT_DIR + "msyhbd.ttc", 24)
-    summary_label_font = ImageFont.truetype(FONT_DIR + "msyh.ttc", 11)
-    fact_font = ImageFont.truetype(FONT_DIR + "msyh.ttc", 12)
-    brand_font = ImageFont.truetype(FONT_DIR + "msyh.ttc", 12)
-    
-    text_white = (255, 255, 255)
-    text_gray = (140, 140, 155)
-    text_light = (190, 190, 200)
-    accent = (200, 170, 120)
-    empty_card = (40, 40, 55)
-    month_bg = (35, 35, 50)
-    
-    month_names = {
-        1: 'JAN', 2: 'FEB', 3: 'MAR', 4: 'APR',
-        5: 'MAY', 6: 'JUN', 7: 'JUL', 8: 'AUG',
-        9: 'SEP', 10: 'OCT', 11: 'NOV', 12: 'DEC'
+    return band
+
+def annual_layout(extra_facts, with_heatmap=False):
+    """计算整张海报的高度与各区块纵坐标"""
+    extra_h = 60 + len(extra_facts) * 35
+    heatmap_h = HEATMAP_H if with_heatmap else 0
+    H = HEADER_H + MONTHS_H + SUMMARY_H + extra_h + heatmap_h + FOOTER_H + MARGIN * 2
+    header_y = MARGIN
+    content_y = header_y + 150
+    summary_y = content_y + MONTHS_H + 50
+    footer_y = H - FOOTER_H
+    return {
+        "H": H,
+        "header_y": header_y,
+        "content_y": content_y,
+        "summary_y": summary_y,
+        "heatmap_y": footer_y - heatmap_h,
+        "footer_y": footer_y,
     }
+
+def render_month_tile(task):
+    """
+    绘制单月一行（月份标签 + 3 张海报）
+    task = (month, month_data, row_y, H)，返回 (row_y, tile)
+    tile 自带所在位置的背景渐变，可直接贴回画布
+    """
+    from PIL import Image, ImageDraw
     
-    # Header
-    header_y = margin
+    month, month_data, row_y, H = task
     
-    year_text = str(year)
-    bbox = year_font.getbbox(year_text)
-    year_w = bbox[2] - bbox[0]
-    draw.text(((W - year_w) // 2, header_y + 10), year_text, fill=text_gray, font=year_font)
+    img = gradient_band(row_y, MONTH_ROW_H, H)
+    draw = ImageDraw.Draw(img)
     
-    title = "年度观影报告"
-    bbox = title_font.getbbox(title)
-    title_w = bbox[2] - bbox[0]
-    draw.text(((W - title_w) // 2, header_y + 35), title, fill=text_white, font=title_font)
+    month_font = load_font("msyhbd.ttc", 18)
+    month_en_font = load_font("msyh.ttc", 11)
+    name_font = load_font("msyh.ttc", 11)
+    dur_font = load_font("msyh.ttc", 10)
+    rank_font = load_font("msyh.ttc", 12)
     
-    subtitle = "Annual Playback Report"
-    bbox = subtitle_font.getbbox(subtitle)
-    sub_w = bbox[2] - bbox[0]
-    draw.text(((W - sub_w) // 2, header_y + 85), subtitle, fill=text_gray, font=subtitle_font)
+    label_x = MARGIN
+    label_y = (POSTER_H - 45) // 2
     
-    line_y = header_y + 130
-    draw.line((margin + 150, line_y, W - margin - 150, line_y), fill=(50, 50, 65), width=1)
+    label_bg = Image.new('RGBA', (MONTH_LABEL_W, 45), (*MONTH_BG, 255))
+    label_bg = round_corners(label_bg, 8)
+    img.paste(label_bg, (label_x, label_y), label_bg)
     
-    # 月份模块
-    content_y = header_y + 150
+    month_text = f"{month}月"
+    draw.text((label_x + MONTH_LABEL_W // 2, label_y + 8), month_text,
+             fill=TEXT_WHITE, font=month_font, anchor="mt")
+    draw.text((label_x + MONTH_LABEL_W // 2, label_y + 30), MONTH_NAMES[month],
+             fill=TEXT_GRAY, font=month_en_font, anchor="mt")
     
-    for month in range(1, 13):
-        row_y = content_y + (month - 1) * (month_row_h + month_gap)
-        month_data = monthly_top3.get(month, [])
-        
-        label_x = margin
-        label_y = row_y + (poster_h - 45) // 2
-        
-        label_bg = Image.new('RGBA', (month_label_w, 45), (*month_bg, 255))
-        label_bg = add_rounded_corners(label_bg, 8)
-        img.paste(label_bg, (label_x, label_y), label_bg)
-        
-        month_text = f"{month}月"
-        draw.text((label_x + month_label_w // 2, label_y + 8), month_text,
-                 fill=text_white, font=month_font, anchor="mt")
-        draw.text((label_x + month_label_w // 2, label_y + 30), month_names[month],
-                 fill=text_gray, font=month_en_font, anchor="mt")
+    posters_x = MARGIN + MONTH_LABEL_W + 35
+    
+    for i in range(3):
+        card_x = posters_x + i * (POSTER_W + POSTER_GAP)
+        card_y = 0
         
-        posters_x = margin + month_label_w + 35
+        item = month_data[i] if i < len(month_data) else None
+        poster = open_image(item["poster"]) if item else None
         
-        for i in range(3):
-            card_x = posters_x + i * (poster_w + poster_gap)
-            card_y = row_y
+        if poster:
+            poster = poster.resize((POSTER_W, POSTER_H), Image.Resampling.LANCZOS)
+            poster = round_corners(poster, 10)
+            img.paste(poster, (card_x, card_y), poster)
+            
+            rank_text = f"#{i+1}"
+            draw.text((card_x + 8, card_y + 6), rank_text,
+                     fill=(255, 255, 255, 150), font=rank_font)
+            
+            dur_text = sec_to_hm(item["duration"])
+            bbox = dur_font.getbbox(dur_text)
+            dur_w = bbox[2] - bbox[0]
+            draw.text((card_x + POSTER_W - dur_w - 8, card_y + POSTER_H - 18),
+                     dur_text, fill=(255, 255, 255, 180), font=dur_font)
             
-            if i < len(month_data):
-                item = month_data[i]
-                
-                poster = item["poster"]
-                poster = poster.resize((poster_w, poster_h), Image.Resampling.LANCZOS)
-                poster = add_rounded_corners(poster, 10)
-                img.paste(poster, (card_x, card_y), poster)
-                
-                rank_text = f"#{i+1}"
-                draw.text((card_x + 8, card_y + 6), rank_text,
-                         fill=(255, 255, 255, 150), font=rank_font)
-                
-                dur_text = sec_to_hm(item["duration"])
-                bbox = dur_font.getbbox(dur_text)
-                dur_w = bbox[2] - bbox[0]
-                draw.text((card_x + poster_w - dur_w - 8, card_y + poster_h - 18),
-                         dur_text, fill=(255, 255, 255, 180), font=dur_font)
-                
-                name = item["name"]
-                if len(name) > 12:
-                    name = name[:11] + "..."
-                bbox = name_font.getbbox(name)
-                name_w = bbox[2] - bbox[0]
-                draw.text((card_x + (poster_w - name_w) // 2, card_y + poster_h + 8),
-                         name, fill=text_light, font=name_font)
-            else:
-                empty = Image.new('RGBA', (poster_w, poster_h), (*empty_card, 255))
-                empty = add_rounded_corners(empty, 10)
-                img.paste(empty, (card_x, card_y), empty)
-                
-                if i == len(month_data):
-                    hint = "本月暂无播放记录" if len(month_data) == 0 else ""
-                    if hint:
-                        bbox = name_font.getbbox(hint)
-                        hint_w = bbox[2] - bbox[0]
-                        draw.text((card_x + (poster_w - hint_w) // 2, card_y + poster_h // 2 - 6),
-                                 hint, fill=text_gray, font=name_font)
-    
-    # 年度汇总
-    summary_y = content_y + months_h + 50
-    
-    draw.line((margin + 150, summary_y, W - margin - 150, summary_y), fill=(50, 50, 65), width=1)
+            name = item["name"]
+            if len(name) > 12:
+                name = name[:11] + "..."
+            bbox = name_font.getbbox(name)
+            name_w = bbox[2] - bbox[0]
+            draw.text((card_x + (POSTER_W - name_w) // 2, card_y + POSTER_H + 8),
+                     name, fill=TEXT_LIGHT, font=name_font)
+        else:
+            empty = Image.new('RGBA', (POSTER_W, POSTER_H), (*EMPTY_CARD, 255))
+            empty = round_corners(empty, 10)
+            img.paste(empty, (card_x, card_y), empty)
+            
+            if i == len(month_data):
+                hint = "本月暂无播放记录" if len(month_data) == 0 else ""
+                if hint:
+                    bbox = name_font.getbbox(hint)
+                    hint_w = bbox[2] - bbox[0]
+                    draw.text((card_x + (POSTER_W - hint_w) // 2, card_y + POSTER_H // 2 - 6),
+                             hint, fill=TEXT_GRAY, font=name_font)
+    
+    return row_y, img
+
+def render_summary_tile(task):
+    """
+    绘制年度汇总卡片与补充数据
+    task = (annual_summary, extra_facts, top, height, H)，返回 (top, tile)
+    """
+    from PIL import Image, ImageDraw
+    
+    annual_summary, extra_facts, top, height, H = task
+    
+    img = gradient_band(top, height, H)
+    draw = ImageDraw.Draw(img)
+    
+    summary_title_font = load_font("msyhbd.ttc", 14)
+    summary_value_font = load_font("msyhbd.ttc", 24)
+    summary_label_font = load_font("msyh.ttc", 11)
+    fact_font = load_font("msyh.ttc", 12)
+    
+    summary_y = 0
+    
+    draw.line((MARGIN + 150, summary_y, W - MARGIN - 150, summary_y), fill=(50, 50, 65), width=1)
     
     summary_title = "年度汇总"
     bbox = summary_title_font.getbbox(summary_title)
     st_w = bbox[2] - bbox[0]
-    draw.text(((W - st_w) // 2, summary_y + 20), summary_title, fill=accent, font=summary_title_font)
+    draw.text(((W - st_w) // 2, summary_y + 20), summary_title, fill=ACCENT, font=summary_title_font)
     
     period_text = f"统计周期：{annual_summary['stats_period']}"
     bbox = summary_label_font.getbbox(period_text)
     pt_w = bbox[2] - bbox[0]
-    draw.text(((W - pt_w) // 2, summary_y + 48), period_text, fill=text_gray, font=summary_label_font)
+    draw.text(((W - pt_w) // 2, summary_y + 48), period_text, fill=TEXT_GRAY, font=summary_label_font)
     
     card_y = summary_y + 80
     card_w = 200
@@ -525,16 +783,16 @@ def draw_annual_report(year, monthly_top3, annual_summary, extra_facts):
         cx = row1_x + i * (card_w + card_gap)
         
         card_bg = Image.new('RGBA', (card_w, card_h), (35, 35, 50, 255))
-        card_bg = add_rounded_corners(card_bg, 10)
+        card_bg = round_corners(card_bg, 10)
         img.paste(card_bg, (cx, card_y), card_bg)
         
         bbox = summary_label_font.getbbox(label)
         lw = bbox[2] - bbox[0]
-        draw.text((cx + (card_w - lw) // 2, card_y + 12), label, fill=text_gray, font=summary_label_font)
+        draw.text((cx + (card_w - lw) // 2, card_y + 12), label, fill=TEXT_GRAY, font=summary_label_font)
         
         bbox = summary_value_font.getbbox(value)
         vw = bbox[2] - bbox[0]
-        draw.text((cx + (card_w - vw) // 2, card_y + 38), value, fill=accent, font=summary_value_font)
+        draw.text((cx + (card_w - vw) // 2, card_y + 38), value, fill=ACCENT, font=summary_value_font)
     
     card_y2 = card_y + card_h + 15
     cards_row2 = []
@@ -558,54 +816,167 @@ def draw_annual_report(year, monthly_top3, annual_summary, extra_facts):
             sub = item[2] if len(item) > 2 else ""
             
             card_bg = Image.new('RGBA', (card_w, card_h), (35, 35, 50, 255))
-            card_bg = add_rounded_corners(card_bg, 10)
+            card_bg = round_corners(card_bg, 10)
             img.paste(card_bg, (cx, card_y2), card_bg)
             
             bbox = summary_label_font.getbbox(label)
             lw = bbox[2] - bbox[0]
-            draw.text((cx + (card_w - lw) // 2, card_y2 + 10), label, fill=text_gray, font=summary_label_font)
+            draw.text((cx + (card_w - lw) // 2, card_y2 + 10), label, fill=TEXT_GRAY, font=summary_label_font)
             
             if len(value) > 12:
                 value = value[:11] + "..."
             bbox = summary_value_font.getbbox(value)
             vw = bbox[2] - bbox[0]
-            draw.text((cx + (card_w - vw) // 2, card_y2 + 32), value, fill=accent, font=summary_value_font)
+            draw.text((cx + (card_w - vw) // 2, card_y2 + 32), value, fill=ACCENT, font=summary_value_font)
             
             if sub:
                 bbox = summary_label_font.getbbox(sub)
                 sw = bbox[2] - bbox[0]
-                draw.text((cx + (card_w - sw) // 2, card_y2 + 62), sub, fill=text_gray, font=summary_label_font)
+                draw.text((cx + (card_w - sw) // 2, card_y2 + 62), sub, fill=TEXT_GRAY, font=summary_label_font)
     
     # 补充数据
     if extra_facts:
         facts_y = summary_y + 300
         
-        draw.line((margin + 200, facts_y, W - margin - 200, facts_y), fill=(50, 50, 65), width=1)
+        draw.line((MARGIN + 200, facts_y, W - MARGIN - 200, facts_y), fill=(50, 50, 65), width=1)
         
         for i, fact in enumerate(extra_facts):
             fy = facts_y + 25 + i * 32
-            draw.ellipse((margin + 100 - 2, fy + 5, margin + 100 + 2, fy + 9), fill=text_gray)
-            draw.text((margin + 115, fy), fact, fill=text_light, font=fact_font)
+            draw.ellipse((MARGIN + 100 - 2, fy + 5, MARGIN + 100 + 2, fy + 9), fill=TEXT_GRAY)
+            draw.text((MARGIN + 115, fy), fact, fill=TEXT_LIGHT, font=fact_font)
     
-    # Footer
-    footer_y = H - footer_h
+    return top, img
+
+def render_heatmap_tile(task):
+    """
+    绘制 星期 × 小时 观看时段热力图
+    task = (heatmap, top, height, H)，返回 (top, tile)
+    """
+    from PIL import ImageDraw
+    
+    heatmap, top, height, H = task
+    
+    img = gradient_band(top, height, H)
+    draw = ImageDraw.Draw(img)
+    
+    title_font = load_font("msyhbd.ttc", 14)
+    label_font = load_font("msyh.ttc", 11)
     
-    draw.line((margin + 150, footer_y + 10, W - margin - 150, footer_y + 10), fill=(50, 50, 65), width=1)
+    draw.line((MARGIN + 150, 0, W - MARGIN - 150, 0), fill=(50, 50, 65), width=1)
+    
+    title = "观看时段"
+    bbox = title_font.getbbox(title)
+    tw = bbox[2] - bbox[0]
+    draw.text(((W - tw) // 2, 20), title, fill=ACCENT, font=title_font)
+    
+    grid_x = MARGIN + HEAT_LABEL_W
+    grid_y = 60
+    peak = max(max(row) for row in heatmap) or 1
+    
+    for d, row in enumerate(heatmap):
+        cell_y = grid_y + d * (HEAT_CELL_H + HEAT_GAP)
+        draw.text((MARGIN, cell_y + 4), WEEKDAY_NAMES[d], fill=TEXT_GRAY, font=label_font)
+        for h, value in enumerate(row):
+            t = value / peak
+            fill = tuple(int(e + (a - e) * t) for e, a in zip(EMPTY_CARD, ACCENT))
+            cell_x = grid_x + h * HEAT_CELL_W
+            draw.rounded_rectangle(
+                (cell_x, cell_y, cell_x + HEAT_CELL_W - HEAT_GAP, cell_y + HEAT_CELL_H),
+                radius=4, fill=fill
+            )
+    
+    hours_y = grid_y + 7 * (HEAT_CELL_H + HEAT_GAP) + 4
+    for h in range(0, 24, 3):
+        draw.text((grid_x + h * HEAT_CELL_W, hours_y), f"{h:02d}", fill=TEXT_GRAY, font=label_font)
+    
+    return top, img
+
+def draw_annual_report(year, monthly_top3, annual_summary, extra_facts, workers=RENDER_WORKERS,
+                       title="年度观影报告", save_path=None, heatmap=None):
+    """
+    绘制年度报告海报
+    12 个月份行与汇总区作为独立图块在进程池中并行绘制，再拼合到画布上
+    title / save_path 用于个人年度报告；heatmap 提供时在汇总区下方绘制观看时段热力图
+    """
+    from PIL import ImageDraw
+    
+    print("\n🎨 正在绘制海报...")
+    
+    layout = annual_layout(extra_facts, with_heatmap=bool(heatmap))
+    H = layout["H"]
+    header_y = layout["header_y"]
+    content_y = layout["content_y"]
+    summary_y = layout["summary_y"]
+    heatmap_y = layout["heatmap_y"]
+    footer_y = layout["footer_y"]
+    
+    tasks = [
+        (month, monthly_top3.get(month, []),
+         content_y + (month - 1) * (MONTH_ROW_H + MONTH_GAP), H)
+        for month in range(1, 13)
+    ]
+    summary_task = (annual_summary, extra_facts, summary_y, heatmap_y - summary_y, H)
+    heatmap_task = (heatmap, heatmap_y, HEATMAP_H, H)
+    
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            summary_future = pool.submit(render_summary_tile, summary_task)
+            heatmap_future = pool.submit(render_heatmap_tile, heatmap_task) if heatmap else None
+            tiles = list(pool.map(render_month_tile, tasks))
+            tiles.append(summary_future.result())
+            if heatmap_future:
+                tiles.append(heatmap_future.result())
+    else:
+        tiles = [render_month_tile(task) for task in tasks]
+        tiles.append(render_summary_tile(summary_task))
+        if heatmap:
+            tiles.append(render_heatmap_tile(heatmap_task))
+    
+    img = gradient_band(0, H, H)
+    for top, tile in tiles:
+        img.paste(tile, (0, top))
+    draw = ImageDraw.Draw(img)
+    
+    title_font = load_font("msyhbd.ttc", 38)
+    subtitle_font = load_font("msyh.ttc", 16)
+    year_font = load_font("msyh.ttc", 14)
+    brand_font = load_font("msyh.ttc", 12)
+    
+    # Header
+    year_text = str(year)
+    bbox = year_font.getbbox(year_text)
+    year_w = bbox[2] - bbox[0]
+    draw.text(((W - year_w) // 2, header_y + 10), year_text, fill=TEXT_GRAY, font=year_font)
+    
+    bbox = title_font.getbbox(title)
+    title_w = bbox[2] - bbox[0]
+    draw.text(((W - title_w) // 2, header_y + 35), title, fill=TEXT_WHITE, font=title_font)
+    
+    subtitle = "Annual Playback Report"
+    bbox = subtitle_font.getbbox(subtitle)
+    sub_w = bbox[2] - bbox[0]
+    draw.text(((W - sub_w) // 2, header_y + 85), subtitle, fill=TEXT_GRAY, font=subtitle_font)
+    
+    line_y = header_y + 130
+    draw.line((MARGIN + 150, line_y, W - MARGIN - 150, line_y), fill=(50, 50, 65), width=1)
+    
+    # Footer
+    draw.line((MARGIN + 150, footer_y + 10, W - MARGIN - 150, footer_y + 10), fill=(50, 50, 65), width=1)
     
     brand = f"Jellyfin Media · {SITE_NAME}"
     bbox = brand_font.getbbox(brand)
     bw = bbox[2] - bbox[0]
-    draw.text(((W - bw) // 2, footer_y + 40), brand, fill=text_gray, font=brand_font)
+    draw.text(((W - bw) // 2, footer_y + 40), brand, fill=TEXT_GRAY, font=brand_font)
     
     year_text = str(year)
     bbox = brand_font.getbbox(year_text)
     yw = bbox[2] - bbox[0]
-    draw.text(((W - yw) // 2, footer_y + 65), year_text, fill=text_gray, font=brand_font)
+    draw.text(((W - yw) // 2, footer_y + 65), year_text, fill=TEXT_GRAY, font=brand_font)
     
     # 保存
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
-    save_path = f"{OUTPUT_DIR}/annual_report_{year}.png"
-    img.convert('RGB').save(save_path, quality=95)
+    save_path = save_path or f"{OUTPUT_DIR}/annual_report_{year}.png"
+    os.makedirs(os.path.dirname(save_path), exist_ok=True)
+    save_path = poster_output.save_poster(img, save_path)
     
     print(f"\n✅ 年度报告已生成: {save_path}")
     print(f"   尺寸: {W} × {H}")
@@ -616,20 +987,85 @@ def draw_annual_report(year, monthly_top3, annual_summary, extra_facts):
 # 主函数
 # =========================
 
-def main():
+def update_rollups():
+    """更新各服务器的日汇总表，没有任何可用数据库时返回 False"""
+    servers = [s for s in get_servers() if os.path.exists(s["db_path"])]
+    if not servers:
+        print(f"\n❌ 数据库不存在: {get_servers()[0]['db_path']}")
+        print("   请先运行 weekly_rank_v2.py 拉取数据库")
+        return False
+    
+    print("\n🗂  正在更新日汇总表...")
+    for server in servers:
+        new_rows = report_cache.update_rollup(
+            server["db_path"], server["cache_db_path"],
+            int(UTC_OFFSET_HOURS * 3600),
+            None if SOURCE_UTC_OFFSET_HOURS is None else int(SOURCE_UTC_OFFSET_HOURS * 3600),
+        )
+        print(f"   {server['name']}: 新增汇总 {new_rows} 条记录")
+    return True
+
+def user_report_path(year, user_name, user_id):
+    """个人年度报告文件名（附带 UserId 前缀，避免重名用户互相覆盖）"""
+    safe_name = re.sub(r'[\\/:*?"<>|\s]+', "_", user_name).strip("_") or "user"
+    return f"{OUTPUT_DIR}/users/annual_report_{year}_{safe_name}-{user_id[:8]}.png"
+
+def render_user_report(task):
+    """绘制单个用户的年度报告（在子进程中执行，图块顺序绘制）"""
+    year, report = task
+    return draw_annual_report(
+        year, report["monthly_top3"], report["annual_summary"], report["extra_facts"],
+        workers=1,
+        title=f"{report['name']} 的年度观影报告",
+        save_path=user_report_path(year, report["name"], report["user_id"]),
+    )
+
+def main_users(year=None, workers=RENDER_WORKERS):
+    """为所有用户生成个人年度报告：一次统计，进程池按用户并行绘制"""
+    year = year or REPORT_YEAR
+    print("=" * 60)
+    print(f"🎬 {year} 个人年度观影报告")
+    print("=" * 60)
+    
+    if not update_rollups():
+        return []
+    
+    reports = get_user_annual_data(year)
+    if not reports:
+        print("\n   本年度暂无播放记录")
+        return []
+    
+    print(f"\n🎨 并行绘制 {len(reports)} 份个人报告（{workers} 进程）...")
+    tasks = [(year, report) for report in reports]
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            paths = list(pool.map(render_user_report, tasks))
+    else:
+        paths = [render_user_report(task) for task in tasks]
+    
+    print("\n" + "=" * 60)
+    print("✨ 生成完成！")
+    print("=" * 60)
+    for path in paths:
+        print(f"   - {path}")
+    return paths
+
+def main(year=None):
+    year = year or REPORT_YEAR
     print("=" * 60)
-    print(f"🎬 {REPORT_YEAR} 年度观影报告生成器")
+    print(f"🎬 {year} 年度观影报告生成器")
     print("   Annual Playback Report Generator")
     print("=" * 60)
     
-    if not os.path.exists(DB_PATH):
-        print(f"\n❌ 数据库不存在: {DB_PATH}")
-        print("   请先运行 weekly_rank_v2.py 拉取数据库")
+    if not update_rollups():
         return
     
-    monthly_top3, annual_summary, fun_facts = get_annual_data(REPORT_YEAR)
+    monthly_top3, annual_summary, fun_facts = get_annual_data(year)
+    heatmap = get_heatmap(year)
     
-    poster_path = draw_annual_report(REPORT_YEAR, monthly_top3, annual_summary, fun_facts)
+    poster_path = draw_annual_report(year, monthly_top3, annual_summary, fun_facts, heatmap=heatmap)
+    heatmap_path = export_heatmap(heatmap, os.path.splitext(poster_path)[0] + ".heatmap.json")
+    print(f"   热力图数据: {heatmap_path}")
     
     print("\n" + "=" * 60)
     print("✨ 生成完成！")
@@ -639,6 +1075,19 @@ def main():
    总播放时长: {sec_to_hm(annual_summary['total_duration'])}
    观看作品数: {annual_summary['total_items']} 部
 """)
+    
+    return poster_path
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Jellyfin 年度观影报告")
+    parser.add_argument("--year", type=int, default=REPORT_YEAR)
+    parser.add_argument("--users", action="store_true",
+                        help="为每位用户生成个人年度报告")
+    parser.add_argument("--workers", type=int, default=RENDER_WORKERS,
+                        help="并行绘制进程数")
+    args = parser.parse_args()
+    
+    if args.users:
+        main_users(args.year, args.workers)
+    else:
+        main(args.year)
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+启动导入耗时基准
+用 `python -X importtime` 分别测量：
+- 只导入 weekly_rank_v3（文本模式实际需要的部分）
+- 导入统一流水线 report_pipeline（含年度报告，同样不加载 PIL）
+- 导入 weekly_rank_v3 后再加载 requests / PIL / paramiko（海报模式的全部依赖）
+
+用法：
+    python benchmarks/bench_import_time.py [-n 5]
+"""
+
+import os
+import re
+import sys
+import argparse
+import subprocess
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CASES = [
+    ("text-only", "import weekly_rank_v3"),
+    ("pipeline", "import report_pipeline"),
+    ("full", "import weekly_rank_v3, requests, PIL.Image, PIL.ImageDraw, PIL.ImageFont, paramiko"),
+]
+
+LINE_RE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def measure(code):
+    """运行一次 -X importtime，返回 (总耗时 us, 各顶层模块累计耗时)"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+
+    top_level = {}
+    for line in proc.stderr.splitlines():
+        m = LINE_RE.match(line)
+        if m and len(m.group(3)) == 1:
+            top_level[m.group(4)] = int(m.group(2))
+    return sum(top_level.values()), top_level
+
+
+def main():
+    parser = argparse.ArgumentParser(description="导入耗时基准")
+    parser.add_argument("-n", type=int, default=5, help="每项重复次数")
+    args = parser.parse_args()
+
+    for name, code in CASES:
+        try:
+            runs = [measure(code) for _ in range(args.n)]
+        except RuntimeError as e:
+            print(f"{name:10s}  跳过: {e}")
+            continue
+
+        totals = [total for total, _ in runs]
+        print(f"{name:10s}  中位数 {statistics.median(totals) / 1000:8.1f} ms"
+              f"  (最小 {min(totals) / 1000:.1f} ms, n={args.n})")
+
+        heaviest = sorted(runs[-1][1].items(), key=lambda kv: kv[1], reverse=True)[:5]
+        for module, us in heaviest:
+            print(f"            {module:30s} {us / 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
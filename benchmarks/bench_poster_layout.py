@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+周榜海报排版 / 绘制耗时基准
+用中英文混排的合成数据分别测量：
+- layout-cold  清空文字宽度缓存后排版（每段文字都要 getbbox）
+- layout-warm  缓存已命中时排版（常驻进程重复生成海报的情况）
+- render       执行绘制指令（图片全部走备用指令，不访问网络）
+
+用法：
+    python benchmarks/bench_poster_layout.py [-n 20] [--font /path/to/font.ttc]
+"""
+
+import os
+import sys
+import time
+import argparse
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import poster_layout
+import weekly_rank_v3 as weekly
+
+NAMES = [
+    "葬送的芙莉莲", "Frieren: Beyond Journey's End", "进击的巨人 The Final Season 完结篇",
+    "Oppenheimer", "流浪地球2", "The Lord of the Rings: The Return of the King",
+    "间谍过家家 SPY×FAMILY", "三体", "Breaking Bad",
+]
+
+
+def sample_data():
+    """合成一周的榜单、日历与热力图数据"""
+    def ranking(offset):
+        return [{"Name": NAMES[(offset + i) % len(NAMES)], "trend": [2, "new", -1][i], "streak": 1}
+                for i in range(3)]
+
+    calendar = [
+        {
+            "date": f"2026-01-{12 + d:02d}",
+            "weekday": weekly.WEEKDAY_NAMES[d],
+            "episodes": [{"name": NAMES[(d + e) % len(NAMES)], "season": 1, "episode": e + 1, "poster": None}
+                         for e in range(d % 4 + 3)],
+        }
+        for d in range(7)
+    ]
+    heatmap = [[(d * 24 + h) % 17 * 60 for h in range(24)] for d in range(7)]
+    return ranking(0), ranking(3), ranking(6), calendar, heatmap
+
+
+def timed(func):
+    """运行一次，返回 (耗时 ms, 结果)"""
+    started = time.perf_counter()
+    result = func()
+    return (time.perf_counter() - started) * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="海报排版 / 绘制耗时基准")
+    parser.add_argument("-n", type=int, default=20, help="每项重复次数")
+    parser.add_argument("--font", help="用指定字体替换海报中的 Windows 字体路径")
+    args = parser.parse_args()
+
+    if args.font:
+        load_font = weekly.load_font
+        weekly.load_font = lambda path, size: load_font(args.font, size)
+
+    from PIL import Image
+
+    movies, tv_shows, anime, calendar, heatmap = sample_data()
+
+    def layout():
+        return weekly.layout_poster_v3(movies, tv_shows, anime, calendar, "2026-01-05", heatmap=heatmap)
+
+    def layout_cold():
+        poster_layout._text_widths.clear()
+        return layout()
+
+    try:
+        _, (W, H, ops) = timed(layout_cold)
+    except OSError as e:
+        print(f"字体不可用: {e}（可用 --font 指定）")
+        return
+
+    def render():
+        img = Image.new("RGBA", (W, H))
+        poster_layout.render(img, ops)
+
+    cases = [("layout-cold", layout_cold), ("layout-warm", layout), ("render", render)]
+    for name, func in cases:
+        times = [timed(func)[0] for _ in range(args.n)]
+        print(f"{name:12s}  中位数 {statistics.median(times):8.2f} ms"
+              f"  (最小 {min(times):.2f} ms, n={args.n})")
+
+    print(f"绘制指令 {len(ops)} 条，缓存文字宽度 {len(poster_layout._text_widths)} 条")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+海报排版与绘制分离
+- 文字宽度测量带缓存：同一字体、同一文本只调用一次 getbbox
+- 按像素宽度截断文字（二分查找最长前缀），中英文混排也不会溢出或留白过多
+- 排版阶段只产出绘制指令列表（display list），绘制阶段按顺序执行
+
+绘制指令（元组，第一项为类型）：
+    ("text", (x, y), 文本, 颜色, 字体)
+    ("rect", (x0, y0, x1, y1), 颜色, 圆角半径)
+    ("gradient", (x0, y0, x1, y1), 顶部颜色, 底部颜色)        纵向渐变
+    ("image", (x, y), (w, h), 圆角半径, 来源, 备用指令列表)    来源由 load_image 加载，
+                                                              加载失败时执行备用指令
+"""
+
+# (字体文件, 字号, 文本) -> 像素宽度
+_text_widths = {}
+
+# 宽度缓存条目上限，超过后整体清空（常驻进程中避免无限增长）
+MAX_CACHED_WIDTHS = 50000
+
+
+def text_width(font, text):
+    """文字像素宽度（按字体与文本缓存）"""
+    key = (font.path, font.size, text)
+    width = _text_widths.get(key)
+    if width is None:
+        if len(_text_widths) >= MAX_CACHED_WIDTHS:
+            _text_widths.clear()
+        bbox = font.getbbox(text)
+        width = _text_widths[key] = bbox[2] - bbox[0]
+    return width
+
+
+def truncate_text(font, text, max_width, ellipsis="..."):
+    """
+    截断到不超过 max_width 像素，被截断时追加省略号
+    二分查找满足宽度的最长前缀，测量次数为 O(log n)
+    """
+    if text_width(font, text) <= max_width:
+        return text
+
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if text_width(font, text[:mid].rstrip() + ellipsis) <= max_width:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[:lo].rstrip() + ellipsis
+
+
+def centered_text(font, text, x, width, y, fill, max_width=None, ellipsis="..."):
+    """在 [x, x + width) 内水平居中的文字指令，可按像素宽度截断"""
+    if max_width is not None:
+        text = truncate_text(font, text, max_width, ellipsis)
+    return ("text", (x + (width - text_width(font, text)) // 2, y), text, fill, font)
+
+
+def round_corners(img, radius):
+    """为图片添加圆角"""
+    from PIL import Image, ImageDraw
+
+    mask = Image.new('L', img.size, 0)
+    draw = ImageDraw.Draw(mask)
+    draw.rounded_rectangle([(0, 0), img.size], radius=radius, fill=255)
+    output = Image.new('RGBA', img.size, (0, 0, 0, 0))
+    output.paste(img.convert('RGBA'), mask=mask)
+    return output
+
+
+def render(img, ops, load_image=None):
+    """
+    按顺序执行绘制指令
+    load_image(来源) 返回 PIL 图片或 None；不提供时所有图片都使用备用指令
+    """
+    from PIL import Image, ImageDraw
+
+    draw = ImageDraw.Draw(img)
+    for op in ops:
+        kind = op[0]
+        if kind == "text":
+            _, xy, text, fill, font = op
+            draw.text(xy, text, fill=fill, font=font)
+        elif kind == "rect":
+            _, box, fill, radius = op
+            if radius:
+                draw.rounded_rectangle(box, radius=radius, fill=fill)
+            else:
+                draw.rectangle(box, fill=fill)
+        elif kind == "gradient":
+            _, (x0, y0, x1, y1), top, bottom = op
+            height = y1 - y0
+            for y in range(height):
+                t = y / height
+                fill = tuple(int(a + (b - a) * t) for a, b in zip(top, bottom))
+                draw.line((x0, y0 + y, x1, y0 + y), fill=fill)
+        elif kind == "image":
+            _, xy, size, radius, source, fallback = op
+            image = load_image(source) if load_image and source else None
+            if image is None:
+                render(img, fallback)
+                continue
+            image = image.resize(size, Image.Resampling.LANCZOS)
+            image = round_corners(image, radius) if radius else image.convert("RGBA")
+            img.paste(image, xy, image)
+        else:
+            raise ValueError(f"未知绘制指令: {kind}")
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+海报输出编码
+- png：无损 PNG（optimize）
+- png8：调色板量化后的 PNG，适合渐变 + 海报为主的画面
+- jpeg：渐进式 JPEG
+- webp / avif：Pillow 支持时可用，不支持时退回 jpeg
+- 编码前统一转为不透明的 RGB（海报背景不透明，半透明文字不会留下透明像素）
+- 设置字节预算后自动二分选择满足预算的最高质量
+
+配置（环境变量）：
+    POSTER_FORMAT     输出格式，默认 png
+    POSTER_QUALITY    有损格式的最高质量，默认 90
+    POSTER_MAX_BYTES  字节预算，0 表示不限制
+"""
+
+import os
+import time
+from io import BytesIO
+from pathlib import Path
+
+POSTER_FORMAT = os.getenv("POSTER_FORMAT", "png").strip().lower()
+POSTER_QUALITY = int(os.getenv("POSTER_QUALITY", "90"))
+POSTER_MAX_BYTES = int(os.getenv("POSTER_MAX_BYTES", "0"))
+
+# 有损格式二分搜索的最低质量
+MIN_QUALITY = 40
+
+EXTENSIONS = {
+    "png": ".png",
+    "png8": ".png",
+    "jpeg": ".jpg",
+    "webp": ".webp",
+    "avif": ".avif",
+}
+
+CONTENT_TYPES = {
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".webp": "image/webp",
+    ".avif": "image/avif",
+}
+
+
+def supported(fmt):
+    """当前 Pillow 是否能写出该格式"""
+    from PIL import Image, features
+
+    if fmt == "webp":
+        return features.check("webp")
+    if fmt == "avif":
+        Image.init()
+        return "AVIF" in Image.SAVE
+    return fmt in EXTENSIONS
+
+
+def resolve_format(fmt):
+    """不支持的格式退回 jpeg"""
+    if fmt not in EXTENSIONS:
+        print(f"  [!] 未知海报格式 {fmt}，使用 png")
+        return "png"
+    if not supported(fmt):
+        print(f"  [!] 当前 Pillow 不支持 {fmt}，使用 jpeg")
+        return "jpeg"
+    return fmt
+
+
+def flatten(img):
+    """
+    转为不透明的 RGB
+    海报背景本身不透明，但半透明文字会把 alpha 直接写进画布，保留 alpha 只会留下透明的字
+    """
+    if img.mode != "RGB":
+        return img.convert("RGB")
+    return img
+
+
+def encode(img, fmt, quality):
+    """按格式与质量编码为字节"""
+    from PIL import Image
+
+    buf = BytesIO()
+    if fmt == "png":
+        img.save(buf, "PNG", optimize=True)
+    elif fmt == "png8":
+        colors = max(16, min(256, int(256 * quality / 100)))
+        img.quantize(colors=colors, method=Image.Quantize.MEDIANCUT).save(buf, "PNG", optimize=True)
+    elif fmt == "jpeg":
+        img.convert("RGB").save(buf, "JPEG", quality=quality, optimize=True, progressive=True)
+    elif fmt == "webp":
+        img.save(buf, "WEBP", quality=quality, method=4)
+    elif fmt == "avif":
+        img.save(buf, "AVIF", quality=quality)
+    return buf.getvalue()
+
+
+def encode_within_budget(img, fmt, quality, max_bytes):
+    """
+    编码并尽量满足字节预算
+    有损格式与 png8 在 [MIN_QUALITY, quality] 间二分，取不超预算的最高质量；
+    png 超预算时改用 png8 再搜索一次
+    """
+    data = encode(img, fmt, quality)
+    if not max_bytes or len(data) <= max_bytes:
+        return fmt, quality, data
+
+    if fmt == "png":
+        fmt = "png8"
+        data = encode(img, fmt, quality)
+        if len(data) <= max_bytes:
+            return fmt, quality, data
+
+    best = None
+    lo, hi = MIN_QUALITY, quality - 1
+    while lo <= hi:
+        mid = (lo + hi) // 2
+        candidate = encode(img, fmt, mid)
+        if len(candidate) <= max_bytes:
+            best = (mid, candidate)
+            lo = mid + 1
+        else:
+            hi = mid - 1
+
+    if best is None:
+        print(f"  [!] 最低质量仍超出预算 {max_bytes} 字节")
+        return fmt, MIN_QUALITY, encode(img, fmt, MIN_QUALITY)
+    return fmt, best[0], best[1]
+
+
+def save_poster(img, path, fmt=None, quality=None, max_bytes=None):
+    """
+    按配置编码并保存海报，返回实际写入的路径（扩展名随格式变化）
+    """
+    fmt = resolve_format(fmt or POSTER_FORMAT)
+    quality = quality or POSTER_QUALITY
+    max_bytes = POSTER_MAX_BYTES if max_bytes is None else max_bytes
+
+    started = time.perf_counter()
+    img = flatten(img)
+    fmt, used_quality, data = encode_within_budget(img, fmt, quality, max_bytes)
+    elapsed = time.perf_counter() - started
+
+    out_path = str(Path(path).with_suffix(EXTENSIONS[fmt]))
+    with open(out_path, "wb") as f:
+        f.write(data)
+
+    quality_note = "" if fmt == "png" else f", q={used_quality}"
+    print(f"  [i] 编码 {fmt}{quality_note}: {len(data) / 1024:.0f} KB，用时 {elapsed * 1000:.0f} ms")
+    return out_path
+
+
+def content_type(path):
+    """根据扩展名返回 Content-Type"""
+    return CONTENT_TYPES.get(Path(path).suffix.lower(), "application/octet-stream")
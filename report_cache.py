@@ -0,0 +1,732 @@
+# -*- coding: utf-8 -*-
+"""
+本地报表缓存（日汇总表）
+- Plays：逐条播放记录，入库时一次性解析 DateCreated，得到整数 Epoch（UTC 秒）
+  以及按配置时区换算的本地 Day / Hour / Weekday，均带索引
+- 按 (日期, 作品, ItemType, UserId, ClientName) 汇总 PlayDuration 与播放次数
+- 汇总时即写入剧名：DisplayName（Episode 取 " - " 之前的剧名，其余为作品名）
+  与用于分组的规范化 SeriesName，报表直接在 SQL 中按剧集分组
+- 按 (日期, 小时, UserId) 汇总播放时长，用于夜间观影等时段统计（可按用户拆分），
+  附带星期与小时起点 Epoch
+- 以 PlaybackActivity 的 rowid 作为水位线，每次只汇总新增的记录
+- 记录已上传海报的内容哈希与图床 URL，避免重复上传
+- 用户目录：UserId -> 用户名，整体从 /Users 拉取后带时间戳保存
+- 剧集索引：全部 Series 的所属媒体库（ParentId / Path）与分类，用于离线分类
+- 片长缓存：ItemId -> RunTimeTicks，批量请求后长期保存，用于计算完播率
+- 周榜历史：每周各榜单的名次，用于计算名次变化与连续上榜周数（不随汇总表重建清空）
+- 待投递队列（outbox）：推送失败时保留在磁盘上，后续运行按退避时间重试
+- 观看会话：按 (UserId, Epoch) 顺序流式读取 Plays，间隔小于阈值的相邻播放合并为一次会话
+
+缓存库与拉取下来的 playback_reporting.db 分开存放，
+因为后者每次运行都会被 fetch_database() 整个覆盖。
+"""
+
+import os
+import json
+import time
+import sqlite3
+import datetime
+
+# =========================
+# 表结构
+# =========================
+
+# 汇总表结构版本（PRAGMA user_version），变化时删除旧汇总表并全量重建
+SCHEMA_VERSION = 3
+
+ROLLUP_TABLES = ("Plays", "DailyRollup", "HourlyRollup")
+
+# 默认时区（UTC+8），与周榜的 TIMEZONE 一致
+DEFAULT_UTC_OFFSET = 8 * 3600
+
+# 投递认领超时：进程在 sending 状态下崩溃后，超过该秒数的记录重新放回 pending
+DEFAULT_CLAIM_TIMEOUT = 15 * 60
+
+# 默认会话间隔：同一用户上一条播放结束到下一条开始不超过该秒数时视为同一次会话
+DEFAULT_SESSION_GAP = 30 * 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS Plays (
+    RowId INTEGER PRIMARY KEY,
+    Epoch INTEGER NOT NULL,
+    Day TEXT NOT NULL,
+    Hour INTEGER NOT NULL,
+    Weekday INTEGER NOT NULL,
+    UserId TEXT NOT NULL,
+    ItemId TEXT,
+    ItemName TEXT NOT NULL,
+    ItemType TEXT NOT NULL,
+    DisplayName TEXT NOT NULL,
+    SeriesName TEXT NOT NULL,
+    ClientName TEXT NOT NULL,
+    PlayDuration INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE INDEX IF NOT EXISTS idx_plays_epoch
+    ON Plays (Epoch);
+
+CREATE INDEX IF NOT EXISTS idx_plays_user_epoch
+    ON Plays (UserId, Epoch);
+
+CREATE TABLE IF NOT EXISTS DailyRollup (
+    Day TEXT NOT NULL,
+    ItemName TEXT NOT NULL,
+    ItemType TEXT NOT NULL,
+    UserId TEXT NOT NULL,
+    ClientName TEXT NOT NULL,
+    ItemId TEXT,
+    DisplayName TEXT NOT NULL,
+    SeriesName TEXT NOT NULL,
+    PlayDuration INTEGER NOT NULL DEFAULT 0,
+    PlayCount INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (Day, ItemName, ItemType, UserId, ClientName)
+);
+
+CREATE INDEX IF NOT EXISTS idx_daily_rollup_type_day
+    ON DailyRollup (ItemType, Day);
+
+CREATE INDEX IF NOT EXISTS idx_daily_rollup_series
+    ON DailyRollup (ItemType, SeriesName, Day);
+
+CREATE TABLE IF NOT EXISTS HourlyRollup (
+    Day TEXT NOT NULL,
+    Hour INTEGER NOT NULL,
+    UserId TEXT NOT NULL,
+    Weekday INTEGER NOT NULL,
+    Epoch INTEGER NOT NULL,
+    PlayDuration INTEGER NOT NULL DEFAULT 0,
+    PlayCount INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (Day, Hour, UserId)
+);
+
+CREATE INDEX IF NOT EXISTS idx_hourly_rollup_epoch
+    ON HourlyRollup (Epoch);
+
+CREATE TABLE IF NOT EXISTS CacheState (
+    Key TEXT PRIMARY KEY,
+    Value TEXT
+);
+
+CREATE TABLE IF NOT EXISTS UploadCache (
+    ContentHash TEXT PRIMARY KEY,
+    Url TEXT NOT NULL,
+    UploadedAt TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS UserDirectory (
+    UserId TEXT PRIMARY KEY,
+    Name TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS SeriesIndex (
+    SeriesId TEXT PRIMARY KEY,
+    Name TEXT NOT NULL,
+    ParentId TEXT,
+    Path TEXT,
+    ProviderIds TEXT,
+    Category TEXT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_series_index_name
+    ON SeriesIndex (Name);
+
+CREATE TABLE IF NOT EXISTS ItemRuntime (
+    ItemId TEXT PRIMARY KEY,
+    RunTimeTicks INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS WeekRanks (
+    WeekStart TEXT NOT NULL,
+    Category TEXT NOT NULL,
+    Rank INTEGER NOT NULL,
+    ItemKey TEXT NOT NULL,
+    Name TEXT NOT NULL,
+    PlayDuration INTEGER NOT NULL DEFAULT 0,
+    PlayCount INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (WeekStart, Category, Rank)
+);
+
+CREATE TABLE IF NOT EXISTS Outbox (
+    Id INTEGER PRIMARY KEY AUTOINCREMENT,
+    Kind TEXT NOT NULL,
+    Payload TEXT NOT NULL,
+    Status TEXT NOT NULL DEFAULT 'pending',
+    Attempts INTEGER NOT NULL DEFAULT 0,
+    NextAttemptAt REAL NOT NULL DEFAULT 0,
+    LastError TEXT,
+    CreatedAt TEXT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_outbox_status_next
+    ON Outbox (Status, NextAttemptAt);
+"""
+
+# Episode 的 ItemName 形如 "剧名 - S01E01 - 标题"，剧名取第一个 " - " 之前的部分
+DISPLAY_NAME_SQL = """
+    TRIM(CASE
+        WHEN ItemType = 'Episode' THEN
+            SUBSTR(COALESCE(ItemName, ''), 1, INSTR(COALESCE(ItemName, '') || ' - ', ' - ') - 1)
+        ELSE COALESCE(ItemName, '')
+    END)
+"""
+
+# DateCreated 是源库所在时区的本地时间字符串：先换算为 UTC Epoch，
+# 再按报表时区（:tz，秒）得到本地日期 / 小时 / 星期（周一为 0）
+INSERT_PLAYS_SQL = f"""
+    INSERT OR REPLACE INTO Plays
+        (RowId, Epoch, Day, Hour, Weekday, UserId, ItemId, ItemName, ItemType,
+         DisplayName, SeriesName, ClientName, PlayDuration)
+    SELECT
+        RowId,
+        Epoch,
+        DATE(Epoch + :tz, 'unixepoch'),
+        CAST(STRFTIME('%H', Epoch + :tz, 'unixepoch') AS INTEGER),
+        (CAST(STRFTIME('%w', Epoch + :tz, 'unixepoch') AS INTEGER) + 6) % 7,
+        UserId, ItemId, ItemName, ItemType,
+        DisplayName, LOWER(DisplayName), ClientName, PlayDuration
+    FROM (
+        SELECT
+            rowid AS RowId,
+            CAST(STRFTIME('%s', SUBSTR(DateCreated, 1, 19)) AS INTEGER) - :src AS Epoch,
+            COALESCE(UserId, '') AS UserId,
+            ItemId,
+            COALESCE(ItemName, '') AS ItemName,
+            COALESCE(ItemType, '') AS ItemType,
+            {DISPLAY_NAME_SQL} AS DisplayName,
+            COALESCE(ClientName, '') AS ClientName,
+            COALESCE(PlayDuration, 0) AS PlayDuration
+        FROM src.PlaybackActivity
+        WHERE rowid > :lo AND rowid <= :hi
+          AND DateCreated IS NOT NULL
+    )
+    WHERE Epoch IS NOT NULL
+"""
+
+ROLLUP_DAILY_SQL = """
+    INSERT INTO DailyRollup
+        (Day, ItemName, ItemType, UserId, ClientName, ItemId, DisplayName, SeriesName,
+         PlayDuration, PlayCount)
+    SELECT
+        Day,
+        ItemName,
+        ItemType,
+        UserId,
+        ClientName,
+        MAX(ItemId),
+        DisplayName,
+        SeriesName,
+        SUM(PlayDuration),
+        COUNT(*)
+    FROM Plays
+    WHERE RowId > :lo AND RowId <= :hi
+    GROUP BY Day, ItemName, ItemType, UserId, ClientName
+    ON CONFLICT (Day, ItemName, ItemType, UserId, ClientName) DO UPDATE SET
+        ItemId = excluded.ItemId,
+        PlayDuration = PlayDuration + excluded.PlayDuration,
+        PlayCount = PlayCount + excluded.PlayCount
+"""
+
+# Epoch 为该本地小时起点对应的 UTC 秒（兼容非整点时区）
+ROLLUP_HOURLY_SQL = """
+    INSERT INTO HourlyRollup (Day, Hour, UserId, Weekday, Epoch, PlayDuration, PlayCount)
+    SELECT
+        Day,
+        Hour,
+        UserId,
+        Weekday,
+        (MIN(Epoch) + :tz) / 3600 * 3600 - :tz,
+        SUM(PlayDuration),
+        COUNT(*)
+    FROM Plays
+    WHERE RowId > :lo AND RowId <= :hi
+    GROUP BY Day, Hour, UserId
+    ON CONFLICT (Day, Hour, UserId) DO UPDATE SET
+        PlayDuration = PlayDuration + excluded.PlayDuration,
+        PlayCount = PlayCount + excluded.PlayCount
+"""
+
+
+# =========================
+# 辅助函数
+# =========================
+
+def connect(cache_path):
+    """打开缓存库并确保表结构存在"""
+    cache_dir = os.path.dirname(cache_path)
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+    conn = sqlite3.connect(cache_path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+        migrate(conn)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def migrate(conn):
+    """汇总表结构升级：删除旧汇总表与水位线，下次 update_rollup 时全量重建"""
+    for table in ROLLUP_TABLES:
+        conn.execute(f"DROP TABLE IF EXISTS {table}")
+    conn.execute("CREATE TABLE IF NOT EXISTS CacheState (Key TEXT PRIMARY KEY, Value TEXT)")
+    conn.execute("DELETE FROM CacheState WHERE Key LIKE 'rollup_%'")
+    conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    conn.commit()
+
+
+def get_state(conn, key, default=None):
+    """读取缓存状态值"""
+    row = conn.execute("SELECT Value FROM CacheState WHERE Key = ?", (key,)).fetchone()
+    return row["Value"] if row else default
+
+
+def set_state(conn, key, value):
+    """写入缓存状态值"""
+    conn.execute("""
+        INSERT INTO CacheState (Key, Value) VALUES (?, ?)
+        ON CONFLICT (Key) DO UPDATE SET Value = excluded.Value
+    """, (key, str(value)))
+
+
+def reset_rollup(conn):
+    """清空汇总表与水位线"""
+    for table in ROLLUP_TABLES:
+        conn.execute(f"DELETE FROM {table}")
+    conn.execute("DELETE FROM CacheState WHERE Key LIKE 'rollup_%'")
+
+
+def update_rollup(source_path, cache_path, utc_offset=DEFAULT_UTC_OFFSET, source_offset=None):
+    """
+    将 source_path 中新增的 PlaybackActivity 记录汇总进缓存库
+    返回本次汇总的新记录数
+
+    utc_offset 为报表时区相对 UTC 的秒数（决定 Day / Hour / Weekday），
+    source_offset 为源库 DateCreated 所在时区（默认与 utc_offset 相同）。
+
+    水位线为已汇总的最大 rowid，同时记录该行的 DateCreated；
+    若源库的 rowid 回退或该行内容不一致（数据库被重建），或时区配置变化，则重新全量汇总。
+    """
+    if source_offset is None:
+        source_offset = utc_offset
+    tz_state = f"{utc_offset}:{source_offset}"
+
+    conn = connect(cache_path)
+    try:
+        conn.execute("ATTACH DATABASE ? AS src", (source_path,))
+        # 先取得写锁再读水位线：多个进程 / 线程同时汇总时，后来者会等待并看到新的水位线，
+        # 不会把同一段 rowid 重复累加
+        conn.execute("BEGIN IMMEDIATE")
+
+        row = conn.execute("SELECT MAX(rowid) AS MaxId FROM src.PlaybackActivity").fetchone()
+        max_rowid = row["MaxId"] or 0
+
+        watermark = int(get_state(conn, "rollup_watermark", 0))
+        watermark_date = get_state(conn, "rollup_watermark_date")
+
+        if watermark and get_state(conn, "rollup_timezone") != tz_state:
+            print("  [i] 时区配置已变更，重建汇总表")
+            reset_rollup(conn)
+            watermark = 0
+
+        if watermark:
+            check = conn.execute(
+                "SELECT DateCreated FROM src.PlaybackActivity WHERE rowid = ?",
+                (watermark,)
+            ).fetchone()
+            if watermark > max_rowid or not check or str(check["DateCreated"]) != watermark_date:
+                print("  [i] 源数据库已变更，重建汇总表")
+                reset_rollup(conn)
+                watermark = 0
+
+        if max_rowid <= watermark:
+            conn.commit()
+            return 0
+
+        new_rows = conn.execute(
+            "SELECT COUNT(*) AS Cnt FROM src.PlaybackActivity WHERE rowid > ? AND rowid <= ?",
+            (watermark, max_rowid)
+        ).fetchone()["Cnt"]
+
+        params = {"lo": watermark, "hi": max_rowid, "tz": utc_offset, "src": source_offset}
+        conn.execute(INSERT_PLAYS_SQL, params)
+        conn.execute(ROLLUP_DAILY_SQL, params)
+        conn.execute(ROLLUP_HOURLY_SQL, params)
+
+        last = conn.execute(
+            "SELECT DateCreated FROM src.PlaybackActivity WHERE rowid = ?",
+            (max_rowid,)
+        ).fetchone()
+        set_state(conn, "rollup_watermark", max_rowid)
+        set_state(conn, "rollup_watermark_date", last["DateCreated"])
+        set_state(conn, "rollup_timezone", tz_state)
+        conn.commit()
+        return new_rows
+    finally:
+        conn.close()
+
+
+def day_epoch(day, utc_offset=DEFAULT_UTC_OFFSET):
+    """本地日期 YYYY-MM-DD 零点对应的 UTC Epoch（用于 Plays 会话与 HourlyRollup 热力图的区间查询）"""
+    midnight = datetime.datetime.fromisoformat(str(day)).replace(tzinfo=datetime.timezone.utc)
+    return int(midnight.timestamp()) - utc_offset
+
+
+def fingerprint(cache_path):
+    """
+    返回当前汇总数据的指纹（水位线 rowid 与对应时间）
+    汇总内容未变化时指纹不变，可用作报表结果的缓存键
+    """
+    conn = connect(cache_path)
+    try:
+        watermark = get_state(conn, "rollup_watermark", "0")
+        watermark_date = get_state(conn, "rollup_watermark_date", "")
+        return f"{watermark}:{watermark_date}"
+    finally:
+        conn.close()
+
+
+def iter_sessions(cache_path, since_epoch, until_epoch, gap=DEFAULT_SESSION_GAP):
+    """
+    流式切分 [since_epoch, until_epoch) 内的观看会话
+    按 (UserId, Epoch) 顺序逐行读取 Plays（走 idx_plays_user_epoch），
+    同一用户上一条播放结束到下一条开始不超过 gap 秒时并入当前会话，否则产出当前会话。
+    只保留当前会话的状态，内存占用与记录数无关；产出顺序同样按 (UserId, Start)。
+
+    会话字段：
+        UserId / Start / End（UTC Epoch）/ Duration（PlayDuration 之和）/ Plays
+        Episodes：切换到不同剧集单集的次数（同一集断点续播不重复计数）
+        Streak / StreakName：会话内连续观看同一部剧的最多集数及剧名
+    """
+    conn = connect(cache_path)
+    try:
+        rows = conn.execute("""
+            SELECT UserId, Epoch, ItemId, ItemType, DisplayName, SeriesName, PlayDuration
+            FROM Plays
+            WHERE Epoch >= ? AND Epoch < ?
+            ORDER BY UserId, Epoch
+        """, (since_epoch, until_epoch))
+
+        session = None
+        for row in rows:
+            end = row["Epoch"] + max(row["PlayDuration"], 0)
+            if session and (row["UserId"] != session["UserId"] or row["Epoch"] - session["End"] > gap):
+                yield _finish_session(session)
+                session = None
+
+            if session is None:
+                session = {
+                    "UserId": row["UserId"],
+                    "Start": row["Epoch"],
+                    "End": end,
+                    "Duration": 0,
+                    "Plays": 0,
+                    "Episodes": 0,
+                    "Streak": 0,
+                    "StreakName": None,
+                    "_item": None,
+                    "_series": None,
+                    "_run": 0,
+                    "_run_name": None,
+                }
+
+            session["End"] = max(session["End"], end)
+            session["Duration"] += row["PlayDuration"]
+            session["Plays"] += 1
+
+            if row["ItemType"] == "Episode":
+                if row["ItemId"] != session["_item"]:
+                    session["Episodes"] += 1
+                    if row["SeriesName"] == session["_series"]:
+                        session["_run"] += 1
+                    else:
+                        session["_series"] = row["SeriesName"]
+                        session["_run"] = 1
+                        session["_run_name"] = row["DisplayName"]
+                    if session["_run"] > session["Streak"]:
+                        session["Streak"] = session["_run"]
+                        session["StreakName"] = session["_run_name"]
+            else:
+                session["_series"] = None
+                session["_run"] = 0
+            session["_item"] = row["ItemId"]
+
+        if session:
+            yield _finish_session(session)
+    finally:
+        conn.close()
+
+
+def _finish_session(session):
+    """去掉切分过程中的内部状态"""
+    return {k: v for k, v in session.items() if not k.startswith("_")}
+
+
+def summarize_sessions(sessions):
+    """
+    单次遍历会话序列，汇总会话数、剧集会话的平均集数、最长会话与最长连看
+    返回 {"count", "episodes", "avg_episodes", "longest", "streak"}；没有会话时返回 None
+    """
+    count = episodes = episode_sessions = 0
+    longest = streak = None
+    for session in sessions:
+        count += 1
+        if session["Episodes"]:
+            episodes += session["Episodes"]
+            episode_sessions += 1
+        if longest is None or session["Duration"] > longest["Duration"]:
+            longest = session
+        if session["Streak"] and (streak is None or session["Streak"] > streak["Streak"]):
+            streak = session
+
+    if not count:
+        return None
+    return {
+        "count": count,
+        "episodes": episodes,
+        "avg_episodes": episodes / episode_sessions if episode_sessions else 0,
+        "longest": longest,
+        "streak": streak,
+    }
+
+
+def get_upload_url(cache_path, content_hash):
+    """查询相同内容的海报是否已上传过，返回图床 URL"""
+    conn = connect(cache_path)
+    try:
+        row = conn.execute(
+            "SELECT Url FROM UploadCache WHERE ContentHash = ?", (content_hash,)
+        ).fetchone()
+        return row["Url"] if row else None
+    finally:
+        conn.close()
+
+
+def save_upload_url(cache_path, content_hash, url):
+    """记录海报内容哈希对应的图床 URL"""
+    conn = connect(cache_path)
+    try:
+        conn.execute("""
+            INSERT INTO UploadCache (ContentHash, Url, UploadedAt)
+            VALUES (?, ?, datetime('now'))
+            ON CONFLICT (ContentHash) DO UPDATE SET
+                Url = excluded.Url,
+                UploadedAt = excluded.UploadedAt
+        """, (content_hash, url))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def normalize_id(jellyfin_id):
+    """
+    统一 Jellyfin Id（UserId / ItemId）格式：去掉连字符并转小写
+    Playback Reporting 与 Jellyfin 接口返回的 Id 可能一个带连字符一个不带
+    """
+    return (jellyfin_id or "").replace("-", "").lower()
+
+
+# 用户目录沿用的旧名称
+normalize_user_id = normalize_id
+
+
+def load_user_directory(cache_path):
+    """读取用户目录，返回 ({UserId: Name}, 拉取时间戳)；从未拉取时时间戳为 0"""
+    conn = connect(cache_path)
+    try:
+        users = {r["UserId"]: r["Name"] for r in conn.execute("SELECT UserId, Name FROM UserDirectory")}
+        return users, float(get_state(conn, "users_loaded_at", 0))
+    finally:
+        conn.close()
+
+
+def save_user_directory(cache_path, users):
+    """整体替换用户目录并记录拉取时间"""
+    conn = connect(cache_path)
+    try:
+        conn.execute("DELETE FROM UserDirectory")
+        conn.executemany(
+            "INSERT INTO UserDirectory (UserId, Name) VALUES (?, ?)",
+            [(normalize_user_id(user_id), name) for user_id, name in users.items()]
+        )
+        set_state(conn, "users_loaded_at", time.time())
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def load_series_index(cache_path):
+    """读取剧集索引，返回 ([{Id, Name, ParentId, Path, ProviderIds, category}], 建立时间戳)"""
+    conn = connect(cache_path)
+    try:
+        items = [
+            {
+                "Id": r["SeriesId"],
+                "Name": r["Name"],
+                "ParentId": r["ParentId"] or "",
+                "Path": r["Path"] or "",
+                "ProviderIds": json.loads(r["ProviderIds"] or "{}"),
+                "category": r["Category"],
+            }
+            for r in conn.execute("SELECT * FROM SeriesIndex")
+        ]
+        return items, float(get_state(conn, "series_index_at", 0))
+    finally:
+        conn.close()
+
+
+def save_series_index(cache_path, items):
+    """整体替换剧集索引并记录建立时间"""
+    conn = connect(cache_path)
+    try:
+        conn.execute("DELETE FROM SeriesIndex")
+        conn.executemany("""
+            INSERT OR REPLACE INTO SeriesIndex (SeriesId, Name, ParentId, Path, ProviderIds, Category)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, [
+            (item["Id"], item["Name"], item.get("ParentId", ""), item.get("Path", ""),
+             json.dumps(item.get("ProviderIds") or {}), item["category"])
+            for item in items
+        ])
+        set_state(conn, "series_index_at", time.time())
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def load_runtimes(cache_path, item_ids):
+    """读取已缓存的片长，返回 {ItemId: RunTimeTicks}（ItemId 已规范化，未缓存的不返回）"""
+    ids = sorted({normalize_id(item_id) for item_id in item_ids if item_id})
+    conn = connect(cache_path)
+    try:
+        rows = conn.execute("""
+            SELECT ItemId, RunTimeTicks FROM ItemRuntime
+            WHERE ItemId IN (SELECT value FROM json_each(?))
+        """, (json.dumps(ids),))
+        return {r["ItemId"]: r["RunTimeTicks"] for r in rows}
+    finally:
+        conn.close()
+
+
+def save_runtimes(cache_path, runtimes):
+    """写入片长（RunTimeTicks 为 0 表示 Jellyfin 中已不存在或没有片长，不再重复请求）"""
+    conn = connect(cache_path)
+    try:
+        conn.executemany("""
+            INSERT INTO ItemRuntime (ItemId, RunTimeTicks) VALUES (?, ?)
+            ON CONFLICT (ItemId) DO UPDATE SET RunTimeTicks = excluded.RunTimeTicks
+        """, [(normalize_id(item_id), ticks or 0) for item_id, ticks in runtimes.items()])
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def load_week_ranks(cache_path, since_week, until_week):
+    """读取 [since_week, until_week] 内已保存的周榜名次，返回 {WeekStart: {Category: {ItemKey: Rank}}}"""
+    conn = connect(cache_path)
+    try:
+        history = {}
+        for r in conn.execute("""
+            SELECT WeekStart, Category, ItemKey, Rank FROM WeekRanks
+            WHERE WeekStart >= ? AND WeekStart <= ?
+        """, (since_week, until_week)):
+            history.setdefault(r["WeekStart"], {}).setdefault(r["Category"], {})[r["ItemKey"]] = r["Rank"]
+        return history
+    finally:
+        conn.close()
+
+
+def save_week_ranks(cache_path, week_start, ranks):
+    """
+    整体替换某一周的周榜名次
+    ranks 为 {Category: [(ItemKey, Name, PlayDuration, PlayCount)]}，按名次排列
+    """
+    conn = connect(cache_path)
+    try:
+        conn.execute("DELETE FROM WeekRanks WHERE WeekStart = ?", (week_start,))
+        conn.executemany("""
+            INSERT INTO WeekRanks (WeekStart, Category, Rank, ItemKey, Name, PlayDuration, PlayCount)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, [
+            (week_start, category, rank, key, name, dur or 0, cnt or 0)
+            for category, items in ranks.items()
+            for rank, (key, name, dur, cnt) in enumerate(items, 1)
+        ])
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def enqueue_delivery(cache_path, kind, payload):
+    """加入待投递队列，返回记录 Id"""
+    conn = connect(cache_path)
+    try:
+        cur = conn.execute("""
+            INSERT INTO Outbox (Kind, Payload, CreatedAt)
+            VALUES (?, ?, datetime('now'))
+        """, (kind, json.dumps(payload, ensure_ascii=False)))
+        conn.commit()
+        return cur.lastrowid
+    finally:
+        conn.close()
+
+
+def due_deliveries(cache_path, now=None):
+    """
+    返回已到重试时间的待投递记录（Payload 已解析为 dict）
+    认领超时仍处于 sending 的记录（投递进程中途退出）先放回 pending
+    """
+    now = now if now is not None else time.time()
+    conn = connect(cache_path)
+    try:
+        conn.execute("""
+            UPDATE Outbox SET Status = 'pending'
+            WHERE Status = 'sending' AND NextAttemptAt <= ?
+        """, (now,))
+        conn.commit()
+        rows = conn.execute("""
+            SELECT Id, Kind, Payload, Attempts FROM Outbox
+            WHERE Status = 'pending' AND NextAttemptAt <= ?
+            ORDER BY Id
+        """, (now,)).fetchall()
+        return [
+            {"id": r["Id"], "kind": r["Kind"], "payload": json.loads(r["Payload"]), "attempts": r["Attempts"]}
+            for r in rows
+        ]
+    finally:
+        conn.close()
+
+
+def claim_delivery(cache_path, delivery_id, timeout=DEFAULT_CLAIM_TIMEOUT):
+    """
+    认领一条待投递记录（pending -> sending），返回是否认领成功
+    多个进程同时投递时只有一个能认领到同一条记录；
+    认领期间 NextAttemptAt 记为认领超时时间，超时后由 due_deliveries 放回 pending
+    """
+    conn = connect(cache_path)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        cur = conn.execute("""
+            UPDATE Outbox SET Status = 'sending', NextAttemptAt = ?
+            WHERE Id = ? AND Status = 'pending'
+        """, (time.time() + timeout, delivery_id))
+        conn.commit()
+        return cur.rowcount == 1
+    finally:
+        conn.close()
+
+
+def record_delivery(cache_path, delivery_id, payload, status, next_attempt_at=0, error=None):
+    """记录一次投递尝试的结果（status: pending / done / dead）"""
+    conn = connect(cache_path)
+    try:
+        conn.execute("""
+            UPDATE Outbox SET
+                Payload = ?,
+                Status = ?,
+                Attempts = Attempts + 1,
+                NextAttemptAt = ?,
+                LastError = ?
+            WHERE Id = ?
+        """, (json.dumps(payload, ensure_ascii=False), status, next_attempt_at, error, delivery_id))
+        conn.commit()
+    finally:
+        conn.close()
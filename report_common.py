@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+"""
+周榜与年度报告共用的数据访问
+- SQLite 连接（按路径与线程复用）与查询
+- Jellyfin 媒体项解析（进程内缓存，只缓存命中结果）与剧集分页扫描
+- 封面下载（磁盘图片缓存，可被多个渲染进程共享）
+- 用户目录（UserId -> 用户名，缓存库中保存，新用户出现时刷新）
+
+服务器以配置 dict 传入，至少包含 name / jellyfin_url / jellyfin_api_key / cache_db_path。
+requests / PIL 在首次使用时才导入。
+"""
+
+import os
+import time
+import sqlite3
+import threading
+import hashlib
+from pathlib import Path
+from io import BytesIO
+from typing import Dict, Any
+
+import report_cache
+
+# =========================
+# 配置区
+# =========================
+
+DB_CACHE_DIR = os.getenv("DB_CACHE_DIR", "./cache")
+
+# 海报图片磁盘缓存（多个渲染进程共享）
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", f"{DB_CACHE_DIR}/images")
+IMAGE_CACHE_TTL_DAYS = int(os.getenv("IMAGE_CACHE_TTL_DAYS", "7"))
+
+# 用户目录（UserId -> 用户名）缓存有效期（小时）
+USER_DIRECTORY_TTL_HOURS = float(os.getenv("USER_DIRECTORY_TTL_HOURS", "24"))
+
+# 两次拉取 /Users 的最小间隔（秒），避免未知用户或接口故障时反复请求
+USER_DIRECTORY_RETRY_SECONDS = 60
+
+
+# =========================
+# HTTP 会话
+# =========================
+
+# 共享 HTTP 会话（复用连接，常驻模式下保持热连接；首次使用时创建）
+_session = None
+
+
+def get_session():
+    """获取共享的 requests 会话（延迟导入 requests）"""
+    global _session
+    if _session is None:
+        import requests
+        _session = requests.Session()
+    return _session
+
+
+def reset_session():
+    """丢弃共享会话（渲染子进程不复用父进程的 HTTP 连接）"""
+    global _session
+    _session = None
+
+
+# =========================
+# SQLite
+# =========================
+
+# (路径, 线程 Id) -> 连接：每个线程各自复用一条连接，HTTP 服务的并发请求不会在同一连接上交错执行
+_connections: Dict[tuple, sqlite3.Connection] = {}
+_connections_lock = threading.Lock()
+
+
+def get_connection(db_path):
+    """获取当前线程在 db_path 上的数据库连接（按路径与线程复用）"""
+    key = (db_path, threading.get_ident())
+    with _connections_lock:
+        conn = _connections.get(key)
+        if conn is None:
+            _close_dead_thread_connections()
+            conn = sqlite3.connect(db_path, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            _connections[key] = conn
+        return conn
+
+
+def _close_dead_thread_connections():
+    """关闭已结束线程留下的连接（调用方持有 _connections_lock）"""
+    alive = {t.ident for t in threading.enumerate()}
+    for key in [key for key in _connections if key[1] not in alive]:
+        _connections.pop(key).close()
+
+
+def close_connections(db_path=None):
+    """关闭复用的数据库连接（不指定路径时全部关闭），包括其他线程打开的连接"""
+    with _connections_lock:
+        keys = [key for key in _connections if db_path is None or key[0] == db_path]
+        for key in keys:
+            _connections.pop(key).close()
+
+
+def query(sql, params, db_path):
+    """在 db_path 上执行 SQL 查询"""
+    conn = get_connection(db_path)
+    cur = conn.cursor()
+    cur.execute(sql, params)
+    rows = cur.fetchall()
+    cur.close()
+    return rows
+
+
+# =========================
+# Jellyfin 媒体项
+# =========================
+
+_search_cache: Dict[tuple, Any] = {}
+
+
+def search_jellyfin_item(name, item_type, server, with_parent=False):
+    """通过名称搜索 Jellyfin 媒体项，返回 Id（with_parent 时返回 (Id, ParentId)）"""
+    item = resolve_item(name, item_type, server)
+    if with_parent:
+        return item.get("Id"), item.get("ParentId", "")
+    return item.get("Id")
+
+
+def resolve_item(name, item_type, server):
+    """
+    通过名称解析 Jellyfin 媒体项，返回包含 Id / ParentId / Path / ProviderIds 的 dict
+    进程内缓存，只缓存命中结果；未找到时返回空 dict
+    """
+    key = (server["name"], name, item_type)
+    if key in _search_cache:
+        return _search_cache[key]
+    item = _search_jellyfin_item(name, item_type, server)
+    if item.get("Id"):
+        _search_cache[key] = item
+    return item
+
+
+def _search_jellyfin_item(name, item_type, server):
+    """请求 Jellyfin 搜索接口"""
+    try:
+        url = f"{server['jellyfin_url']}/Items"
+        params = {
+            "searchTerm": name,
+            "IncludeItemTypes": item_type,
+            "Recursive": "true",
+            "Limit": 1,
+            "Fields": "ParentId,Path,ProviderIds"
+        }
+        headers = {"X-Emby-Token": server["jellyfin_api_key"]}
+
+        r = get_session().get(url, params=params, headers=headers, timeout=10)
+        if r.status_code == 200:
+            data = r.json()
+            items = data.get("Items", [])
+            if items:
+                item = items[0]
+                return {
+                    "Id": item.get("Id"),
+                    "ParentId": item.get("ParentId", ""),
+                    "Path": item.get("Path", ""),
+                    "ProviderIds": item.get("ProviderIds") or {},
+                }
+    except:
+        pass
+    return {}
+
+
+def fetch_series_page(server, start_index, limit):
+    """请求一页 Series，返回 (Items, TotalRecordCount)"""
+    url = f"{server['jellyfin_url']}/Items"
+    params = {
+        "IncludeItemTypes": "Series",
+        "Recursive": "true",
+        "Fields": "ParentId,Path,ProviderIds",
+        "StartIndex": start_index,
+        "Limit": limit,
+        "EnableImages": "false",
+        "EnableUserData": "false",
+    }
+    headers = {"X-Emby-Token": server["jellyfin_api_key"]}
+    r = get_session().get(url, params=params, headers=headers, timeout=30)
+    r.raise_for_status()
+    data = r.json()
+    return data.get("Items", []), data.get("TotalRecordCount", 0)
+
+
+def fetch_all_series(server, page_size, workers=4):
+    """分页拉取全部 Series：首页得到总数，其余页并发请求；请求失败时抛出异常"""
+    items, total = fetch_series_page(server, 0, page_size)
+    starts = range(page_size, total, page_size)
+    if starts:
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for page, _ in pool.map(lambda start: fetch_series_page(server, start, page_size), starts):
+                items.extend(page)
+    return items
+
+
+def merge_key(item_type, name, item):
+    """
+    跨服务器合并同一作品的键：优先 Tmdb / Imdb / Tvdb 编号，其次规范化名称
+    """
+    provider_ids = {k.lower(): v for k, v in (item.get("ProviderIds") or {}).items() if v}
+    for provider in ("tmdb", "imdb", "tvdb"):
+        if provider in provider_ids:
+            return f"{item_type}:{provider}:{provider_ids[provider]}"
+    return f"{item_type}:name:{name.strip().lower()}"
+
+
+# =========================
+# 图片
+# =========================
+
+def fetch_image_bytes(cache_key, url, headers=None):
+    """
+    下载图片并缓存到 IMAGE_CACHE_DIR
+    缓存按内容来源命名，写入使用临时文件 + 原子替换，可被多个渲染进程共享
+    """
+    path = Path(IMAGE_CACHE_DIR) / f"{hashlib.sha1(cache_key.encode()).hexdigest()}.img"
+    try:
+        if path.exists() and time.time() - path.stat().st_mtime < IMAGE_CACHE_TTL_DAYS * 86400:
+            return path.read_bytes()
+    except OSError:
+        pass
+
+    try:
+        r = get_session().get(url, headers=headers or {}, timeout=10)
+        if r.status_code == 200:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+            tmp_path.write_bytes(r.content)
+            os.replace(tmp_path, path)
+            return r.content
+    except:
+        pass
+    return None
+
+
+def fetch_jellyfin_poster_bytes(item_id, server):
+    """下载 Jellyfin 封面原始字节（经磁盘缓存）"""
+    url = f"{server['jellyfin_url']}/Items/{item_id}/Images/Primary"
+    headers = {"X-Emby-Token": server["jellyfin_api_key"]}
+    return fetch_image_bytes(f"jellyfin:{item_id}", url, headers)
+
+
+def open_image(data):
+    """把图片字节解码为 PIL 图片，失败时返回 None"""
+    if not data:
+        return None
+    from PIL import Image
+    try:
+        return Image.open(BytesIO(data))
+    except Exception:
+        return None
+
+
+def jellyfin_poster(item_id, server):
+    """获取 Jellyfin 封面"""
+    if not item_id:
+        return None
+    return open_image(fetch_jellyfin_poster_bytes(item_id, server))
+
+
+# =========================
+# 用户目录
+# =========================
+
+# 服务器名 -> (用户目录, 拉取时间戳, 上次尝试拉取的时间戳)
+_user_directories: Dict[str, tuple] = {}
+
+
+def fetch_user_directory(server):
+    """一次请求 /Users 拉取全部用户，失败时返回 None"""
+    try:
+        url = f"{server['jellyfin_url']}/Users"
+        headers = {"X-Emby-Token": server["jellyfin_api_key"]}
+        r = get_session().get(url, headers=headers, timeout=10)
+        if r.status_code == 200:
+            return {u["Id"]: u.get("Name", "未知用户") for u in r.json()}
+    except Exception as e:
+        print(f"  [!] [{server['name']}] 获取用户列表失败: {e}")
+    return None
+
+
+def get_user_directory(server, refresh=False):
+    """
+    返回 UserId -> 用户名
+    先读进程内与缓存库中的目录，超过 USER_DIRECTORY_TTL_HOURS 或 refresh 时重新拉取 /Users
+    """
+    cached = _user_directories.get(server["name"])
+    if cached is None:
+        users, loaded_at = report_cache.load_user_directory(server["cache_db_path"])
+        cached = (users, loaded_at, 0)
+
+    users, loaded_at, attempted_at = cached
+    now = time.time()
+    expired = now - loaded_at > USER_DIRECTORY_TTL_HOURS * 3600
+    if (refresh or expired) and now - attempted_at > USER_DIRECTORY_RETRY_SECONDS:
+        attempted_at = now
+        fresh = fetch_user_directory(server)
+        if fresh is not None:
+            report_cache.save_user_directory(server["cache_db_path"], fresh)
+            users = {report_cache.normalize_user_id(k): v for k, v in fresh.items()}
+            loaded_at = now
+
+    _user_directories[server["name"]] = (users, loaded_at, attempted_at)
+    return users
+
+
+def get_user_name(user_id, server):
+    """通过用户目录获取 Jellyfin 用户名；目录里没有时（新用户）刷新一次目录"""
+    key = report_cache.normalize_user_id(user_id)
+    users = get_user_directory(server)
+    if key not in users:
+        users = get_user_directory(server, refresh=True)
+    return users.get(key, "未知用户")
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""
+常驻服务模式
+- 进程常驻，复用 HTTP 会话、字体、剧集解析缓存、SSH 与 SQLite 连接
+- 内置调度：按配置时间运行 周榜 / 年度报告 / 本周放送 任务
+- 支持手动触发：python report_daemon.py --trigger weekly
+
+手动触发通过在 TRIGGER_DIR 下写入同名文件实现，常驻进程轮询到后立即执行，
+Windows 与 Linux 行为一致。
+"""
+
+import os
+import sys
+import time
+import datetime
+import argparse
+import traceback
+from pathlib import Path
+
+import weekly_rank_v3 as weekly
+import annual_report as annual
+import report_pipeline
+
+# =========================
+# 配置区
+# =========================
+
+# 调度时间（留空则不自动运行）
+# daily HH:MM | mon..sun HH:MM | MM-DD HH:MM
+WEEKLY_AT = os.getenv("WEEKLY_AT", "mon 10:00")
+CALENDAR_AT = os.getenv("CALENDAR_AT", "")
+ANNUAL_AT = os.getenv("ANNUAL_AT", "01-01 10:00")
+
+# 手动触发目录
+TRIGGER_DIR = os.getenv("TRIGGER_DIR", f"{weekly.DB_CACHE_DIR}/triggers")
+
+# 轮询间隔（秒）
+POLL_SECONDS = int(os.getenv("POLL_SECONDS", "5"))
+
+WEEKDAYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+
+# 年度报告沿用周榜的数据库、服务器列表与时区配置
+report_pipeline.bind_annual()
+
+
+# =========================
+# 任务
+# =========================
+
+def job_weekly():
+    """上周播放周榜"""
+    weekly.run_weekly()
+
+
+def job_calendar():
+    """本周放送日历"""
+    weekly.run_calendar()
+
+
+def job_annual():
+    """年度报告：1 月运行时统计上一年，其余时间统计当年"""
+    now = datetime.datetime.now(weekly.TIMEZONE)
+    year = now.year - 1 if now.month == 1 else now.year
+
+    weekly.ensure_dirs()
+    if not weekly.prepare_databases():
+        print("  [X] 数据库不可用，跳过年度报告")
+        return
+    annual.main(year)
+
+
+JOBS = {
+    "weekly": (job_weekly, WEEKLY_AT),
+    "calendar": (job_calendar, CALENDAR_AT),
+    "annual": (job_annual, ANNUAL_AT),
+}
+
+
+# =========================
+# 调度
+# =========================
+
+def next_run(spec, now):
+    """根据调度表达式计算下一次运行时间，spec 为空时返回 None"""
+    spec = spec.strip().lower()
+    if not spec:
+        return None
+
+    when, hm = spec.rsplit(" ", 1)
+    hour, minute = (int(x) for x in hm.split(":"))
+    base = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+
+    if when == "daily":
+        candidate = base
+        if candidate <= now:
+            candidate += datetime.timedelta(days=1)
+        return candidate
+
+    if when in WEEKDAYS:
+        days_ahead = (WEEKDAYS.index(when) - now.weekday()) % 7
+        candidate = base + datetime.timedelta(days=days_ahead)
+        if candidate <= now:
+            candidate += datetime.timedelta(days=7)
+        return candidate
+
+    # MM-DD：跳过没有该日期的年份（如非闰年的 02-29）
+    month, day = (int(x) for x in when.split("-"))
+    for year in range(now.year, now.year + 9):
+        try:
+            candidate = base.replace(year=year, month=month, day=day)
+        except ValueError:
+            continue
+        if candidate > now:
+            return candidate
+    raise ValueError(f"无效的调度日期: {spec}")
+
+
+def run_job(name):
+    """执行任务，异常不影响常驻进程"""
+    func = JOBS[name][0]
+    print(f"\n[{datetime.datetime.now(weekly.TIMEZONE):%Y-%m-%d %H:%M:%S}] ▶ 运行任务: {name}")
+    started = time.perf_counter()
+    try:
+        func()
+    except Exception:
+        traceback.print_exc()
+        print(f"  [!] 任务 {name} 失败")
+    print(f"  [i] 任务 {name} 用时 {time.perf_counter() - started:.1f}s")
+
+
+def pop_triggers():
+    """读取并删除手动触发文件"""
+    trigger_dir = Path(TRIGGER_DIR)
+    names = []
+    if trigger_dir.is_dir():
+        for path in sorted(trigger_dir.iterdir()):
+            if path.name in JOBS:
+                names.append(path.name)
+            try:
+                path.unlink()
+            except OSError:
+                pass
+    return names
+
+
+def write_trigger(name):
+    """写入手动触发文件"""
+    Path(TRIGGER_DIR).mkdir(parents=True, exist_ok=True)
+    (Path(TRIGGER_DIR) / name).touch()
+    print(f"已请求运行任务: {name}")
+
+
+def serve():
+    """常驻主循环"""
+    print("=" * 50)
+    print("  Jellyfin 播放报告 · 常驻模式")
+    print("=" * 50)
+
+    weekly.ensure_dirs()
+    Path(TRIGGER_DIR).mkdir(parents=True, exist_ok=True)
+
+    now = datetime.datetime.now(weekly.TIMEZONE)
+    schedule = {name: next_run(spec, now) for name, (_, spec) in JOBS.items()}
+    for name, when in schedule.items():
+        print(f"  - {name}: {when:%Y-%m-%d %H:%M}" if when else f"  - {name}: 未启用")
+    print(f"  手动触发目录: {TRIGGER_DIR}")
+
+    try:
+        while True:
+            for name in pop_triggers():
+                run_job(name)
+
+            # 重试到期的待投递推送
+            try:
+                weekly.flush_outbox()
+            except Exception:
+                traceback.print_exc()
+
+            now = datetime.datetime.now(weekly.TIMEZONE)
+            for name, when in schedule.items():
+                if when and when <= now:
+                    run_job(name)
+                    schedule[name] = next_run(JOBS[name][1], datetime.datetime.now(weekly.TIMEZONE))
+
+            time.sleep(POLL_SECONDS)
+    except KeyboardInterrupt:
+        print("\n已退出")
+    finally:
+        weekly.close_ssh_client()
+        weekly.close_connections()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Jellyfin 播放报告常驻服务")
+    parser.add_argument("--trigger", choices=sorted(JOBS),
+                        help="请求常驻进程立即运行指定任务")
+    parser.add_argument("--once", choices=sorted(JOBS),
+                        help="不进入常驻模式，直接运行一次指定任务")
+    args = parser.parse_args()
+
+    if args.trigger:
+        write_trigger(args.trigger)
+    elif args.once:
+        run_job(args.once)
+    else:
+        serve()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
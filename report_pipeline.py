@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+统一流水线
+- 在一个进程内按需生成 周榜 / 本周放送 / 年度报告 的任意组合
+- 只拉取一次播放数据库，订阅日历只请求一次，周榜与本周放送共用
+- 周榜与年度报告都通过 report_common 使用同一套 SQLite 连接（每个线程一条）、HTTP 会话、剧集解析缓存与磁盘图片缓存
+
+用法：
+    python report_pipeline.py weekly calendar annual [--year 2025] [--text-only]
+
+常驻服务与 HTTP 服务同样通过 bind_annual() 让年度报告沿用周榜的配置。
+"""
+
+import sys
+import argparse
+
+import weekly_rank_v3 as weekly
+import annual_report as annual
+
+OUTPUTS = ("weekly", "calendar", "annual")
+
+
+# =========================
+# 共享配置
+# =========================
+
+def bind_annual():
+    """
+    让年度报告沿用周榜的配置：数据库 / 汇总缓存路径、服务器列表、时区与会话间隔
+    （连接、会话与各类缓存由 report_common 统一提供，不需要绑定）
+    """
+    annual.DB_PATH = weekly.DB_PATH
+    annual.CACHE_DB_PATH = weekly.CACHE_DB_PATH
+    annual.SERVERS = weekly.SERVERS
+    annual.UTC_OFFSET_HOURS = weekly.UTC_OFFSET / 3600
+    annual.SOURCE_UTC_OFFSET_HOURS = (
+        None if weekly.SOURCE_UTC_OFFSET is None else weekly.SOURCE_UTC_OFFSET / 3600
+    )
+    annual.SESSION_GAP_MINUTES = weekly.SESSION_GAP_MINUTES
+
+
+# =========================
+# 流水线
+# =========================
+
+def run(outputs, year=None, text_only=False):
+    """
+    按 outputs 生成报表，返回 {输出: 结果}
+    拉库与订阅日历各只执行一次，供所有输出共用
+    """
+    outputs = [o for o in OUTPUTS if o in outputs]
+    results = {}
+
+    print("=" * 50)
+    print(f"  Jellyfin 播放报告 · 统一流水线（{' / '.join(outputs)}）")
+    print("=" * 50)
+
+    weekly.ensure_dirs()
+    bind_annual()
+
+    try:
+        prepared = False
+        if "weekly" in outputs or "annual" in outputs:
+            print("\n▶ 获取播放数据...")
+            prepared = weekly.prepare_databases()
+            if not prepared:
+                print("  [X] 没有可用的播放数据，跳过周榜与年度报告")
+
+        calendar = None
+        if "calendar" in outputs or ("weekly" in outputs and prepared):
+            calendar = weekly.get_weekly_calendar()
+
+        if "weekly" in outputs and prepared:
+            weekly.run_weekly(text_only=text_only, calendar=calendar, prepared=True)
+            results["weekly"] = True
+
+        if "calendar" in outputs:
+            results["calendar"] = weekly.run_calendar(calendar)
+
+        if "annual" in outputs and prepared:
+            if text_only:
+                print("  [i] 文本模式，跳过年度报告海报")
+            else:
+                results["annual"] = annual.main(year)
+    finally:
+        weekly.close_ssh_client()
+        weekly.close_connections()
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Jellyfin 播放报告统一流水线")
+    parser.add_argument("outputs", nargs="+", choices=OUTPUTS,
+                        help="要生成的报表，可组合")
+    parser.add_argument("--year", type=int, default=None,
+                        help="年度报告年份，默认 annual_report.REPORT_YEAR")
+    parser.add_argument("--text-only", action="store_true",
+                        help="只生成文本，不渲染海报")
+    args = parser.parse_args()
+
+    run(args.outputs, args.year, args.text_only)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
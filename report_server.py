@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+"""
+本地 HTTP 报表服务
+- 按需返回周榜 / 本周放送 / 年度报告的 JSON 数据与海报 PNG
+- 结果按 (报表, 周期, 数据指纹) 缓存，只有底层数据变化时才重新生成
+
+接口：
+    GET /week.json[?start=YYYY-MM-DD]     周榜数据（默认上周）
+    GET /week.png[?start=YYYY-MM-DD]      周榜海报
+    GET /range.json?period=month[&since=YYYY-MM-DD]
+    GET /range.json?since=YYYY-MM-DD[&until=YYYY-MM-DD]
+                                          任意周期 / 区间的榜单数据
+    GET /calendar.json                    本周放送
+    GET /annual.json[?year=YYYY]          年度报告数据（默认今年）
+    GET /annual.png[?year=YYYY]           年度报告海报（默认今年）
+
+服务只读取本地数据库，拉库仍由周榜脚本或常驻模式负责。
+"""
+
+import os
+import json
+import time
+import datetime
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import report_cache
+import poster_output
+import weekly_rank_v3 as weekly
+import annual_report as annual
+import report_pipeline
+
+# =========================
+# 配置区
+# =========================
+
+SERVER_HOST = os.getenv("SERVER_HOST", "127.0.0.1")
+SERVER_PORT = int(os.getenv("SERVER_PORT", "8765"))
+
+# 订阅日历不依赖播放数据库，按时间片缓存（秒）
+CALENDAR_TTL = int(os.getenv("CALENDAR_TTL", "3600"))
+
+# 年度报告沿用周榜的数据库、服务器列表与时区配置
+report_pipeline.bind_annual()
+
+
+# =========================
+# 结果缓存
+# =========================
+
+# (report, period) -> (fingerprint, content_type, body)
+_results = {}
+
+# (report, period) -> 生成锁：同一份结果同一时间只生成一次，不同报表之间互不阻塞
+_build_locks = {}
+_build_locks_guard = threading.Lock()
+
+# 汇总表增量更新同一时间只运行一次
+_rollup_lock = threading.Lock()
+
+
+def build_lock(key):
+    """返回 key 对应的生成锁"""
+    with _build_locks_guard:
+        return _build_locks.setdefault(key, threading.Lock())
+
+
+def cached(report, period, fp, build):
+    """返回缓存结果；指纹变化时重新生成（同一份结果同一时间只生成一份）"""
+    key = (report, period)
+    with build_lock(key):
+        hit = _results.get(key)
+        if hit and hit[0] == fp:
+            return hit[1], hit[2]
+        content_type, body = build()
+        _results[key] = (fp, content_type, body)
+        return content_type, body
+
+
+def data_fingerprint():
+    """吸收新增播放记录后返回汇总数据指纹（多服务器时合并各自的指纹）"""
+    fps = []
+    with _rollup_lock:
+        for server in weekly.SERVERS:
+            if os.path.exists(server["db_path"]):
+                weekly.update_rollup(server)
+            fps.append(report_cache.fingerprint(server["cache_db_path"]))
+    return "/".join(fps)
+
+
+def calendar_fingerprint():
+    """订阅日历的时间片指纹"""
+    return str(int(time.time() // CALENDAR_TTL))
+
+
+def to_json(data):
+    """序列化为 JSON 响应"""
+    body = json.dumps(data, ensure_ascii=False, default=str, indent=2).encode("utf-8")
+    return "application/json; charset=utf-8", body
+
+
+def read_poster(path):
+    """读取海报文件"""
+    with open(path, "rb") as f:
+        return poster_output.content_type(path), f.read()
+
+
+# =========================
+# 报表
+# =========================
+
+def week_payload(start):
+    """周榜数据"""
+    movies, tv_shows, anime, top_user, week_start_str, week_end_str = weekly.get_week_data(start)
+    return {
+        "week_start": week_start_str,
+        "week_end": week_end_str,
+        "movies": movies,
+        "tv_shows": tv_shows,
+        "anime": anime,
+        "top_user": top_user,
+        "heatmap": weekly.get_heatmap(week_start_str),
+        "completion": dict(zip(("movies", "series"), weekly.get_completion_ranking(week_start_str))),
+    }
+
+
+def range_payload(since, until):
+    """任意区间榜单数据"""
+    movies, tv_shows, anime, top_user = weekly.get_range_data(since, until)
+    return {
+        "since": since,
+        "until": until,
+        "movies": movies,
+        "tv_shows": tv_shows,
+        "anime": anime,
+        "top_user": top_user,
+        "heatmap": weekly.get_range_heatmap(since, until),
+    }
+
+
+def get_calendar():
+    """本周放送（按时间片缓存）"""
+    monday = datetime.datetime.now(weekly.TIMEZONE).date()
+    monday -= datetime.timedelta(days=monday.weekday())
+    _, body = cached("calendar", monday.isoformat(), calendar_fingerprint(),
+                     lambda: to_json(weekly.get_weekly_calendar()))
+    return json.loads(body)
+
+
+def build_week_png(start):
+    """渲染周榜海报；默认上周时附带本周放送日历"""
+    movies, tv_shows, anime, top_user, week_start_str, week_end_str = weekly.get_week_data(start)
+    calendar = [] if start else get_calendar()
+    poster_path = weekly.draw_poster_v3(movies, tv_shows, anime, top_user, calendar,
+                                        weekly.get_poster_filename(week_end_str), week_start_str,
+                                        heatmap=weekly.get_heatmap(week_start_str))
+    return read_poster(poster_path)
+
+
+def annual_payload(year):
+    """年度报告数据（不含海报图片）"""
+    monthly_top3, annual_summary, extra_facts = annual.get_annual_data(year)
+    return {
+        "year": year,
+        "monthly_top3": {
+            month: [{"name": item["name"], "duration": item["duration"]} for item in items]
+            for month, items in monthly_top3.items()
+        },
+        "summary": annual_summary,
+        "extra_facts": extra_facts,
+        "heatmap": annual.get_heatmap(year),
+    }
+
+
+def build_annual_png(year):
+    """渲染年度报告海报"""
+    monthly_top3, annual_summary, extra_facts = annual.get_annual_data(year)
+    return read_poster(annual.draw_annual_report(year, monthly_top3, annual_summary, extra_facts,
+                                                 heatmap=annual.get_heatmap(year)))
+
+
+def handle(path, params):
+    """路由请求，返回 (content_type, body)"""
+    start = params.get("start", [None])[0]
+    if start:
+        datetime.date.fromisoformat(start)
+    # 缓存键使用解析后的周一与年份，跨周 / 跨年后默认请求不会命中旧结果
+    week_start_str = weekly.get_week_range(start)[2]
+    year = int(params.get("year", [datetime.datetime.now(weekly.TIMEZONE).year])[0])
+
+    if path == "/week.json":
+        return cached("week.json", week_start_str, data_fingerprint(),
+                      lambda: to_json(week_payload(week_start_str)))
+    if path == "/week.png":
+        # 默认请求附带本周放送日历，与指定 start 的结果分开缓存
+        if start:
+            return cached("week.png", week_start_str, data_fingerprint(),
+                          lambda: build_week_png(week_start_str))
+        fp = data_fingerprint() + "|" + calendar_fingerprint()
+        return cached("week.png", f"{week_start_str}+calendar", fp, lambda: build_week_png(None))
+    if path == "/range.json":
+        since, until, _ = weekly.resolve_range(
+            params.get("since", [None])[0], params.get("until", [None])[0], params.get("period", [None])[0]
+        )
+        return cached("range.json", f"{since}_{until}", data_fingerprint(),
+                      lambda: to_json(range_payload(since, until)))
+    if path == "/calendar.json":
+        return to_json(get_calendar())
+    if path == "/annual.json":
+        return cached("annual.json", str(year), data_fingerprint(),
+                      lambda: to_json(annual_payload(year)))
+    if path == "/annual.png":
+        return cached("annual.png", str(year), data_fingerprint(),
+                      lambda: build_annual_png(year))
+    return None
+
+
+class ReportHandler(BaseHTTPRequestHandler):
+    """报表请求处理"""
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        try:
+            result = handle(url.path, parse_qs(url.query))
+        except ValueError as e:
+            self.send_error(400, str(e))
+            return
+        except Exception as e:
+            self.send_error(500, str(e))
+            return
+
+        if result is None:
+            self.send_error(404)
+            return
+
+        content_type, body = result
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Jellyfin 播放报告 HTTP 服务")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    args = parser.parse_args()
+
+    weekly.ensure_dirs()
+    server = ThreadingHTTPServer((args.host, args.port), ReportHandler)
+    print(f"  [OK] 报表服务已启动: http://{args.host}:{args.port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n已退出")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+待投递队列：两个进程（这里用两个线程模拟）同时 flush 时，同一条推送只发送一次
+"""
+
+import os
+import sys
+import time
+import threading
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import report_cache
+import weekly_rank_v3 as weekly
+
+
+def test_concurrent_flush_sends_once(tmp_path, monkeypatch):
+    cache_path = str(tmp_path / "report_cache.db")
+    monkeypatch.setattr(weekly, "CACHE_DB_PATH", cache_path)
+    monkeypatch.setattr(weekly, "LSKY_TOKEN", "")
+
+    sent = []
+    monkeypatch.setattr(weekly, "send_serverchan", lambda desp, title=None: sent.append(desp) or True)
+
+    # 两次 flush 都先读到同一条 pending 记录，再各自尝试投递
+    barrier = threading.Barrier(2, timeout=10)
+    due_deliveries = report_cache.due_deliveries
+
+    def due_after_both_read(path, now=None):
+        rows = due_deliveries(path, now)
+        barrier.wait()
+        return rows
+
+    monkeypatch.setattr(report_cache, "due_deliveries", due_after_both_read)
+
+    delivery_id = weekly.queue_push("周榜文本")
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(weekly.flush_outbox())) for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert sent == ["周榜文本"]
+    assert sorted(results) == [0, 1]
+    conn = report_cache.connect(cache_path)
+    try:
+        status = conn.execute("SELECT Status FROM Outbox WHERE Id = ?", (delivery_id,)).fetchone()["Status"]
+    finally:
+        conn.close()
+    assert status == "done"
+
+
+def test_stale_claim_returns_to_pending(tmp_path):
+    cache_path = str(tmp_path / "report_cache.db")
+    delivery_id = report_cache.enqueue_delivery(cache_path, "push", {"text": "周榜文本"})
+
+    assert report_cache.claim_delivery(cache_path, delivery_id, timeout=60)
+    assert not report_cache.claim_delivery(cache_path, delivery_id)
+    assert report_cache.due_deliveries(cache_path) == []
+
+    # 认领超时后（进程中途退出）重新可见、可再次认领
+    rows = report_cache.due_deliveries(cache_path, now=time.time() + 120)
+    assert [r["id"] for r in rows] == [delivery_id]
+    assert report_cache.claim_delivery(cache_path, delivery_id)
@@ -4,26 +4,39 @@ Jellyfin 播放周榜 V3（含订阅日历）
 - 电影 / 电视剧 / 番剧 各 Top 3
 - 统计本周片王
 - 本周放送日历（来自 MoviePilot 订阅）
+- 个人周榜：一次扫描为所有用户生成各自的海报（--users）
+- 观看时段热力图：星期 × 小时 的观看时长（来自小时汇总表）
+- 观看会话：最长连看、平均每次观看集数
+- 完播榜：按片长计算完播率（片长批量请求并缓存）
+- 名次变化：与上周保存的榜单比较，标注升降、新上榜与连续上榜周数
 - 全新海报设计
+
+requests / PIL / paramiko 在首次使用时才导入，
+只需要文本榜单时（--text-only）不会加载 PIL。
 """
 
 import sqlite3
-import requests
 import datetime
-import subprocess
 import os
+import re
+import hashlib
+import json
+import argparse
+import time
 from pathlib import Path
-from PIL import Image, ImageDraw, ImageFont
-from io import BytesIO
 from collections import defaultdict
 from typing import Dict, List, Any, Optional
 
-# 尝试导入 paramiko (用于 SSH)
-try:
-    import paramiko
-    HAS_PARAMIKO = True
-except ImportError:
-    HAS_PARAMIKO = False
+import report_cache
+import report_common
+import poster_output
+import poster_layout
+from report_common import (
+    IMAGE_CACHE_DIR, get_session, close_connections,
+    search_jellyfin_item, resolve_item, merge_key, fetch_all_series,
+    fetch_image_bytes, fetch_jellyfin_poster_bytes, jellyfin_poster, open_image,
+    get_user_directory, get_user_name,
+)
 
 # =========================
 # 配置区
@@ -40,6 +53,9 @@ NAS_DB_PATH = os.getenv("NAS_DB_PATH", "")
 DB_CACHE_DIR = os.getenv("DB_CACHE_DIR", "./cache")
 DB_PATH = os.getenv("DB_PATH", f"{DB_CACHE_DIR}/playback_reporting.db")
 
+# 本地汇总缓存（日汇总表，增量维护）
+CACHE_DB_PATH = os.getenv("CACHE_DB_PATH", f"{DB_CACHE_DIR}/report_cache.db")
+
 # Jellyfin 服务器
 JELLYFIN_URL = os.getenv("JELLYFIN_URL", "https://your-jellyfin-server.com")
 JELLYFIN_API_KEY = os.getenv("JELLYFIN_API_KEY", "")
@@ -63,16 +79,59 @@ SITE_NAME = os.getenv("SITE_NAME", "YOUR_SITE_NAME")
 # 榜单配置
 TOP_N = int(os.getenv("TOP_N", "3"))
 
+# 完播榜：单个用户对某部电影 / 某一集的观看时长达到片长的该比例即算看完
+COMPLETION_THRESHOLD = float(os.getenv("COMPLETION_THRESHOLD", "0.9"))
+
+# 计算连续上榜周数时最多回看的周数
+RANK_HISTORY_WEEKS = int(os.getenv("RANK_HISTORY_WEEKS", "12"))
+
+# 批量请求片长时每次请求的 ItemId 数
+RUNTIME_BATCH_SIZE = int(os.getenv("RUNTIME_BATCH_SIZE", "100"))
+
 # 媒体库父项 ID
 LIBRARY_ANIME = os.getenv("LIBRARY_ANIME", "")
 LIBRARY_TV = os.getenv("LIBRARY_TV", "")
 
+# 多台 Jellyfin 服务器（可选）：JSON 数组，或指向 JSON 文件的路径
+# 每项可包含 name / jellyfin_url / jellyfin_api_key / db_path / cache_db_path /
+# nas_host / nas_port / nas_user / nas_password / nas_db_path / library_anime / library_tv
+# 留空时只使用上面的单服务器配置
+JELLYFIN_SERVERS = os.getenv("JELLYFIN_SERVERS", "").strip()
+
 # 时区
 TIMEZONE = datetime.timezone(datetime.timedelta(hours=8))
+UTC_OFFSET = int(TIMEZONE.utcoffset(None).total_seconds())
+
+# 播放数据库中 DateCreated 所在时区（小时），留空表示与 TIMEZONE 相同
+PLAYBACK_DB_UTC_OFFSET_HOURS = os.getenv("PLAYBACK_DB_UTC_OFFSET_HOURS", "").strip()
+SOURCE_UTC_OFFSET = (
+    int(float(PLAYBACK_DB_UTC_OFFSET_HOURS) * 3600) if PLAYBACK_DB_UTC_OFFSET_HOURS else None
+)
 
 # 海报输出目录
 POSTER_DIR = os.getenv("POSTER_DIR", "./posters")
 
+# 图片缓存（IMAGE_CACHE_DIR / IMAGE_CACHE_TTL_DAYS）与年度报告共用，见 report_common.py
+
+# 剧集索引（全部 Series 的媒体库与分类）有效期（小时）与分页大小
+SERIES_INDEX_TTL_HOURS = float(os.getenv("SERIES_INDEX_TTL_HOURS", "24"))
+SERIES_INDEX_PAGE_SIZE = int(os.getenv("SERIES_INDEX_PAGE_SIZE", "500"))
+
+# 未配置 LIBRARY_ANIME / LIBRARY_TV 时，Path 中含这些关键字的剧集归为番剧
+ANIME_PATH_KEYWORDS = [
+    k.strip().lower()
+    for k in os.getenv("ANIME_PATH_KEYWORDS", "anime,animation,番剧,动漫,动画").split(",")
+    if k.strip()
+]
+
+# 用户目录（USER_DIRECTORY_TTL_HOURS）与年度报告共用，见 report_common.py
+
+# 观看会话间隔（分钟）：同一用户两次播放相隔不超过该值时算作同一次观看
+SESSION_GAP_MINUTES = float(os.getenv("SESSION_GAP_MINUTES", "30"))
+
+# 并行渲染进程数
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS") or os.cpu_count() or 1)
+
 # 字体
 FONT_PATH = os.getenv("FONT_PATH", "/usr/share/fonts/truetype/wqy/wqy-microhei.ttc")
 FONT_BOLD_PATH = os.getenv("FONT_BOLD_PATH", FONT_PATH)
@@ -80,6 +139,69 @@ FONT_BOLD_PATH = os.getenv("FONT_BOLD_PATH", FONT_PATH)
 # 是否启用推送（测试时设为 False）
 ENABLE_PUSH = os.getenv("ENABLE_PUSH", "true").strip().lower() in {"1", "true", "yes", "y"}
 
+# 推送失败重试（outbox）
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_UPLOAD_ATTEMPTS = int(os.getenv("OUTBOX_UPLOAD_ATTEMPTS", "3"))
+OUTBOX_BACKOFF_SECONDS = int(os.getenv("OUTBOX_BACKOFF_SECONDS", "300"))
+OUTBOX_BACKOFF_MAX_SECONDS = 6 * 3600
+
+
+def load_servers() -> List[Dict[str, Any]]:
+    """读取服务器列表；未配置 JELLYFIN_SERVERS 时返回单服务器配置"""
+    default = {
+        "name": "default",
+        "jellyfin_url": JELLYFIN_URL,
+        "jellyfin_api_key": JELLYFIN_API_KEY,
+        "db_path": DB_PATH,
+        "cache_db_path": CACHE_DB_PATH,
+        "nas_host": NAS_HOST,
+        "nas_port": NAS_PORT,
+        "nas_user": NAS_USER,
+        "nas_password": NAS_PASSWORD,
+        "nas_db_path": NAS_DB_PATH,
+        "library_anime": LIBRARY_ANIME,
+        "library_tv": LIBRARY_TV,
+    }
+    if not JELLYFIN_SERVERS:
+        return [default]
+    
+    if JELLYFIN_SERVERS.startswith("["):
+        raw = json.loads(JELLYFIN_SERVERS)
+    else:
+        with open(JELLYFIN_SERVERS, encoding="utf-8") as f:
+            raw = json.load(f)
+    
+    servers = []
+    for i, entry in enumerate(raw):
+        name = entry.get("name") or f"server{i + 1}"
+        servers.append({
+            **default,
+            "db_path": f"{DB_CACHE_DIR}/playback_reporting.{name}.db",
+            "cache_db_path": f"{DB_CACHE_DIR}/report_cache.{name}.db",
+            **entry,
+            "name": name,
+        })
+    return servers
+
+
+SERVERS = load_servers()
+
+
+def get_server(server=None) -> Dict[str, Any]:
+    """按名称（或直接传入的配置）取服务器，默认第一台"""
+    if isinstance(server, dict):
+        return server
+    if server:
+        for s in SERVERS:
+            if s["name"] == server:
+                return s
+    return SERVERS[0]
+
+
+def server_label(server) -> str:
+    """多服务器时用于日志的前缀"""
+    return f"[{server['name']}] " if len(SERVERS) > 1 else ""
+
 
 # =========================
 # MoviePilot API 客户端
@@ -97,7 +219,7 @@ class MoviePilotClient:
         """OAuth2 登录获取 access_token"""
         try:
             url = f"{self.base_url}/api/v1/login/access-token"
-            resp = requests.post(url, data={
+            resp = get_session().post(url, data={
                 "username": username,
                 "password": password
             }, timeout=30)
@@ -119,7 +241,7 @@ class MoviePilotClient:
         """获取订阅列表"""
         try:
             url = f"{self.base_url}/api/v1/subscribe/list?token={self.api_token}"
-            resp = requests.get(url, timeout=30)
+            resp = get_session().get(url, timeout=30)
             if resp.status_code == 200:
                 return resp.json()
         except Exception as e:
@@ -130,9 +252,11 @@ class MoviePilotClient:
         """获取剧集信息"""
         try:
             url = f"{self.base_url}/api/v1/tmdb/{tmdbid}/{season}"
-            resp = requests.get(url, headers=self._get_auth_headers(), timeout=30)
+            resp = get_session().get(url, headers=self._get_auth_headers(), timeout=30)
             if resp.status_code == 200:
                 return resp.json()
+            if resp.status_code in (401, 403):
+                self.access_token = None
         except:
             pass
         return []
@@ -142,14 +266,33 @@ class MoviePilotClient:
         try:
             # 使用 media 接口获取电影信息
             url = f"{self.base_url}/api/v1/media/tmdb:{tmdbid}?type_name=%E7%94%B5%E5%BD%B1"
-            resp = requests.get(url, headers=self._get_auth_headers(), timeout=30)
+            resp = get_session().get(url, headers=self._get_auth_headers(), timeout=30)
             if resp.status_code == 200:
                 return resp.json()
+            if resp.status_code in (401, 403):
+                self.access_token = None
         except:
             pass
         return None
 
 
+_moviepilot_client: Optional[MoviePilotClient] = None
+
+
+def get_moviepilot_client() -> Optional[MoviePilotClient]:
+    """获取已登录的 MoviePilot 客户端（复用 access_token，失效时重新登录）"""
+    global _moviepilot_client
+    if _moviepilot_client is None:
+        _moviepilot_client = MoviePilotClient(MOVIEPILOT_URL, MOVIEPILOT_API_TOKEN)
+    
+    if not _moviepilot_client.access_token:
+        if not _moviepilot_client.login(MOVIEPILOT_USERNAME, MOVIEPILOT_PASSWORD):
+            return None
+        print("  [OK] MoviePilot 登录成功")
+    
+    return _moviepilot_client
+
+
 def get_weekly_calendar() -> List[Dict]:
     """
     获取本周放送日历（周一到周日）
@@ -157,15 +300,12 @@ def get_weekly_calendar() -> List[Dict]:
     """
     print("\n📅 正在获取订阅日历...")
     
-    client = MoviePilotClient(MOVIEPILOT_URL, MOVIEPILOT_API_TOKEN)
-    
     # 登录
-    if not client.login(MOVIEPILOT_USERNAME, MOVIEPILOT_PASSWORD):
+    client = get_moviepilot_client()
+    if client is None:
         print("  [!] MoviePilot 登录失败，跳过日历")
         return []
     
-    print("  [OK] MoviePilot 登录成功")
-    
     # 获取订阅
     subscriptions = client.get_subscriptions()
     print(f"  -> 获取到 {len(subscriptions)} 条订阅")
@@ -257,28 +397,65 @@ def ensure_dirs():
     """确保必要的目录存在"""
     Path(DB_CACHE_DIR).mkdir(parents=True, exist_ok=True)
     Path(POSTER_DIR).mkdir(parents=True, exist_ok=True)
+    Path(IMAGE_CACHE_DIR).mkdir(parents=True, exist_ok=True)
+
+
+_ssh_clients: Dict[str, Any] = {}
+
+
+def get_ssh_client(server=None):
+    """获取 SSH 连接（按服务器复用，连接仍存活时不重复握手）"""
+    server = get_server(server)
+    ssh = _ssh_clients.get(server["name"])
+    if ssh is not None:
+        transport = ssh.get_transport()
+        if transport is not None and transport.is_active():
+            return ssh
+        close_ssh_client(server)
+    
+    import paramiko
+    
+    ssh = paramiko.SSHClient()
+    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+    
+    ssh.connect(
+        hostname=server["nas_host"],
+        port=int(server["nas_port"]),
+        username=server["nas_user"],
+        password=server["nas_password"],
+        timeout=30,
+        look_for_keys=False,
+        allow_agent=False
+    )
+    _ssh_clients[server["name"]] = ssh
+    return ssh
+
+
+def close_ssh_client(server=None):
+    """关闭复用的 SSH 连接（不指定服务器时全部关闭）"""
+    names = [get_server(server)["name"]] if server else list(_ssh_clients)
+    for name in names:
+        ssh = _ssh_clients.pop(name, None)
+        if ssh is not None:
+            ssh.close()
 
 
-def fetch_database():
+def fetch_database(server=None):
     """从 NAS 拉取数据库"""
-    print(f"  -> 正在从 NAS 拉取数据库...")
+    server = get_server(server)
+    print(f"  -> {server_label(server)}正在从 NAS 拉取数据库...")
+    
+    try:
+        import paramiko
+        has_paramiko = True
+    except ImportError:
+        has_paramiko = False
     
-    if HAS_PARAMIKO:
+    if has_paramiko:
         try:
-            ssh = paramiko.SSHClient()
-            ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+            ssh = get_ssh_client(server)
             
-            ssh.connect(
-                hostname=NAS_HOST,
-                port=NAS_PORT,
-                username=NAS_USER,
-                password=NAS_PASSWORD,
-                timeout=30,
-                look_for_keys=False,
-                allow_agent=False
-            )
-            
-            stdin, stdout, stderr = ssh.exec_command(f'cat "{NAS_DB_PATH}"')
+            stdin, stdout, stderr = ssh.exec_command(f'cat "{server["nas_db_path"]}"')
             
             file_data = stdout.read()
             error_data = stderr.read()
@@ -286,30 +463,26 @@ def fetch_database():
             if error_data:
                 raise Exception(f"SSH 命令错误: {error_data.decode()}")
             
-            with open(DB_PATH, 'wb') as f:
+            # 数据库文件即将被覆盖，先关闭旧连接
+            close_connections(server["db_path"])
+            with open(server["db_path"], 'wb') as f:
                 f.write(file_data)
             
-            ssh.close()
-            print(f"  [OK] 数据库拉取成功")
+            print(f"  [OK] {server_label(server)}数据库拉取成功")
             return True
             
         except Exception as e:
-            print(f"  [!] 拉取失败: {e}")
+            close_ssh_client(server)
+            print(f"  [!] {server_label(server)}拉取失败: {e}")
             return False
     else:
         print("  [!] 未安装 paramiko")
         return False
 
 
-def query(sql, params=()):
-    """执行 SQL 查询"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cur = conn.cursor()
-    cur.execute(sql, params)
-    rows = cur.fetchall()
-    conn.close()
-    return rows
+def query(sql, params=(), db_path=None):
+    """执行 SQL 查询（默认查询播放数据库）"""
+    return report_common.query(sql, params, db_path or DB_PATH)
 
 
 def sec_to_str(sec: int) -> str:
@@ -324,31 +497,35 @@ def sec_to_str(sec: int) -> str:
         return f"{s}s"
 
 
-def extract_series_name(item_name: str) -> str:
-    """从 Episode 名称提取剧名"""
-    if " - " in item_name:
-        return item_name.split(" - ")[0].strip()
-    return item_name.strip()
-
-
-def classify_by_parent_id(parent_id):
-    """通过媒体库 ParentId 判断剧集类型"""
-    if parent_id == LIBRARY_ANIME:
+def classify_by_parent_id(parent_id, server=None, path=""):
+    """
+    通过媒体库 ParentId 判断剧集类型
+    未配置媒体库 ID 时按 Path 关键字（ANIME_PATH_KEYWORDS）判断
+    """
+    server = get_server(server)
+    if not server["library_anime"] and not server["library_tv"]:
+        lowered = (path or "").lower()
+        return "anime" if any(k in lowered for k in ANIME_PATH_KEYWORDS) else "tv"
+    if parent_id == server["library_anime"]:
         return "anime"
-    elif parent_id == LIBRARY_TV:
+    elif parent_id == server["library_tv"]:
         return "tv"
     else:
         return "tv"
 
 
-def get_week_range():
-    """计算上周的时间范围"""
-    now = datetime.datetime.now(TIMEZONE)
-    weekday = now.weekday()
-    this_monday = (now - datetime.timedelta(days=weekday)).replace(
-        hour=0, minute=0, second=0, microsecond=0
-    )
-    week_start = this_monday - datetime.timedelta(days=7)
+def get_week_range(week_start_str=None):
+    """计算上周（或 week_start_str 所在周）的时间范围"""
+    if week_start_str:
+        day = datetime.datetime.strptime(week_start_str, "%Y-%m-%d").replace(tzinfo=TIMEZONE)
+        week_start = day - datetime.timedelta(days=day.weekday())
+    else:
+        now = datetime.datetime.now(TIMEZONE)
+        weekday = now.weekday()
+        this_monday = (now - datetime.timedelta(days=weekday)).replace(
+            hour=0, minute=0, second=0, microsecond=0
+        )
+        week_start = this_monday - datetime.timedelta(days=7)
     week_end = (week_start + datetime.timedelta(days=6)).replace(
         hour=23, minute=59, second=59, microsecond=999999
     )
@@ -359,101 +536,223 @@ def get_week_range():
     return week_start, week_end, week_start_str, week_end_str
 
 
-def search_jellyfin_item(name, item_type="Series", with_parent=False):
-    """通过名称搜索 Jellyfin 媒体项"""
+# 统计周期：命令行 --period 的取值 -> (海报标题, 英文副标题)
+PERIODS = {
+    "week": ("播放周榜", "Weekly Playback Statistics"),
+    "month": ("播放月榜", "Monthly Playback Statistics"),
+    "quarter": ("播放季榜", "Quarterly Playback Statistics"),
+    "year": ("播放年榜", "Annual Playback Statistics"),
+}
+
+
+def get_period_range(period, anchor_str=None):
+    """
+    计算 anchor_str 所在的完整周期（周 / 月 / 季度 / 年），返回 (since_str, until_str)
+    未指定 anchor_str 时取上一个完整周期（上周 / 上月 / 上季度 / 去年）
+    """
+    if period == "week":
+        _, _, since_str, until_str = get_week_range(anchor_str)
+        return since_str, until_str
+
+    if anchor_str:
+        anchor = datetime.date.fromisoformat(anchor_str)
+    else:
+        today = datetime.datetime.now(TIMEZONE).date()
+        if period == "month":
+            anchor = today.replace(day=1) - datetime.timedelta(days=1)
+        elif period == "quarter":
+            quarter_start = today.replace(month=(today.month - 1) // 3 * 3 + 1, day=1)
+            anchor = quarter_start - datetime.timedelta(days=1)
+        else:
+            anchor = datetime.date(today.year - 1, 1, 1)
+
+    if period == "month":
+        since = anchor.replace(day=1)
+        months = 1
+    elif period == "quarter":
+        since = anchor.replace(month=(anchor.month - 1) // 3 * 3 + 1, day=1)
+        months = 3
+    elif period == "year":
+        since = anchor.replace(month=1, day=1)
+        months = 12
+    else:
+        raise ValueError(f"未知统计周期: {period}")
+
+    month_index = since.month - 1 + months
+    next_start = since.replace(year=since.year + month_index // 12, month=month_index % 12 + 1)
+    return since.isoformat(), (next_start - datetime.timedelta(days=1)).isoformat()
+
+
+def resolve_range(since_str=None, until_str=None, period=None):
+    """
+    命令行区间参数 -> (since_str, until_str, period)
+    --period 时取 --since（或今天之前）所在的完整周期，不接受 --until；
+    否则 --until 缺省为昨天，--since 缺省为上周一（只给 --until 时必须同时给出 --since）
+    """
+    if period:
+        if until_str:
+            raise ValueError("--period 不能与 --until 同时使用（用 --since 指定周期内任意一天）")
+        since_str, until_str = get_period_range(period, since_str)
+        return since_str, until_str, period
+
+    if until_str and not since_str:
+        raise ValueError("指定 --until 时需要同时指定 --since")
+    today = datetime.datetime.now(TIMEZONE).date()
+    until_str = until_str or (today - datetime.timedelta(days=1)).isoformat()
+    since_str = since_str or get_week_range()[2]
+    if datetime.date.fromisoformat(since_str) > datetime.date.fromisoformat(until_str):
+        raise ValueError(f"起始日期晚于结束日期: {since_str} > {until_str}")
+    return since_str, until_str, None
+
+
+# 服务器名 -> (规范化剧名 -> 索引项, 建立时间戳)
+_series_indexes: Dict[str, tuple] = {}
+
+
+def build_series_index(server=None):
+    """
+    分页拉取全部 Series（首页得到总数后其余页并发请求），
+    记录每部剧的媒体库与分类并写入缓存库；失败时返回 None
+    """
+    server = get_server(server)
+    print(f"  -> {server_label(server)}建立剧集索引...")
     try:
-        url = f"{JELLYFIN_URL}/Items"
-        params = {
-            "searchTerm": name,
-            "IncludeItemTypes": item_type,
-            "Recursive": "true",
-            "Limit": 1,
-            "Fields": "ParentId" if with_parent else ""
+        items = fetch_all_series(server, SERIES_INDEX_PAGE_SIZE)
+    except Exception as e:
+        print(f"  [!] {server_label(server)}剧集索引建立失败: {e}")
+        return None
+    
+    index = [
+        {
+            "Id": item["Id"],
+            "Name": item.get("Name", ""),
+            "ParentId": item.get("ParentId", ""),
+            "Path": item.get("Path", ""),
+            "ProviderIds": item.get("ProviderIds") or {},
+            "category": classify_by_parent_id(item.get("ParentId", ""), server, item.get("Path", "")),
         }
-        headers = {"X-Emby-Token": JELLYFIN_API_KEY}
-        
-        r = requests.get(url, params=params, headers=headers, timeout=10)
-        if r.status_code == 200:
-            data = r.json()
-            items = data.get("Items", [])
-            if items:
-                item = items[0]
-                if with_parent:
-                    return item.get("Id"), item.get("ParentId", "")
-                return item.get("Id")
-    except:
-        pass
-    return (None, "") if with_parent else None
+        for item in items
+    ]
+    report_cache.save_series_index(server["cache_db_path"], index)
+    anime_count = sum(1 for item in index if item["category"] == "anime")
+    print(f"  [OK] {server_label(server)}索引 {len(index)} 部剧集（番剧 {anime_count}）")
+    return index
+
+
+def get_series_index(server=None, refresh=False):
+    """
+    返回 规范化剧名 -> 索引项 的内存字典
+    读取缓存库中的索引，超过 SERIES_INDEX_TTL_HOURS 或 refresh 时重新建立
+    """
+    server = get_server(server)
+    cached = _series_indexes.get(server["name"])
+    now = time.time()
+    if cached and not refresh and now - cached[1] <= SERIES_INDEX_TTL_HOURS * 3600:
+        return cached[0]
+    
+    items, built_at = report_cache.load_series_index(server["cache_db_path"])
+    if refresh or now - built_at > SERIES_INDEX_TTL_HOURS * 3600:
+        fresh = build_series_index(server)
+        if fresh is not None:
+            items = fresh
+        # 建立失败时沿用缓存库中的旧索引（可能为空，此时逐部请求 Jellyfin），到期前不再重试
+        built_at = now
+    
+    by_name = {}
+    for item in items:
+        by_name.setdefault(normalize_name(item["Name"]), item)
+    _series_indexes[server["name"]] = (by_name, built_at)
+    return by_name
+
+
+def normalize_name(name):
+    """剧名比较用的规范化形式"""
+    return (name or "").strip().lower()
+
+
+_font_cache: Dict[tuple, Any] = {}
+
 
+def load_font(path, size):
+    """加载字体（每个进程内只解析一次）"""
+    key = (path, size)
+    if key not in _font_cache:
+        from PIL import ImageFont
+        _font_cache[key] = ImageFont.truetype(path, size)
+    return _font_cache[key]
 
-def jellyfin_poster(item_id):
-    """获取 Jellyfin 封面"""
-    url = f"{JELLYFIN_URL}/Items/{item_id}/Images/Primary"
-    headers = {"X-Emby-Token": JELLYFIN_API_KEY}
+
+def update_rollup(server=None):
+    """将新增播放记录增量汇总到本地缓存"""
+    server = get_server(server)
+    print(f"  -> {server_label(server)}更新日汇总表...")
     try:
-        r = requests.get(url, headers=headers, timeout=10)
-        if r.status_code == 200:
-            return Image.open(BytesIO(r.content))
-    except:
-        pass
-    return None
+        new_rows = report_cache.update_rollup(
+            server["db_path"], server["cache_db_path"], UTC_OFFSET, SOURCE_UTC_OFFSET
+        )
+        print(f"  [OK] {server_label(server)}新增汇总 {new_rows} 条记录")
+        return True
+    except sqlite3.Error as e:
+        print(f"  [!] {server_label(server)}汇总失败: {e}")
+        return False
 
 
-def add_rounded_corners(img, radius):
-    """为图片添加圆角"""
-    mask = Image.new('L', img.size, 0)
-    draw = ImageDraw.Draw(mask)
-    draw.rounded_rectangle([(0, 0), img.size], radius=radius, fill=255)
-    output = Image.new('RGBA', img.size, (0, 0, 0, 0))
-    output.paste(img.convert('RGBA'), mask=mask)
-    return output
+def prepare_server(server=None):
+    """拉取单台服务器的数据库（失败时使用缓存）并更新汇总表"""
+    server = get_server(server)
+    if not fetch_database(server):
+        print(f"  [!] {server_label(server)}数据库拉取失败，尝试使用缓存")
+        if not os.path.exists(server["db_path"]):
+            print(f"  [X] {server_label(server)}缓存也不存在")
+            return False
+    return update_rollup(server)
 
 
-def get_week_data():
-    """统计本周播放数据"""
-    week_start, week_end, week_start_str, week_end_str = get_week_range()
-    
-    since = week_start.isoformat()
-    until = week_end.isoformat()
+# 本次参与统计的服务器（prepare_databases 之后只包含拉库 / 汇总成功的服务器）
+_available_servers: Optional[List[Dict[str, Any]]] = None
 
-    print("\n📊 正在统计播放数据...")
 
-    # 1. 电影榜
-    print("  -> 统计电影...")
-    movies = query("""
-        SELECT
-            ItemName AS Name,
-            ItemId,
-            COUNT(*) AS cnt,
-            SUM(PlayDuration) AS dur
-        FROM PlaybackActivity
-        WHERE ItemType = 'Movie'
-          AND DateCreated >= ?
-          AND DateCreated <= ?
-        GROUP BY ItemName
-        ORDER BY dur DESC, cnt DESC
-        LIMIT ?
-    """, (since, until, TOP_N))
+def available_servers() -> List[Dict[str, Any]]:
+    """
+    参与统计的服务器
+    prepare_databases 之后为本次可用的服务器；未拉库时（如 HTTP 服务）为汇总缓存已存在的服务器
+    """
+    if _available_servers is not None:
+        return _available_servers
+    return [s for s in SERVERS if os.path.exists(s["cache_db_path"])]
 
-    # 2. 剧集
-    print("  -> 统计剧集...")
-    raw_eps = query("""
-        SELECT
-            ItemName AS Name,
-            ItemId,
-            COUNT(*) AS cnt,
-            SUM(PlayDuration) AS dur
-        FROM PlaybackActivity
-        WHERE ItemType = 'Episode'
-          AND DateCreated >= ?
-          AND DateCreated <= ?
-        GROUP BY ItemName
-    """, (since, until))
 
+def prepare_databases():
+    """
+    拉取数据库并更新汇总表；多台服务器时并发执行，至少一台可用即可继续
+    返回本次可用的服务器列表（全部不可用时为空列表），之后的统计只遍历这些服务器
+    """
+    global _available_servers
+    
+    if len(SERVERS) == 1:
+        results = [prepare_server(SERVERS[0])]
+    else:
+        from concurrent.futures import ThreadPoolExecutor
+        
+        with ThreadPoolExecutor(max_workers=len(SERVERS)) as pool:
+            results = list(pool.map(prepare_server, SERVERS))
+    
+    _available_servers = [s for s, ok in zip(SERVERS, results) if ok]
+    failed = [s["name"] for s, ok in zip(SERVERS, results) if not ok]
+    if failed and _available_servers:
+        print(f"  [!] 以下服务器不可用，本次不计入: {', '.join(failed)}")
+    return _available_servers
+
+
+def aggregate_series(raw_eps):
+    """
+    整理按剧集分组的记录（汇总表已写入 SeriesName，SQL 中直接按剧集 GROUP BY）
+    同一剧名出现多次时（如跨周 / 跨用户合并）累加
+    """
     series_data = {}
     
     for r in raw_eps:
-        series_name = extract_series_name(r["Name"])
+        series_name = r["Name"]
         if series_name not in series_data:
             series_data[series_name] = {
                 "Name": series_name,
@@ -464,27 +763,306 @@ def get_week_data():
             }
         series_data[series_name]["cnt"] += r["cnt"]
         series_data[series_name]["dur"] += r["dur"]
+    return series_data
 
-    print("  -> 分类剧集...")
-    tv_shows_list = []
-    anime_list = []
+
+def resolve_series(series_data, server=None):
+    """在 Jellyfin 中解析剧集，补充 SeriesId / 分类 / 所在服务器 / 合并键"""
+    server = get_server(server)
+    entries = []
+    
+    index = get_series_index(server)
     
     for series_name, data in series_data.items():
-        result = search_jellyfin_item(series_name, "Series", with_parent=True)
-        series_id, parent_id = result if result else (None, "")
+        # 优先查本地剧集索引，索引里没有（新入库或索引不可用）时再请求 Jellyfin
+        item = index.get(normalize_name(series_name)) or resolve_item(series_name, "Series", server)
+        series_id = item.get("Id")
         
-        category = classify_by_parent_id(parent_id)
+        category = item.get("category") or classify_by_parent_id(
+            item.get("ParentId", ""), server, item.get("Path", "")
+        )
         
+        entry = {**data, "Server": server["name"], "key": merge_key("Series", series_name, item)}
         if series_id:
-            if category == "anime":
-                anime_list.append({**data, "SeriesId": series_id})
-            else:
-                tv_shows_list.append({**data, "SeriesId": series_id})
+            entry["SeriesId"] = series_id
+            entry["category"] = category
         else:
-            tv_shows_list.append(data)
+            entry["category"] = "tv"
+        entries.append(entry)
+    return entries
+
+
+def split_by_category(entries):
+    """按分类拆分为电视剧 / 番剧并各取 Top N"""
+    tv_shows_list = [e for e in entries if e["category"] != "anime"]
+    anime_list = [e for e in entries if e["category"] == "anime"]
 
     tv_shows = sorted(tv_shows_list, key=lambda x: (x["dur"], x["cnt"]), reverse=True)[:TOP_N]
     anime = sorted(anime_list, key=lambda x: (x["dur"], x["cnt"]), reverse=True)[:TOP_N]
+    return tv_shows, anime
+
+
+def rank_series(raw_eps, server=None):
+    """按剧集聚合单集记录，并按媒体库分类为电视剧 / 番剧"""
+    return split_by_category(resolve_series(aggregate_series(raw_eps), server))
+
+
+def merge_entries(entries):
+    """合并多台服务器中合并键相同的条目，海报与分类取播放时长最多的那台"""
+    merged = {}
+    for entry in sorted(entries, key=lambda x: x["dur"], reverse=True):
+        key = entry["key"]
+        if key not in merged:
+            merged[key] = dict(entry)
+        else:
+            merged[key]["cnt"] += entry["cnt"]
+            merged[key]["dur"] += entry["dur"]
+    return list(merged.values())
+
+
+def rank_cache_path():
+    """
+    保存周榜名次历史的缓存库
+    单服务器时为该服务器的缓存库；多服务器的榜单是合并结果，不属于任何一台，统一存放在 CACHE_DB_PATH
+    """
+    return SERVERS[0]["cache_db_path"] if len(SERVERS) == 1 else CACHE_DB_PATH
+
+
+def apply_rank_history(week_start_str, movies, tv_shows, anime):
+    """
+    与已保存的往周榜单比较，为每个条目写入：
+        trend：名次变化（正数为上升），上周有榜单但未上榜时为 "new"，上周没有记录时为 None
+        streak：连续上榜周数（含本周）
+    只读取已保存的名次，不写入；不重新扫描往周的播放记录
+    """
+    week_start = datetime.date.fromisoformat(week_start_str)
+    weeks = [
+        (week_start - datetime.timedelta(weeks=n)).isoformat()
+        for n in range(1, RANK_HISTORY_WEEKS + 1)
+    ]
+    history = report_cache.load_week_ranks(rank_cache_path(), weeks[-1], weeks[0])
+
+    for category, items in (("Movie", movies), ("TV", tv_shows), ("Anime", anime)):
+        for rank, item in enumerate(items, 1):
+            key = normalize_name(item["Name"])
+            last_week = history.get(weeks[0])
+            if last_week is None:
+                item["trend"] = None
+            elif key in last_week.get(category, {}):
+                item["trend"] = last_week[category][key] - rank
+            else:
+                item["trend"] = "new"
+
+            streak = 1
+            for week in weeks:
+                if key not in history.get(week, {}).get(category, {}):
+                    break
+                streak += 1
+            item["streak"] = streak
+
+
+def save_rank_history(week_start_str, movies, tv_shows, anime):
+    """保存本周各榜单的名次，供之后的周榜比较（只在生成周榜与补生成历史周榜时调用）"""
+    ranks = {
+        category: [
+            (normalize_name(item["Name"]), item["Name"], item.get("dur"), item.get("cnt"))
+            for item in items
+        ]
+        for category, items in (("Movie", movies), ("TV", tv_shows), ("Anime", anime))
+    }
+    report_cache.save_week_ranks(rank_cache_path(), week_start_str, ranks)
+
+
+def trend_label(item):
+    """名次变化的文字标注：↑2 / ↓1 / 新上榜 / 连续 N 周，无变化或无历史时为空"""
+    trend = item.get("trend")
+    if trend == "new":
+        return "新上榜"
+    if trend:
+        return f"↑{trend}" if trend > 0 else f"↓{-trend}"
+    if item.get("streak", 1) > 1:
+        return f"连续 {item['streak']} 周"
+    return ""
+
+
+def fetch_runtimes(item_ids, server=None):
+    """
+    按 RUNTIME_BATCH_SIZE 分批请求 /Items?Ids=，返回 {ItemId: RunTimeTicks}
+    批次内 Jellyfin 没有返回的条目记为 0；请求失败的批次不返回，下次运行重试
+    """
+    server = get_server(server)
+    url = f"{server['jellyfin_url']}/Items"
+    headers = {"X-Emby-Token": server["jellyfin_api_key"]}
+    runtimes = {}
+    for i in range(0, len(item_ids), RUNTIME_BATCH_SIZE):
+        batch = item_ids[i:i + RUNTIME_BATCH_SIZE]
+        try:
+            params = {
+                "Ids": ",".join(batch),
+                "EnableImages": "false",
+                "EnableUserData": "false",
+            }
+            r = get_session().get(url, params=params, headers=headers, timeout=30)
+            r.raise_for_status()
+        except Exception as e:
+            print(f"  [!] {server_label(server)}获取片长失败: {e}")
+            continue
+        found = {
+            report_cache.normalize_id(item["Id"]): item.get("RunTimeTicks") or 0
+            for item in r.json().get("Items", [])
+        }
+        runtimes.update({item_id: found.get(item_id, 0) for item_id in batch})
+    return runtimes
+
+
+def get_runtimes(item_ids, server=None):
+    """
+    返回 {ItemId: 片长秒数}（ItemId 已规范化）
+    先读缓存库，只对未缓存的 ItemId 批量请求，结果写回缓存
+    """
+    server = get_server(server)
+    item_ids = sorted({report_cache.normalize_id(i) for i in item_ids if i})
+    runtimes = report_cache.load_runtimes(server["cache_db_path"], item_ids)
+    missing = [i for i in item_ids if i not in runtimes]
+    if missing:
+        print(f"  -> {server_label(server)}请求 {len(missing)} 个条目的片长...")
+        fresh = fetch_runtimes(missing, server)
+        if fresh:
+            report_cache.save_runtimes(server["cache_db_path"], fresh)
+            runtimes.update(fresh)
+    return {item_id: ticks / 10_000_000 for item_id, ticks in runtimes.items()}
+
+
+def get_completion_ranking(week_start_str=None):
+    """
+    完播榜（默认上周）
+    按 (用户, 电影 / 单集) 汇总观看时长，除以片长得到完播率（上限 1，断点续播会合并计算），
+    再按电影 / 剧集汇总：完播人次（完播率 >= COMPLETION_THRESHOLD）与平均完播率
+    返回 (movies, series)，条目为 {"Name", "ItemType", "finished", "views", "completion"}
+    """
+    _, _, week_start_str, week_end_str = get_week_range(week_start_str)
+    since_epoch = report_cache.day_epoch(week_start_str, UTC_OFFSET)
+    until_epoch = report_cache.day_epoch(week_end_str, UTC_OFFSET) + 86400
+
+    titles = {}
+    for server in available_servers():
+        rows = query("""
+            SELECT
+                UserId,
+                ItemId,
+                ItemType,
+                MAX(DisplayName) AS Name,
+                SeriesName,
+                SUM(PlayDuration) AS dur
+            FROM Plays
+            WHERE Epoch >= ?
+              AND Epoch < ?
+              AND ItemType IN ('Movie', 'Episode')
+              AND ItemId != ''
+            GROUP BY UserId, ItemId
+        """, (since_epoch, until_epoch), db_path=server["cache_db_path"])
+        if not rows:
+            continue
+
+        runtimes = get_runtimes([r["ItemId"] for r in rows], server)
+        for r in rows:
+            runtime = runtimes.get(report_cache.normalize_id(r["ItemId"]))
+            if not runtime:
+                continue
+            ratio = min(1.0, r["dur"] / runtime)
+            title = titles.setdefault((r["ItemType"], r["SeriesName"]), {
+                "Name": r["Name"],
+                "ItemType": r["ItemType"],
+                "finished": 0,
+                "views": 0,
+                "ratio_sum": 0.0,
+            })
+            title["views"] += 1
+            title["ratio_sum"] += ratio
+            if ratio >= COMPLETION_THRESHOLD:
+                title["finished"] += 1
+
+    ranked = sorted(
+        (
+            {
+                "Name": t["Name"],
+                "ItemType": t["ItemType"],
+                "finished": t["finished"],
+                "views": t["views"],
+                "completion": t["ratio_sum"] / t["views"],
+            }
+            for t in titles.values()
+        ),
+        key=lambda x: (x["finished"], x["completion"]),
+        reverse=True,
+    )
+    movies = [t for t in ranked if t["ItemType"] == "Movie"][:TOP_N]
+    series = [t for t in ranked if t["ItemType"] == "Episode"][:TOP_N]
+    return movies, series
+
+
+def rank_movies(raw_movies):
+    """电影榜排序"""
+    return sorted(
+        (dict(r) for r in raw_movies),
+        key=lambda x: (x["dur"], x["cnt"]),
+        reverse=True
+    )[:TOP_N]
+
+
+def get_week_data(week_start_str=None):
+    """统计本周播放数据（读取日汇总表），并与往周榜单比较名次变化（不保存名次）"""
+    week_start, week_end, week_start_str, week_end_str = get_week_range(week_start_str)
+    movies, tv_shows, anime, top_user = get_range_data(week_start_str, week_end_str)
+    apply_rank_history(week_start_str, movies, tv_shows, anime)
+    return movies, tv_shows, anime, top_user, week_start_str, week_end_str
+
+
+def get_range_data(since, until):
+    """
+    统计任意日期区间 [since, until]（YYYY-MM-DD，含首尾两天）的播放数据
+    返回 (movies, tv_shows, anime, top_user)；查询均走汇总表的 Day 索引
+    """
+    print(f"\n📊 正在统计 {since} ~ {until} 的播放数据...")
+
+    if len(SERVERS) > 1:
+        return get_week_data_multi(since, until)
+
+    # 1. 电影榜
+    print("  -> 统计电影...")
+    raw_movies = query("""
+        SELECT
+            MAX(DisplayName) AS Name,
+            MAX(ItemId) AS ItemId,
+            SUM(PlayCount) AS cnt,
+            SUM(PlayDuration) AS dur
+        FROM DailyRollup
+        WHERE ItemType = 'Movie'
+          AND Day >= ?
+          AND Day <= ?
+        GROUP BY SeriesName
+        ORDER BY dur DESC, cnt DESC
+        LIMIT ?
+    """, (since, until, TOP_N), db_path=CACHE_DB_PATH)
+    movies = rank_movies(raw_movies)
+
+    # 2. 剧集
+    print("  -> 统计剧集...")
+    raw_eps = query("""
+        SELECT
+            MAX(DisplayName) AS Name,
+            MAX(ItemId) AS ItemId,
+            SUM(PlayCount) AS cnt,
+            SUM(PlayDuration) AS dur
+        FROM DailyRollup
+        WHERE ItemType = 'Episode'
+          AND Day >= ?
+          AND Day <= ?
+        GROUP BY SeriesName
+    """, (since, until), db_path=CACHE_DB_PATH)
+
+    print("  -> 分类剧集...")
+    tv_shows, anime = rank_series(raw_eps)
 
     # 3. 本周片王
     print("  -> 统计本周片王...")
@@ -492,37 +1070,292 @@ def get_week_data():
         SELECT
             UserId,
             SUM(PlayDuration) AS total_dur
-        FROM PlaybackActivity
-        WHERE DateCreated >= ?
-          AND DateCreated <= ?
+        FROM DailyRollup
+        WHERE Day >= ?
+          AND Day <= ?
         GROUP BY UserId
         ORDER BY total_dur DESC
         LIMIT 1
-    """, (since, until))
+    """, (since, until), db_path=CACHE_DB_PATH)
 
     top_user = None
     if top_users:
-        user_id = top_users[0]["UserId"]
-        total_dur = top_users[0]["total_dur"]
-        
-        try:
-            url = f"{JELLYFIN_URL}/Users/{user_id}"
-            headers = {"X-Emby-Token": JELLYFIN_API_KEY}
-            r = requests.get(url, headers=headers, timeout=10)
-            if r.status_code == 200:
-                user_data = r.json()
-                user_name = user_data.get("Name", "Unknown")
-            else:
-                user_name = "Unknown"
-        except:
-            user_name = "Unknown"
-        
         top_user = {
-            "name": user_name,
-            "duration": total_dur
+            "name": get_user_name(top_users[0]["UserId"], get_server()),
+            "duration": top_users[0]["total_dur"]
         }
 
-    return movies, tv_shows, anime, top_user, week_start_str, week_end_str
+    return movies, tv_shows, anime, top_user
+
+
+def collect_server_week(server, since, until):
+    """
+    统计单台服务器一周的电影 / 剧集 / 用户时长
+    不截取 Top N，并为每个作品解析合并键，供跨服务器合并
+    """
+    cache_db_path = server["cache_db_path"]
+    
+    raw_movies = query("""
+        SELECT
+            MAX(DisplayName) AS Name,
+            SUM(PlayCount) AS cnt,
+            SUM(PlayDuration) AS dur
+        FROM DailyRollup
+        WHERE ItemType = 'Movie'
+          AND Day >= ?
+          AND Day <= ?
+        GROUP BY SeriesName
+    """, (since, until), db_path=cache_db_path)
+    movies = []
+    for r in raw_movies:
+        item = resolve_item(r["Name"], "Movie", server)
+        movies.append({
+            **dict(r),
+            "MovieId": item.get("Id"),
+            "Server": server["name"],
+            "key": merge_key("Movie", r["Name"], item),
+        })
+    
+    raw_eps = query("""
+        SELECT
+            MAX(DisplayName) AS Name,
+            MAX(ItemId) AS ItemId,
+            SUM(PlayCount) AS cnt,
+            SUM(PlayDuration) AS dur
+        FROM DailyRollup
+        WHERE ItemType = 'Episode'
+          AND Day >= ?
+          AND Day <= ?
+        GROUP BY SeriesName
+    """, (since, until), db_path=cache_db_path)
+    series = resolve_series(aggregate_series(raw_eps), server)
+    
+    users = defaultdict(int)
+    for r in query("""
+        SELECT
+            UserId,
+            SUM(PlayDuration) AS total_dur
+        FROM DailyRollup
+        WHERE Day >= ?
+          AND Day <= ?
+        GROUP BY UserId
+    """, (since, until), db_path=cache_db_path):
+        users[get_user_name(r["UserId"], server)] += r["total_dur"]
+    
+    print(f"  -> {server_label(server)}电影 {len(movies)} / 剧集 {len(series)} / 用户 {len(users)}")
+    return movies, series, users
+
+
+def get_week_data_multi(since, until):
+    """
+    并发统计所有服务器，再合并为一份榜单
+    同一作品按 Tmdb / Imdb / Tvdb 编号（没有时按名称）合并，同名用户时长相加
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    
+    servers = available_servers()
+    if not servers:
+        return [], [], [], None
+    
+    print(f"  -> 并发统计 {len(servers)} 台服务器...")
+    with ThreadPoolExecutor(max_workers=len(servers)) as pool:
+        results = list(pool.map(lambda s: collect_server_week(s, since, until), servers))
+    
+    movies = rank_movies(merge_entries([m for r in results for m in r[0]]))
+    tv_shows, anime = split_by_category(merge_entries([s for r in results for s in r[1]]))
+    
+    users = defaultdict(int)
+    for _, _, server_users in results:
+        for name, dur in server_users.items():
+            users[name] += dur
+    
+    top_user = None
+    if users:
+        name = max(users, key=users.get)
+        top_user = {"name": name, "duration": users[name]}
+    
+    return movies, tv_shows, anime, top_user
+
+
+def get_weeks_data(since_str, until_str, save_ranks=False):
+    """
+    一次扫描汇总表，计算区间内每一周（周一至周日）的榜单
+    返回按周排序的 (movies, tv_shows, anime, top_user, week_start_str, week_end_str) 列表
+    save_ranks 时按周依次保存名次，后一周即可与刚补出的前一周比较
+    """
+    since = datetime.date.fromisoformat(since_str)
+    until = datetime.date.fromisoformat(until_str)
+    since = since - datetime.timedelta(days=since.weekday())
+    until = until + datetime.timedelta(days=6 - until.weekday())
+
+    print(f"\n📊 正在统计 {since} ~ {until} 的每周数据...")
+
+    if len(SERVERS) > 1:
+        # 多服务器需要逐周合并，不走单次扫描
+        results = []
+        week = since
+        while week <= until:
+            data = get_week_data(week.isoformat())
+            if any(data[:3]):
+                if save_ranks:
+                    save_rank_history(data[4], *data[:3])
+                results.append(data)
+            week += datetime.timedelta(days=7)
+        return results
+
+    rows = query("""
+        SELECT
+            DATE(Day, 'weekday 0', '-6 days') AS WeekStart,
+            MAX(DisplayName) AS Name,
+            ItemType,
+            MAX(ItemId) AS ItemId,
+            SUM(PlayCount) AS cnt,
+            SUM(PlayDuration) AS dur
+        FROM DailyRollup
+        WHERE ItemType IN ('Movie', 'Episode')
+          AND Day >= ?
+          AND Day <= ?
+        GROUP BY WeekStart, ItemType, SeriesName
+    """, (since.isoformat(), until.isoformat()), db_path=CACHE_DB_PATH)
+
+    user_rows = query("""
+        SELECT
+            DATE(Day, 'weekday 0', '-6 days') AS WeekStart,
+            UserId,
+            SUM(PlayDuration) AS total_dur
+        FROM DailyRollup
+        WHERE Day >= ?
+          AND Day <= ?
+        GROUP BY WeekStart, UserId
+    """, (since.isoformat(), until.isoformat()), db_path=CACHE_DB_PATH)
+
+    weeks = defaultdict(lambda: {"Movie": [], "Episode": []})
+    for r in rows:
+        weeks[r["WeekStart"]][r["ItemType"]].append(r)
+
+    top_users = {}
+    for r in user_rows:
+        best = top_users.get(r["WeekStart"])
+        if best is None or r["total_dur"] > best["total_dur"]:
+            top_users[r["WeekStart"]] = r
+
+    results = []
+    for week_start_str in sorted(weeks):
+        week_end_str = (
+            datetime.date.fromisoformat(week_start_str) + datetime.timedelta(days=6)
+        ).isoformat()
+        movies = rank_movies(weeks[week_start_str]["Movie"])
+        tv_shows, anime = rank_series(weeks[week_start_str]["Episode"])
+        apply_rank_history(week_start_str, movies, tv_shows, anime)
+        if save_ranks:
+            save_rank_history(week_start_str, movies, tv_shows, anime)
+
+        top_user = None
+        if week_start_str in top_users:
+            top_user = {
+                "name": get_user_name(top_users[week_start_str]["UserId"], get_server()),
+                "duration": top_users[week_start_str]["total_dur"]
+            }
+
+        results.append((movies, tv_shows, anime, top_user, week_start_str, week_end_str))
+        print(f"  -> {week_start_str}: 电影 {len(movies)} / 电视剧 {len(tv_shows)} / 番剧 {len(anime)}")
+
+    return results
+
+
+def get_heatmaps(since_str, until_str):
+    """
+    区间内每周的 星期 × 小时 观看时长矩阵（7×24，单位秒，周一为第 0 行）
+    直接对小时汇总表的 (周, Weekday, Hour) 分桶求和（按 Epoch 索引做区间扫描），每台服务器一次查询
+    返回 {week_start_str: grid}
+    """
+    since_epoch = report_cache.day_epoch(since_str, UTC_OFFSET)
+    until_epoch = report_cache.day_epoch(until_str, UTC_OFFSET) + 86400
+    grids = defaultdict(lambda: [[0] * 24 for _ in range(7)])
+    for server in available_servers():
+        rows = query("""
+            SELECT
+                DATE(Day, 'weekday 0', '-6 days') AS WeekStart,
+                Weekday,
+                Hour,
+                SUM(PlayDuration) AS dur
+            FROM HourlyRollup
+            WHERE Epoch >= ?
+              AND Epoch < ?
+            GROUP BY WeekStart, Weekday, Hour
+        """, (since_epoch, until_epoch), db_path=server["cache_db_path"])
+        for r in rows:
+            grids[r["WeekStart"]][r["Weekday"]][r["Hour"]] += r["dur"]
+    return dict(grids)
+
+
+def get_heatmap(week_start_str=None):
+    """单周的 星期 × 小时 观看时长矩阵（默认上周），没有数据时返回全 0 矩阵"""
+    _, _, week_start_str, week_end_str = get_week_range(week_start_str)
+    return get_heatmaps(week_start_str, week_end_str).get(week_start_str, [[0] * 24 for _ in range(7)])
+
+
+def iter_period_sessions(since_str, until_str):
+    """流式产出区间内（含首尾两天）各服务器的观看会话，附带所属服务器名（不附带配置，避免密钥随结果输出）"""
+    since_epoch = report_cache.day_epoch(since_str, UTC_OFFSET)
+    until_epoch = report_cache.day_epoch(until_str, UTC_OFFSET) + 86400
+    for server in available_servers():
+        for session in report_cache.iter_sessions(server["cache_db_path"], since_epoch, until_epoch,
+                                                  int(SESSION_GAP_MINUTES * 60)):
+            session["Server"] = server["name"]
+            yield session
+
+
+def get_session_stats(week_start_str=None):
+    """单周观看会话统计（默认上周）"""
+    _, _, week_start_str, week_end_str = get_week_range(week_start_str)
+    return get_range_session_stats(week_start_str, week_end_str)
+
+
+def get_range_session_stats(since_str, until_str):
+    """
+    区间观看会话统计：会话数、平均集数、最长连看与最长追剧
+    返回 report_cache.summarize_sessions 的结果，最长会话 / 追剧附带用户名 Name；没有播放时返回 None
+    """
+    stats = report_cache.summarize_sessions(iter_period_sessions(since_str, until_str))
+    if stats:
+        for key in ("longest", "streak"):
+            if stats[key]:
+                stats[key]["Name"] = get_user_name(stats[key]["UserId"], get_server(stats[key]["Server"]))
+    return stats
+
+
+def session_lines(stats):
+    """会话统计的文字描述（文本榜单与海报共用）"""
+    if not stats:
+        return []
+    lines = [f"观看 {stats['count']} 次"]
+    if stats["avg_episodes"]:
+        lines[0] += f"，平均每次 {stats['avg_episodes']:.1f} 集"
+    longest = stats["longest"]
+    lines.append(f"最长连看: {longest['Name']} {sec_to_str(longest['Duration'])}")
+    streak = stats["streak"]
+    if streak and streak["Streak"] > 1:
+        lines.append(f"一口气追剧: {streak['Name']}《{streak['StreakName']}》{streak['Streak']} 集")
+    return lines
+
+
+def get_range_heatmap(since_str, until_str):
+    """任意区间的 星期 × 小时 观看时长矩阵（各周矩阵逐格相加）"""
+    grid = [[0] * 24 for _ in range(7)]
+    for week_grid in get_heatmaps(since_str, until_str).values():
+        for d in range(7):
+            for h in range(24):
+                grid[d][h] += week_grid[d][h]
+    return grid
+
+
+def export_heatmap(heatmap, path):
+    """将热力图矩阵导出为 JSON"""
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"rows": WEEKDAY_NAMES, "hours": list(range(24)), "seconds": heatmap}, f, ensure_ascii=False)
+    print(f"  [OK] 热力图数据已导出: {path}")
+    return path
 
 
 def get_poster_filename(week_end_str):
@@ -530,25 +1363,107 @@ def get_poster_filename(week_end_str):
     return f"{POSTER_DIR}/weekly-poster-{week_end_str}.png"
 
 
-def fetch_tmdb_poster(poster_path_str: str) -> Optional[Image.Image]:
+def get_range_poster_filename(since_str, until_str, period=None):
+    """生成任意区间榜单的海报文件名"""
+    return f"{POSTER_DIR}/{period or 'range'}-poster-{since_str}_{until_str}.png"
+
+
+def get_user_poster_filename(user_name, user_id, week_end_str):
+    """生成个人周榜海报文件名（附带 UserId 前缀，避免重名用户互相覆盖）"""
+    safe_name = re.sub(r'[\\/:*?"<>|\s]+', "_", user_name).strip("_") or "user"
+    return f"{POSTER_DIR}/users/{safe_name}-{user_id[:8]}-{week_end_str}.png"
+
+
+WEEKDAY_NAMES = ["周一", "周二", "周三", "周四", "周五", "周六", "周日"]
+
+
+def get_user_week_data(week_start_str=None):
+    """
+    统计所有用户本周的个人榜单与观看习惯
+    每台服务器只扫描一次该周的汇总记录，在内存中按用户拆分；
+    剧集解析与用户名共用进程内缓存，同一部剧只会查询一次
+    返回 (报告列表, week_start_str, week_end_str)
+    """
+    week_start, week_end, week_start_str, week_end_str = get_week_range(week_start_str)
+    
+    print("\n📊 正在统计个人播放数据...")
+    
+    reports = []
+    for server in available_servers():
+        rows = query("""
+            SELECT UserId, Day, SeriesName, DisplayName, ItemType, ClientName, ItemId, PlayDuration, PlayCount
+            FROM DailyRollup
+            WHERE Day >= ?
+              AND Day <= ?
+              AND UserId != ''
+        """, (week_start_str, week_end_str), db_path=server["cache_db_path"])
+        
+        users = defaultdict(lambda: {
+            "Movie": {}, "Episode": {},
+            "clients": defaultdict(int), "days": defaultdict(int),
+            "duration": 0, "plays": 0,
+        })
+        for r in rows:
+            user = users[r["UserId"]]
+            user["duration"] += r["PlayDuration"]
+            user["plays"] += r["PlayCount"]
+            user["clients"][r["ClientName"] or "未知"] += r["PlayCount"]
+            user["days"][r["Day"]] += r["PlayDuration"]
+            
+            if r["ItemType"] in ("Movie", "Episode"):
+                item = user[r["ItemType"]].setdefault(
+                    r["SeriesName"], {"Name": r["DisplayName"], "ItemId": r["ItemId"], "cnt": 0, "dur": 0}
+                )
+                item["cnt"] += r["PlayCount"]
+                item["dur"] += r["PlayDuration"]
+        
+        for user_id, user in users.items():
+            tv_shows, anime = rank_series(list(user["Episode"].values()), server)
+            busiest_day = max(user["days"], key=user["days"].get)
+            name = get_user_name(user_id, server)
+            if len(SERVERS) > 1:
+                name = f"{name}@{server['name']}"
+            reports.append({
+                "user_id": user_id,
+                "name": name,
+                "server": server["name"],
+                "movies": [
+                    {**m, "Server": server["name"]}
+                    for m in rank_movies(user["Movie"].values())
+                ],
+                "tv_shows": tv_shows,
+                "anime": anime,
+                "duration": user["duration"],
+                "plays": user["plays"],
+                "active_days": len(user["days"]),
+                "busiest_day": WEEKDAY_NAMES[datetime.date.fromisoformat(busiest_day).weekday()],
+                "top_client": max(user["clients"], key=user["clients"].get),
+            })
+    
+    reports.sort(key=lambda x: x["duration"], reverse=True)
+    print(f"  -> 共 {len(reports)} 位用户")
+    return reports, week_start_str, week_end_str
+
+
+def fetch_tmdb_poster_bytes(poster_path_str):
+    """下载 TMDB 海报原始字节（经磁盘缓存）"""
+    url = f"https://image.tmdb.org/t/p/w200{poster_path_str}"
+    return fetch_image_bytes(f"tmdb:{poster_path_str}", url)
+
+
+def fetch_tmdb_poster(poster_path_str: str) -> Optional["Image.Image"]:
     """从 TMDB 获取海报图片"""
     if not poster_path_str:
         return None
-    try:
-        # TMDB 海报 URL
-        url = f"https://image.tmdb.org/t/p/w200{poster_path_str}"
-        resp = requests.get(url, timeout=10)
-        if resp.status_code == 200:
-            return Image.open(BytesIO(resp.content))
-    except:
-        pass
-    return None
+    return open_image(fetch_tmdb_poster_bytes(poster_path_str))
 
 
-def draw_poster_v3(movies, tv_shows, anime, top_user, calendar, poster_path):
+def layout_poster_v3(movies, tv_shows, anime, calendar, week_start_str=None, header=None,
+                     show_calendar=True, heatmap=None, sessions=None, footer_label=None):
     """
-    生成播放周榜海报 V3
-    新增：本周放送日历区域（横向7列布局）
+    周榜海报 V3 的排版阶段：一次计算出所有元素的位置，返回 (W, H, 绘制指令列表)
+    只测量文字（poster_layout 缓存宽度、按像素截断），不绘制也不下载图片；
+    海报图片以来源 ("jellyfin", ItemId, 名称, 类型, 服务器) / ("tmdb", 路径) 记录，由绘制阶段加载
     """
     # === 设计参数 ===
     W = 1080
@@ -593,9 +1508,19 @@ def draw_poster_v3(movies, tv_shows, anime, top_user, calendar, poster_path):
     content_padding = 30
     section_gap = 50
     
+    # 热力图区域参数（7 行 × 24 列）
+    heat_label_w = 50
+    heat_cell_w = (W - margin_x * 2 - heat_label_w) // 24
+    heat_cell_h = 20
+    heat_gap = 3
+    heatmap_area_h = 0
+    if heatmap:
+        heatmap_area_h = section_gap + 50 + 7 * (heat_cell_h + heat_gap) + 20
+    
     # 总高度
-    H = margin_top + header_h + col_title_h + card_area_h + content_padding
-    H += section_gap + calendar_area_h
+    H = margin_top + header_h + col_title_h + card_area_h + content_padding + heatmap_area_h
+    if show_calendar:
+        H += section_gap + calendar_area_h
     H += footer_h
     
     # === 分类数据 ===
@@ -604,35 +1529,23 @@ def draw_poster_v3(movies, tv_shows, anime, top_user, calendar, poster_path):
         ('电视剧', 'TV Series', tv_shows, (140, 155, 150)),
         ('番剧', 'Anime', anime, (155, 145, 165)),
     ]
-    
-    # === 创建画布 ===
-    img = Image.new("RGBA", (W, H))
-    draw = ImageDraw.Draw(img)
-
-    # === 背景渐变 ===
-    for y in range(H):
-        t = y / H
-        r = int(250 - 35 * t)
-        g = int(240 - 50 * t)
-        b = int(235 - 25 * t)
-        draw.line((0, y, W, y), fill=(r, g, b))
 
     # === 字体 ===
-    title_font = ImageFont.truetype("C:/Windows/Fonts/msyhbd.ttc", 36)
-    sub_font = ImageFont.truetype("C:/Windows/Fonts/msyh.ttc", 14)
-    col_title_font = ImageFont.truetype("C:/Windows/Fonts/msyhbd.ttc", 16)
-    col_sub_font = ImageFont.truetype("C:/Windows/Fonts/msyh.ttc", 11)
-    rank_font = ImageFont.truetype("C:/Windows/Fonts/msyh.ttc", 12)
-    empty_font = ImageFont.truetype("C:/Windows/Fonts/msyh.ttc", 12)
-    brand_font = ImageFont.truetype("C:/Windows/Fonts/msyh.ttc", 12)
-    name_font = ImageFont.truetype("C:/Windows/Fonts/msyh.ttc", 11)
+    title_font = load_font("C:/Windows/Fonts/msyhbd.ttc", 36)
+    sub_font = load_font("C:/Windows/Fonts/msyh.ttc", 14)
+    col_title_font = load_font("C:/Windows/Fonts/msyhbd.ttc", 16)
+    col_sub_font = load_font("C:/Windows/Fonts/msyh.ttc", 11)
+    rank_font = load_font("C:/Windows/Fonts/msyh.ttc", 12)
+    empty_font = load_font("C:/Windows/Fonts/msyh.ttc", 12)
+    brand_font = load_font("C:/Windows/Fonts/msyh.ttc", 12)
+    name_font = load_font("C:/Windows/Fonts/msyh.ttc", 11)
+    placeholder_font = load_font("C:/Windows/Fonts/msyh.ttc", 14)
     
     # 日历字体
-    cal_title_font = ImageFont.truetype("C:/Windows/Fonts/msyhbd.ttc", 20)
-    cal_date_font = ImageFont.truetype("C:/Windows/Fonts/msyhbd.ttc", 18)
-    cal_name_font = ImageFont.truetype("C:/Windows/Fonts/msyh.ttc", 12)
-    cal_ep_font = ImageFont.truetype("C:/Windows/Fonts/msyh.ttc", 11)
-    cal_empty_font = ImageFont.truetype("C:/Windows/Fonts/msyh.ttc", 11)
+    cal_title_font = load_font("C:/Windows/Fonts/msyhbd.ttc", 20)
+    cal_date_font = load_font("C:/Windows/Fonts/msyhbd.ttc", 18)
+    cal_name_font = load_font("C:/Windows/Fonts/msyh.ttc", 12)
+    cal_ep_font = load_font("C:/Windows/Fonts/msyh.ttc", 11)
 
     # === 颜色系统 ===
     text_primary = (60, 60, 65)
@@ -640,15 +1553,15 @@ def draw_poster_v3(movies, tv_shows, anime, top_user, calendar, poster_path):
     text_tertiary = (160, 160, 170)
     empty_bg = (220, 220, 225)
     empty_text = (170, 170, 180)
-    
-    # 日历颜色
-    cal_bg = (240, 240, 245)
-    cal_card_bg = (250, 250, 252)
+
+    # === 背景渐变 ===
+    ops = [("gradient", (0, 0, W, H), (250, 240, 235), (215, 190, 210))]
 
     # === Header ===
     header_y = margin_top
-    draw.text((margin_x, header_y), "播放周榜", fill=text_primary, font=title_font)
-    draw.text((margin_x, header_y + 45), "Weekly Playback Statistics", fill=text_secondary, font=sub_font)
+    title, subtitle = header or ("播放周榜", "Weekly Playback Statistics")
+    ops.append(("text", (margin_x, header_y), title, text_primary, title_font))
+    ops.append(("text", (margin_x, header_y + 45), subtitle, text_secondary, sub_font))
 
     # === Content: 三列布局 ===
     content_y = margin_top + header_h
@@ -657,8 +1570,8 @@ def draw_poster_v3(movies, tv_shows, anime, top_user, calendar, poster_path):
         col_x = rank_col_positions[i]
         count = len(items) if items else 0
         
-        draw.text((col_x, content_y), cat_cn, fill=text_primary, font=col_title_font)
-        draw.text((col_x, content_y + 22), cat_en, fill=text_tertiary, font=col_sub_font)
+        ops.append(("text", (col_x, content_y), cat_cn, text_primary, col_title_font))
+        ops.append(("text", (col_x, content_y + 22), cat_en, text_tertiary, col_sub_font))
         
         cards_y = content_y + col_title_h
         
@@ -668,90 +1581,104 @@ def draw_poster_v3(movies, tv_shows, anime, top_user, calendar, poster_path):
             
             if items and j < count:
                 item = items[j]
-                poster_img = None
                 
                 if cat_en == 'Movie':
-                    mid = search_jellyfin_item(item["Name"], "Movie")
-                    if mid:
-                        poster_img = jellyfin_poster(mid)
+                    source = ("jellyfin", item.get("MovieId"), item["Name"], "Movie", item.get("Server"))
                 else:
-                    if "SeriesId" in item:
-                        poster_img = jellyfin_poster(item["SeriesId"])
-                    else:
-                        sid = search_jellyfin_item(item["Name"], "Series")
-                        if sid:
-                            poster_img = jellyfin_poster(sid)
+                    source = ("jellyfin", item.get("SeriesId"), item["Name"], "Series", item.get("Server"))
                 
-                if poster_img:
-                    poster_img = poster_img.resize((card_w, card_h), Image.Resampling.LANCZOS)
-                    rounded_poster = add_rounded_corners(poster_img, card_radius)
-                    img.paste(rounded_poster, (col_x, card_y), rounded_poster)
-                else:
-                    card = Image.new('RGBA', (card_w, card_h), (*color, 255))
-                    rounded_card = add_rounded_corners(card, card_radius)
-                    img.paste(rounded_card, (col_x, card_y), rounded_card)
-                    
-                    placeholder_font = ImageFont.truetype("C:/Windows/Fonts/msyh.ttc", 14)
-                    name = item["Name"]
-                    max_chars = 12
-                    if len(name) > max_chars:
-                        name = name[:max_chars] + "..."
-                    
-                    bbox = placeholder_font.getbbox(name)
-                    name_w = bbox[2] - bbox[0]
-                    name_x = col_x + (card_w - name_w) // 2
-                    name_y = card_y + card_h // 2 - 10
-                    draw.text((name_x, name_y), name, fill=(255, 255, 255, 220), font=placeholder_font)
+                # 没有封面时：分类色卡片 + 居中剧名
+                fallback = [
+                    ("rect", (col_x, card_y, col_x + card_w, card_y + card_h), color, card_radius),
+                    poster_layout.centered_text(placeholder_font, item["Name"], col_x, card_w,
+                                                card_y + card_h // 2 - 10, (255, 255, 255, 220),
+                                                max_width=card_w - 24),
+                ]
+                ops.append(("image", (col_x, card_y), (card_w, card_h), card_radius, source, fallback))
                 
-                draw.text((col_x + 12, card_y + 10), str(rank), 
-                         fill=(255, 255, 255, 180), font=rank_font)
+                ops.append(("text", (col_x + 12, card_y + 10), str(rank), (255, 255, 255, 180), rank_font))
                 
-                item_name = item["Name"]
-                max_chars = 30
-                if len(item_name) > max_chars:
-                    item_name = item_name[:max_chars] + "..."
-                bbox = name_font.getbbox(item_name)
-                item_name_w = bbox[2] - bbox[0]
-                item_name_x = col_x + (card_w - item_name_w) // 2
-                item_name_y = card_y + card_h + 6
-                draw.text((item_name_x, item_name_y), item_name, fill=text_secondary, font=name_font)
+                # 名次变化标记（右上角）
+                label = trend_label(item)
+                if label:
+                    trend = item.get("trend")
+                    if trend == "new":
+                        badge_color = (200, 150, 70)
+                    elif trend and trend > 0:
+                        badge_color = (90, 160, 110)
+                    elif trend:
+                        badge_color = (190, 95, 95)
+                    else:
+                        badge_color = (120, 120, 130)
+                    label_w = poster_layout.text_width(rank_font, label)
+                    badge_right = col_x + card_w - 8
+                    ops.append(("rect", (badge_right - label_w - 14, card_y + 8, badge_right, card_y + 28),
+                                badge_color, 10))
+                    ops.append(("text", (badge_right - label_w - 7, card_y + 10), label,
+                                (255, 255, 255), rank_font))
+                
+                ops.append(poster_layout.centered_text(name_font, item["Name"], col_x, card_w,
+                                                       card_y + card_h + 6, text_secondary,
+                                                       max_width=card_w))
             else:
-                placeholder = Image.new('RGBA', (card_w, card_h), (*empty_bg, 255))
-                rounded_placeholder = add_rounded_corners(placeholder, card_radius)
-                img.paste(rounded_placeholder, (col_x, card_y), rounded_placeholder)
+                ops.append(("rect", (col_x, card_y, col_x + card_w, card_y + card_h), empty_bg, card_radius))
                 
                 if j == count:
-                    hint = "本周暂无播放记录"
-                    bbox = empty_font.getbbox(hint)
-                    hint_w = bbox[2] - bbox[0]
-                    hint_x = col_x + (card_w - hint_w) // 2
-                    hint_y = card_y + card_h // 2 - 8
-                    draw.text((hint_x, hint_y), hint, fill=empty_text, font=empty_font)
+                    ops.append(poster_layout.centered_text(empty_font, "本周暂无播放记录", col_x, card_w,
+                                                           card_y + card_h // 2 - 8, empty_text))
+
+    # === 热力图区域 ===
+    if heatmap:
+        heat_y = content_y + col_title_h + card_area_h + content_padding + section_gap
+        ops.append(("text", (margin_x, heat_y), "观看时段", text_primary, cal_title_font))
+        ops.append(("text", (margin_x + 80, heat_y + 3), "Viewing Heatmap", text_tertiary, col_sub_font))
+        
+        session_text = " · ".join(session_lines(sessions))
+        if session_text:
+            session_text = poster_layout.truncate_text(col_sub_font, session_text, W - margin_x * 2 - 200)
+            ops.append(("text", (W - margin_x - poster_layout.text_width(col_sub_font, session_text), heat_y + 6),
+                        session_text, text_secondary, col_sub_font))
+        
+        grid_y = heat_y + 50
+        grid_x = margin_x + heat_label_w
+        peak = max(max(row) for row in heatmap) or 1
+        heat_color = (120, 110, 160)
+        
+        for d, row in enumerate(heatmap):
+            cell_y = grid_y + d * (heat_cell_h + heat_gap)
+            ops.append(("text", (margin_x, cell_y + 3), WEEKDAY_NAMES[d], text_secondary, col_sub_font))
+            for h, value in enumerate(row):
+                t = value / peak
+                fill = tuple(int(e + (c - e) * t) for e, c in zip(empty_bg, heat_color))
+                cell_x = grid_x + h * heat_cell_w
+                ops.append(("rect", (cell_x, cell_y, cell_x + heat_cell_w - heat_gap, cell_y + heat_cell_h),
+                            fill, 3))
+        
+        hours_y = grid_y + 7 * (heat_cell_h + heat_gap) + 2
+        for h in range(0, 24, 3):
+            ops.append(("text", (grid_x + h * heat_cell_w, hours_y), f"{h:02d}", text_tertiary, col_sub_font))
 
     # === 日历区域（横向平铺布局）===
-    calendar_y = content_y + col_title_h + card_area_h + content_padding + section_gap
+    calendar_y = content_y + col_title_h + card_area_h + content_padding + heatmap_area_h + section_gap
     
     # 日历标题
-    draw.text((margin_x, calendar_y), "本周放送", fill=text_primary, font=cal_title_font)
-    draw.text((margin_x + 80, calendar_y + 3), "This Week's Airing", fill=text_tertiary, font=col_sub_font)
+    if show_calendar:
+        ops.append(("text", (margin_x, calendar_y), "本周放送", text_primary, cal_title_font))
+        ops.append(("text", (margin_x + 80, calendar_y + 3), "This Week's Airing", text_tertiary, col_sub_font))
     
-    # 开始绘制各天的剧集（横向平铺）
+    # 各天的剧集（横向平铺）
     current_y = calendar_y + calendar_title_h
     
-    for day in calendar:
+    for day in (calendar if show_calendar else []):
         episodes = day['episodes']
         if not episodes:
             continue
         
         # 日期标签（左侧）
-        date_str = f"{day['date'][5:]}\n{day['weekday']}"
-        date_lines = date_str.split('\n')
         date_y = current_y + 10
-        for line in date_lines:
-            bbox = cal_date_font.getbbox(line)
-            line_w = bbox[2] - bbox[0]
-            line_x = margin_x + (cal_date_w - line_w) // 2
-            draw.text((line_x, date_y), line, fill=text_primary, font=cal_date_font)
+        for line in (day['date'][5:], day['weekday']):
+            ops.append(poster_layout.centered_text(cal_date_font, line, margin_x, cal_date_w,
+                                                   date_y, text_primary))
             date_y += 25
         
         # 剧集横向排列（从日期标签右侧开始）
@@ -761,83 +1688,114 @@ def draw_poster_v3(movies, tv_shows, anime, top_user, calendar, poster_path):
         for ep_idx, ep in enumerate(episodes[:max_items_per_row]):  # 最多一行
             ep_x = items_x + ep_idx * (cal_item_w + cal_item_gap)
             
-            # 获取海报
-            poster_img = fetch_tmdb_poster(ep.get('poster'))
-            
             # 海报居中位置
             poster_x = ep_x + (cal_item_w - cal_poster_w) // 2
+            source = ("tmdb", ep['poster']) if ep.get('poster') else None
+            fallback = [("rect", (poster_x, current_y, poster_x + cal_poster_w, current_y + cal_poster_h),
+                         empty_bg, 6)]
+            ops.append(("image", (poster_x, current_y), (cal_poster_w, cal_poster_h), 6, source, fallback))
             
-            if poster_img:
-                poster_img = poster_img.resize((cal_poster_w, cal_poster_h), Image.Resampling.LANCZOS)
-                rounded_poster = add_rounded_corners(poster_img, 6)
-                img.paste(rounded_poster, (poster_x, current_y), rounded_poster)
-            else:
-                # 占位背景
-                placeholder = Image.new('RGBA', (cal_poster_w, cal_poster_h), (220, 220, 225, 255))
-                rounded_placeholder = add_rounded_corners(placeholder, 6)
-                img.paste(rounded_placeholder, (poster_x, current_y), rounded_placeholder)
-            
-            # 剧名（居中，截断）
-            ep_name = ep['name']
-            max_name_chars = 10
-            if len(ep_name) > max_name_chars:
-                ep_name = ep_name[:max_name_chars] + ".."
-            
-            bbox = cal_name_font.getbbox(ep_name)
-            name_w = bbox[2] - bbox[0]
-            name_x = ep_x + (cal_item_w - name_w) // 2
+            # 剧名（居中，按宽度截断）
             name_y = current_y + cal_poster_h + 5
-            draw.text((name_x, name_y), ep_name, fill=text_primary, font=cal_name_font)
+            ops.append(poster_layout.centered_text(cal_name_font, ep['name'], ep_x, cal_item_w, name_y,
+                                                   text_primary, max_width=cal_item_w, ellipsis=".."))
             
             # 如果有季号集数则显示（电视剧）
             if 'season' in ep and 'episode' in ep:
-                ep_info = f"S{ep['season']}E{ep['episode']}"
-                bbox = cal_ep_font.getbbox(ep_info)
-                info_w = bbox[2] - bbox[0]
-                info_x = ep_x + (cal_item_w - info_w) // 2
-                info_y = name_y + 18
-                draw.text((info_x, info_y), ep_info, fill=text_secondary, font=cal_ep_font)
+                ops.append(poster_layout.centered_text(cal_ep_font, f"S{ep['season']}E{ep['episode']}",
+                                                       ep_x, cal_item_w, name_y + 18, text_secondary))
         
         # 如果超过显示数量，显示 +N
         if len(episodes) > max_items_per_row:
             more_x = items_x + max_items_per_row * (cal_item_w + cal_item_gap)
             more_y = current_y + cal_item_h // 2
-            more_text = f"+{len(episodes) - max_items_per_row}"
-            draw.text((more_x, more_y), more_text, fill=text_tertiary, font=cal_ep_font)
+            ops.append(("text", (more_x, more_y), f"+{len(episodes) - max_items_per_row}",
+                        text_tertiary, cal_ep_font))
         
         current_y += cal_item_h + cal_row_gap
 
     # === Footer ===
     footer_y = H - footer_h + 10
     
-    now = datetime.datetime.now()
-    week_num = now.isocalendar()[1]
-    draw.text((margin_x, footer_y), f"Week {week_num} . {now.year}", 
-             fill=text_tertiary, font=brand_font)
+    if week_start_str:
+        iso_year, week_num, _ = datetime.date.fromisoformat(week_start_str).isocalendar()
+    else:
+        now = datetime.datetime.now()
+        iso_year, week_num = now.year, now.isocalendar()[1]
+    ops.append(("text", (margin_x, footer_y), footer_label or f"Week {week_num} . {iso_year}",
+                text_tertiary, brand_font))
+    ops.append(("text", (margin_x, footer_y + 20), f"Jellyfin Media . {SITE_NAME}",
+                text_secondary, brand_font))
+    
+    return W, H, ops
+
+
+def load_poster_source(source):
+    """加载排版阶段记录的海报来源，返回 PIL 图片或 None"""
+    if source[0] == "tmdb":
+        return fetch_tmdb_poster(source[1])
+    
+    _, item_id, name, item_type, server = source
+    server = get_server(server)
+    if not item_id:
+        item_id = search_jellyfin_item(name, item_type, server)
+    return jellyfin_poster(item_id, server)
+
+
+def draw_poster_v3(movies, tv_shows, anime, top_user, calendar, poster_path, week_start_str=None,
+                   header=None, show_calendar=True, heatmap=None, sessions=None, footer_label=None):
+    """
+    生成播放周榜海报 V3
+    新增：本周放送日历区域（横向7列布局）
+    week_start_str 指定时页脚显示该周的周数（用于补生成历史周榜）
+    header 为 (标题, 副标题)，用于个人周榜；show_calendar 为 False 时不绘制日历区域
+    heatmap 为 7×24 观看时长矩阵，提供时在榜单下方绘制观看时段热力图；
+    sessions 为会话统计，显示在热力图标题右侧；footer_label 替换页脚的周数（用于任意区间榜单）
+    先由 layout_poster_v3 排版得到绘制指令，再由 poster_layout.render 绘制
+    返回实际保存的海报路径（扩展名取决于 POSTER_FORMAT）
+    """
+    from PIL import Image
+    
+    W, H, ops = layout_poster_v3(movies, tv_shows, anime, calendar, week_start_str, header=header,
+                                 show_calendar=show_calendar, heatmap=heatmap, sessions=sessions,
+                                 footer_label=footer_label)
     
-    draw.text((margin_x, footer_y + 20), f"Jellyfin Media . {SITE_NAME}", 
-             fill=text_secondary, font=brand_font)
+    img = Image.new("RGBA", (W, H))
+    poster_layout.render(img, ops, load_poster_source)
 
     # 保存
-    img.convert('RGB').save(poster_path)
+    poster_path = poster_output.save_poster(img, poster_path)
     print(f"  [OK] 海报已生成: {poster_path}")
+    return poster_path
 
 
 def upload_to_lsky(file_path):
-    """上传到 Lsky 图床"""
+    """
+    上传到 Lsky 图床
+    按文件内容 SHA-256 去重：相同海报再次运行或重试时直接复用已有 URL
+    """
     print(f"\n  -> 正在上传海报...")
     try:
+        with open(file_path, 'rb') as f:
+            file_data = f.read()
+        content_hash = hashlib.sha256(file_data).hexdigest()
+        
+        img_url = report_cache.get_upload_url(CACHE_DB_PATH, content_hash)
+        if img_url:
+            print(f"  [OK] 相同海报已上传过，复用: {img_url}")
+            return img_url
+        
         url = f"{LSKY_URL}/api/v1/upload"
         headers = {"Authorization": f"Bearer {LSKY_TOKEN}"}
         
-        with open(file_path, 'rb') as f:
-            files = {'file': f}
-            r = requests.post(url, headers=headers, files=files, timeout=30)
+        files = {'file': (os.path.basename(file_path), file_data)}
+        r = get_session().post(url, headers=headers, files=files, timeout=30)
         
         if r.status_code == 200:
             data = r.json()
             if data.get('status'):
                 img_url = data['data']['links']['url']
+                report_cache.save_upload_url(CACHE_DB_PATH, content_hash, img_url)
                 print(f"  [OK] 上传成功: {img_url}")
                 return img_url
     except Exception as e:
@@ -845,12 +1803,12 @@ def upload_to_lsky(file_path):
     return None
 
 
-def send_serverchan(desp):
+def send_serverchan(desp, title=None):
     """推送到 Server 酱"""
     url = f"https://sctapi.ftqq.com/{SERVERCHAN_KEY}.send"
     try:
-        r = requests.post(url, data={
-            "title": f"{SITE_NAME} Jellyfin 播放周榜",
+        r = get_session().post(url, data={
+            "title": title or f"{SITE_NAME} Jellyfin 播放周榜",
             "desp": desp
         }, timeout=10)
         
@@ -861,19 +1819,123 @@ def send_serverchan(desp):
     return False
 
 
-def build_text(movies, tv_shows, anime, top_user, calendar, week_start_str, week_end_str):
-    """生成文本榜单"""
-    lines = [f"【{SITE_NAME} Jellyfin 播放周榜】\n\n"]
+def queue_push(text, title=None, poster_path=None, image_label="周榜"):
+    """把一次推送（可选附带海报）写入待投递队列"""
+    payload = {
+        "title": title,
+        "text": text,
+        "poster_path": poster_path,
+        "image_label": image_label,
+        "img_url": None,
+        "upload_failures": 0,
+        "text_sent": False,
+    }
+    return report_cache.enqueue_delivery(CACHE_DB_PATH, "push", payload)
+
+
+def deliver_push(payload):
+    """
+    执行一次推送：先上传海报（未配置图床则跳过），再推送 Server 酱
+    返回 (是否成功, 错误信息)；payload 会记录已拿到的图片 URL，重试时不再上传
+
+    图床上传失败时立即推送纯文本，只把海报留在队列中重试，上传成功后单独补发；
+    连续失败 OUTBOX_UPLOAD_ATTEMPTS 次后放弃补发
+    """
+    poster_path = payload.get("poster_path")
+    if poster_path and not payload.get("img_url") and LSKY_TOKEN:
+        img_url = upload_to_lsky(poster_path) if os.path.exists(poster_path) else None
+        if img_url:
+            payload["img_url"] = img_url
+        else:
+            payload["upload_failures"] = payload.get("upload_failures", 0) + 1
+            if not payload.get("text_sent"):
+                if not send_serverchan(payload["text"], title=payload.get("title")):
+                    return False, "Server 酱推送失败"
+                payload["text_sent"] = True
+                print("  [OK] 推送成功（无图片），海报稍后补发")
+            if payload["upload_failures"] < OUTBOX_UPLOAD_ATTEMPTS:
+                return False, "图床上传失败"
+            print("  [!] 图床多次上传失败，不再补发海报")
+            payload["poster_path"] = None
+            return True, None
+    
+    img_url = payload.get("img_url")
+    label = payload.get("image_label", "周榜")
+    if payload.get("text_sent"):
+        # 文本已推送过，只补发海报
+        if not img_url:
+            return True, None
+        desp = f"![{label}]({img_url})"
+    else:
+        desp = payload["text"]
+        if img_url:
+            desp = f"![{label}]({img_url})\n\n{desp}"
+    
+    if send_serverchan(desp, title=payload.get("title")):
+        if payload.get("text_sent"):
+            print("  [OK] 海报补发成功")
+        else:
+            print("  [OK] 推送成功" if img_url else "  [OK] 推送成功（无图片）")
+        return True, None
+    return False, "Server 酱推送失败"
+
+
+def flush_outbox():
+    """
+    投递所有到期的待推送记录，失败的按指数退避安排下次重试
+    每条记录先认领再投递，常驻进程与手动 --flush-outbox 同时运行时不会重复推送
+    """
+    deliveries = report_cache.due_deliveries(CACHE_DB_PATH)
+    if not deliveries:
+        return 0
+    
+    print(f"  -> 待投递 {len(deliveries)} 条")
+    delivered = 0
+    for delivery in deliveries:
+        if not report_cache.claim_delivery(CACHE_DB_PATH, delivery["id"]):
+            continue
+        payload = delivery["payload"]
+        try:
+            ok, error = deliver_push(payload)
+        except Exception as e:
+            ok, error = False, str(e)
+        
+        attempts = delivery["attempts"] + 1
+        if ok:
+            report_cache.record_delivery(CACHE_DB_PATH, delivery["id"], payload, "done")
+            delivered += 1
+        elif attempts >= OUTBOX_MAX_ATTEMPTS:
+            print(f"  [X] 投递 #{delivery['id']} 已重试 {attempts} 次，放弃: {error}")
+            report_cache.record_delivery(CACHE_DB_PATH, delivery["id"], payload, "dead", error=error)
+        else:
+            delay = min(OUTBOX_BACKOFF_SECONDS * 2 ** (attempts - 1), OUTBOX_BACKOFF_MAX_SECONDS)
+            print(f"  [!] 投递 #{delivery['id']} 失败（{error}），{delay // 60} 分钟后重试")
+            report_cache.record_delivery(
+                CACHE_DB_PATH, delivery["id"], payload, "pending",
+                next_attempt_at=time.time() + delay, error=error
+            )
+    return delivered
+
+
+def build_text(movies, tv_shows, anime, top_user, calendar, week_start_str, week_end_str, sessions=None,
+               completion=None, title="播放周榜"):
+    """生成文本榜单；title 用于月榜 / 季榜等任意区间榜单"""
+    lines = [f"【{SITE_NAME} Jellyfin {title}】\n\n"]
     lines.append(f"统计周期: {week_start_str} ~ {week_end_str}\n\n")
 
     if top_user:
         lines.append(f"本周片王: {top_user['name']}\n")
         lines.append(f"   观看时长: {sec_to_str(top_user['duration'])}\n\n")
 
+    if sessions:
+        lines.extend(f"{line}\n" for line in session_lines(sessions))
+        lines.append("\n")
+
     lines.append("电影 Top 3:\n\n")
     if movies:
         for i, r in enumerate(movies, 1):
-            lines.append(f"{i}. {r['Name']}\n")
+            label = trend_label(r)
+            lines.append(f"{i}. {r['Name']}{f'  [{label}]' if label else ''}\n")
             lines.append(f"   播放次数: {r['cnt']}  时长: {sec_to_str(r['dur'])}\n")
     else:
         lines.append("该类别本周没有播放记录\n")
@@ -881,7 +1943,8 @@ def build_text(movies, tv_shows, anime, top_user, calendar, week_start_str, week
     lines.append("\n电视剧 Top 3:\n\n")
     if tv_shows:
         for i, r in enumerate(tv_shows, 1):
-            lines.append(f"{i}. {r['Name']}\n")
+            label = trend_label(r)
+            lines.append(f"{i}. {r['Name']}{f'  [{label}]' if label else ''}\n")
             lines.append(f"   播放次数: {r['cnt']}  时长: {sec_to_str(r['dur'])}\n")
     else:
         lines.append("该类别本周没有播放记录\n")
@@ -889,31 +1952,347 @@ def build_text(movies, tv_shows, anime, top_user, calendar, week_start_str, week
     lines.append("\n番剧 Top 3:\n\n")
     if anime:
         for i, r in enumerate(anime, 1):
-            lines.append(f"{i}. {r['Name']}\n")
+            label = trend_label(r)
+            lines.append(f"{i}. {r['Name']}{f'  [{label}]' if label else ''}\n")
             lines.append(f"   播放次数: {r['cnt']}  时长: {sec_to_str(r['dur'])}\n")
     else:
         lines.append("该类别本周没有播放记录\n")
 
+    # 完播榜
+    if completion and any(completion):
+        for title, items, unit in zip(("电影完播榜", "剧集完播榜"), completion, ("人次", "集")):
+            if not items:
+                continue
+            lines.append(f"\n{title}:\n\n")
+            for i, r in enumerate(items, 1):
+                lines.append(f"{i}. {r['Name']}\n")
+                lines.append(f"   完播: {r['finished']} {unit}  平均完播率: {r['completion']:.0%}\n")
+
     # 本周放送
     if calendar:
-        lines.append("\n本周放送:\n\n")
-        for day in calendar[:7]:
-            lines.append(f"{day['date'][5:]} {day['weekday']}:\n")
-            for ep in day['episodes'][:4]:
-                if 'season' in ep and 'episode' in ep:
-                    lines.append(f"  - {ep['name']} S{ep['season']}E{ep['episode']}\n")
-                else:
-                    lines.append(f"  - {ep['name']} [电影]\n")
-            if len(day['episodes']) > 4:
-                lines.append(f"  ... 还有 {len(day['episodes']) - 4} 部\n")
-            lines.append("\n")
+        lines.append("\n")
+        lines.append(build_calendar_text(calendar))
 
     lines.append(f"\n#WeekRanks  {datetime.date.today().isoformat()}")
     
     return "".join(lines)
 
 
-def main():
+def build_calendar_text(calendar):
+    """生成本周放送文本"""
+    lines = ["本周放送:\n\n"]
+    for day in calendar[:7]:
+        lines.append(f"{day['date'][5:]} {day['weekday']}:\n")
+        for ep in day['episodes'][:4]:
+            if 'season' in ep and 'episode' in ep:
+                lines.append(f"  - {ep['name']} S{ep['season']}E{ep['episode']}\n")
+            else:
+                lines.append(f"  - {ep['name']} [电影]\n")
+        if len(day['episodes']) > 4:
+            lines.append(f"  ... 还有 {len(day['episodes']) - 4} 部\n")
+        lines.append("\n")
+    return "".join(lines)
+
+
+def prefetch_posters(weeks):
+    """解析电影 ID 并预先下载所有周榜用到的 Jellyfin 海报到磁盘缓存（去重、并发）"""
+    item_ids = set()
+    for movies, tv_shows, anime, _, _, _ in weeks:
+        for m in movies:
+            if not m.get("MovieId"):
+                m["MovieId"] = search_jellyfin_item(m["Name"], "Movie", get_server(m.get("Server")))
+            if m.get("MovieId"):
+                item_ids.add((m["MovieId"], m.get("Server")))
+        for series in tv_shows + anime:
+            if series.get("SeriesId"):
+                item_ids.add((series["SeriesId"], series.get("Server")))
+    
+    from concurrent.futures import ThreadPoolExecutor
+    
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda pair: fetch_jellyfin_poster_bytes(pair[0], get_server(pair[1])), item_ids))
+    print(f"  -> 已缓存 {len(item_ids)} 张海报")
+
+
+def prefetch_calendar_posters(calendar):
+    """预先下载本周放送用到的 TMDB 海报到磁盘缓存（去重、并发）"""
+    paths = {ep["poster"] for day in calendar for ep in day["episodes"] if ep.get("poster")}
+    
+    from concurrent.futures import ThreadPoolExecutor
+    
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(fetch_tmdb_poster_bytes, paths))
+    print(f"  -> 已缓存 {len(paths)} 张放送海报")
+
+
+def run_stages(stages):
+    """
+    按依赖关系并发执行各阶段
+    stages 为 {名称: (函数, [依赖阶段])}，函数以依赖阶段的结果作为同名关键字参数调用；
+    依赖全部完成的阶段立即提交到线程池，总耗时取决于最长的依赖链。
+    返回 {名称: 结果}；某一阶段抛出异常时等已提交的阶段结束后向上抛出
+    """
+    from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+    
+    def timed(func, kwargs):
+        started = time.perf_counter()
+        return func(**kwargs), time.perf_counter() - started
+    
+    results = {}
+    pending = dict(stages)
+    running = {}
+    with ThreadPoolExecutor(max_workers=len(stages)) as pool:
+        while pending or running:
+            for name, (func, deps) in list(pending.items()):
+                if all(dep in results for dep in deps):
+                    del pending[name]
+                    future = pool.submit(timed, func, {dep: results[dep] for dep in deps})
+                    running[future] = name
+            if not running:
+                raise ValueError(f"阶段依赖无法满足: {', '.join(pending)}")
+            
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                results[name], elapsed = future.result()
+                print(f"  [i] 阶段 {name} 完成，用时 {elapsed:.1f}s")
+    return results
+
+
+def _init_render_worker():
+    """渲染子进程初始化：不复用父进程的 HTTP 连接"""
+    report_common.reset_session()
+
+
+def _render_week_poster(task):
+    """渲染单周海报（在子进程中执行）"""
+    week, heatmap = task
+    movies, tv_shows, anime, top_user, week_start_str, week_end_str = week
+    poster_path = get_poster_filename(week_end_str)
+    return draw_poster_v3(movies, tv_shows, anime, top_user, [], poster_path, week_start_str,
+                          heatmap=heatmap)
+
+
+def _render_user_poster(task):
+    """渲染单个用户的个人周榜海报（在子进程中执行）"""
+    report, week_start_str, week_end_str = task
+    header = (
+        f"{report['name']} 的一周",
+        f"{week_start_str} ~ {week_end_str} · 观看 {sec_to_str(report['duration'])} · "
+        f"{report['plays']} 次播放 · 活跃 {report['active_days']} 天 · "
+        f"{report['busiest_day']}看得最多 · 常用 {report['top_client']}",
+    )
+    return draw_poster_v3(
+        report["movies"], report["tv_shows"], report["anime"], None, [],
+        get_user_poster_filename(report["name"], report["user_id"], week_end_str), week_start_str,
+        header=header, show_calendar=False,
+    )
+
+
+def render_user_posters(week_start_str=None, workers=RENDER_WORKERS):
+    """
+    批量生成所有用户的个人周榜海报
+    一次统计得到全部用户数据，预取去重后的海报，再多进程并行渲染
+    """
+    reports, week_start_str, week_end_str = get_user_week_data(week_start_str)
+    if not reports:
+        print("  [i] 本周没有播放记录")
+        return []
+    
+    Path(f"{POSTER_DIR}/users").mkdir(parents=True, exist_ok=True)
+    
+    print("\n🖼  预取海报...")
+    prefetch_posters([
+        (r["movies"], r["tv_shows"], r["anime"], None, week_start_str, week_end_str)
+        for r in reports
+    ])
+    
+    print(f"\n🎨 并行渲染 {len(reports)} 张个人海报（{workers} 进程）...")
+    from concurrent.futures import ProcessPoolExecutor
+    
+    tasks = [(r, week_start_str, week_end_str) for r in reports]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_render_worker) as pool:
+        return list(pool.map(_render_user_poster, tasks))
+
+
+def backfill(since_str, until_str, workers=RENDER_WORKERS):
+    """
+    补生成历史周榜海报
+    一次扫描汇总表得到全部周数据，共享剧集解析与图片缓存，多进程并行渲染
+    历史周没有订阅日历，也不会推送
+    """
+    weeks = get_weeks_data(since_str, until_str, save_ranks=True)
+    if not weeks:
+        print("  [i] 区间内没有播放记录")
+        return []
+    
+    heatmaps = get_heatmaps(weeks[0][4], weeks[-1][5])
+    
+    print("\n🖼  预取海报...")
+    prefetch_posters(weeks)
+    
+    print(f"\n🎨 并行渲染 {len(weeks)} 张周榜海报（{workers} 进程）...")
+    from concurrent.futures import ProcessPoolExecutor
+    
+    tasks = [(week, heatmaps.get(week[4])) for week in weeks]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_render_worker) as pool:
+        paths = list(pool.map(_render_week_poster, tasks))
+    
+    return paths
+
+
+def parse_args():
+    """命令行参数"""
+    parser = argparse.ArgumentParser(description="Jellyfin 播放周榜生成器 V3")
+    parser.add_argument("--backfill", nargs=2, metavar=("SINCE", "UNTIL"),
+                        help="补生成 SINCE ~ UNTIL（YYYY-MM-DD）之间每一周的海报")
+    parser.add_argument("--workers", type=int, default=RENDER_WORKERS,
+                        help="并行渲染进程数")
+    parser.add_argument("--text-only", action="store_true",
+                        help="只生成文本榜单，不渲染海报（不加载 PIL）")
+    parser.add_argument("--flush-outbox", action="store_true",
+                        help="只重试待投递的推送，不重新统计与渲染")
+    parser.add_argument("--refresh-index", action="store_true",
+                        help="重新建立剧集索引（媒体库 / 分类）后退出")
+    parser.add_argument("--users", action="store_true",
+                        help="为每位用户生成个人周榜海报（不推送）")
+    parser.add_argument("--week", metavar="YYYY-MM-DD",
+                        help="配合 --users 指定统计周（任意一天），默认上周")
+    parser.add_argument("--period", choices=sorted(PERIODS),
+                        help="生成整周 / 月 / 季度 / 年的榜单（不推送），默认上一个完整周期")
+    parser.add_argument("--since", metavar="YYYY-MM-DD",
+                        help="区间起始日期；配合 --period 时为该周期内任意一天")
+    parser.add_argument("--until", metavar="YYYY-MM-DD",
+                        help="区间结束日期（含），默认昨天；需要同时指定 --since，不能与 --period 同用")
+    args = parser.parse_args()
+    if args.period and args.until:
+        parser.error("--period 不能与 --until 同时使用（用 --since 指定周期内任意一天）")
+    if args.until and not args.since:
+        parser.error("指定 --until 时需要同时指定 --since")
+    return args
+
+
+def main_backfill(since_str, until_str, workers):
+    """补生成历史周榜入口"""
+    print("=" * 50)
+    print("  Jellyfin 播放周榜 V3 · 历史补生成")
+    print("=" * 50)
+    
+    ensure_dirs()
+    
+    print("\n[1/3] 获取播放数据...")
+    if not prepare_databases():
+        print("  [X] 没有可用的播放数据，无法继续")
+        return
+    
+    print("\n[2/3] 统计与渲染...")
+    paths = backfill(since_str, until_str, workers)
+    
+    print("\n[3/3] 完成")
+    for path in paths:
+        print(f"  - {path}")
+
+
+def main_range(since_str=None, until_str=None, period=None, text_only=False):
+    """任意区间榜单入口：与周榜共用统计与绘制流程，不附带放送日历，不推送"""
+    since_str, until_str, period = resolve_range(since_str, until_str, period)
+    title, subtitle = PERIODS.get(period, ("播放榜单", "Playback Statistics"))
+    
+    print("=" * 50)
+    print(f"  Jellyfin {title} · {since_str} ~ {until_str}")
+    print("=" * 50)
+    
+    ensure_dirs()
+    
+    print("\n[1/3] 获取播放数据...")
+    if not prepare_databases():
+        print("  [X] 没有可用的播放数据，无法继续")
+        return None
+    
+    print("\n[2/3] 统计播放榜单...")
+    movies, tv_shows, anime, top_user = get_range_data(since_str, until_str)
+    sessions = get_range_session_stats(since_str, until_str)
+    
+    text = build_text(movies, tv_shows, anime, top_user, [], since_str, until_str,
+                      sessions=sessions, title=title)
+    print("\n" + "=" * 50)
+    print(text)
+    print("=" * 50)
+    
+    print("\n[3/3] 生成海报...")
+    if text_only:
+        print("  [i] 文本模式，跳过海报")
+        return None
+    heatmap = get_range_heatmap(since_str, until_str)
+    poster_path = draw_poster_v3(
+        movies, tv_shows, anime, top_user, [], get_range_poster_filename(since_str, until_str, period),
+        header=(title, f"{subtitle} · {since_str} ~ {until_str}"), show_calendar=False,
+        heatmap=heatmap, sessions=sessions, footer_label=f"{since_str} ~ {until_str}",
+    )
+    export_heatmap(heatmap, str(Path(poster_path).with_suffix(".heatmap.json")))
+    return poster_path
+
+
+def main_users(week_start_str, workers):
+    """个人周榜入口"""
+    print("=" * 50)
+    print("  Jellyfin 播放周榜 V3 · 个人周榜")
+    print("=" * 50)
+    
+    ensure_dirs()
+    
+    print("\n[1/3] 获取播放数据...")
+    if not prepare_databases():
+        print("  [X] 没有可用的播放数据，无法继续")
+        return
+    
+    print("\n[2/3] 统计与渲染...")
+    paths = render_user_posters(week_start_str, workers)
+    
+    print("\n[3/3] 完成")
+    for path in paths:
+        print(f"  - {path}")
+
+
+def run_calendar(calendar=None):
+    """单独推送本周放送日历；calendar 为 None 时重新获取"""
+    if calendar is None:
+        calendar = get_weekly_calendar()
+    if not calendar:
+        return calendar
+    
+    text = build_calendar_text(calendar)
+    print("\n" + text)
+    
+    if ENABLE_PUSH:
+        queue_push(text, title=f"{SITE_NAME} 本周放送")
+        flush_outbox()
+    return calendar
+
+
+def collect_week_stats(db):
+    """周榜统计阶段：榜单、热力图、会话与完播榜；数据库不可用时返回 None"""
+    if not db:
+        return None
+    movies, tv_shows, anime, top_user, week_start_str, week_end_str = get_week_data()
+    return {
+        "week": (movies, tv_shows, anime, top_user, week_start_str, week_end_str),
+        "heatmap": get_heatmap(week_start_str),
+        "sessions": get_session_stats(week_start_str),
+        "completion": get_completion_ranking(week_start_str),
+    }
+
+
+def run_weekly(text_only=False, calendar=None, prepared=False):
+    """
+    生成并推送上周播放周榜；text_only 时跳过海报渲染与上传
+    prepared 为 True 时跳过拉库（调用方已执行 prepare_databases），calendar 不为 None 时复用已获取的日历
+
+    拉库、订阅日历、用户目录与放送海报互不依赖，按依赖关系并发执行：
+        db ──> stats ──> posters
+        users ─┘
+        calendar ──> calendar_posters
+    """
     print("=" * 50)
     print("  Jellyfin 播放周榜生成器 V3")
     print("  (含订阅日历)")
@@ -922,55 +2301,92 @@ def main():
     # 1. 确保目录存在
     ensure_dirs()
     
-    # 2. 拉取数据库
-    print("\n[1/5] 获取播放数据...")
-    if not fetch_database():
-        print("  [!] 数据库拉取失败，尝试使用缓存")
-        if not os.path.exists(DB_PATH):
-            print("  [X] 缓存也不存在，无法继续")
-            return
+    # 2. 拉库 / 日历 / 用户目录 / 统计 / 预取海报
+    print("\n[1/5] 获取数据并统计（并发）...")
+    stages = {
+        "db": ((lambda: True) if prepared else prepare_databases, []),
+        "calendar": ((lambda: calendar) if calendar is not None else get_weekly_calendar, []),
+        "users": (lambda: [get_user_directory(server) for server in SERVERS], []),
+        "stats": (lambda db, users: collect_week_stats(db), ["db", "users"]),
+    }
+    if not text_only:
+        stages["posters"] = (lambda stats: stats and prefetch_posters([stats["week"]]), ["stats"])
+        stages["calendar_posters"] = (lambda calendar: prefetch_calendar_posters(calendar), ["calendar"])
+    results = run_stages(stages)
+    
+    stats = results["stats"]
+    if stats is None:
+        print("  [X] 没有可用的播放数据，无法继续")
+        return
+    calendar = results["calendar"]
+    movies, tv_shows, anime, top_user, week_start_str, week_end_str = stats["week"]
+    save_rank_history(week_start_str, movies, tv_shows, anime)
+    heatmap = stats["heatmap"]
+    sessions = stats["sessions"]
+    completion = stats["completion"]
     
-    # 3. 统计数据
     print("\n[2/5] 统计播放榜单...")
-    movies, tv_shows, anime, top_user, week_start_str, week_end_str = get_week_data()
+    print(f"  -> {week_start_str} ~ {week_end_str}: 电影 {len(movies)} / 电视剧 {len(tv_shows)} / 番剧 {len(anime)}")
     
-    # 4. 获取订阅日历
     print("\n[3/5] 获取订阅日历...")
-    calendar = get_weekly_calendar()
+    print(f"  -> {sum(len(day['episodes']) for day in calendar)} 条放送")
     
     # 5. 生成文本
-    text = build_text(movies, tv_shows, anime, top_user, calendar, week_start_str, week_end_str)
+    text = build_text(movies, tv_shows, anime, top_user, calendar, week_start_str, week_end_str,
+                      sessions=sessions, completion=completion)
     print("\n" + "=" * 50)
     print(text)
     print("=" * 50)
     
     # 6. 生成海报
     print("\n[4/5] 生成海报...")
-    poster_path = get_poster_filename(week_end_str)
-    draw_poster_v3(movies, tv_shows, anime, top_user, calendar, poster_path)
+    poster_path = None
+    if text_only:
+        print("  [i] 文本模式，跳过海报")
+    else:
+        poster_path = draw_poster_v3(movies, tv_shows, anime, top_user, calendar,
+                                     get_poster_filename(week_end_str), heatmap=heatmap,
+                                     sessions=sessions)
+        export_heatmap(heatmap, str(Path(poster_path).with_suffix(".heatmap.json")))
     
     # 7. 上传并推送
     print("\n[5/5] 上传与推送...")
     if ENABLE_PUSH:
-        img_url = upload_to_lsky(poster_path)
-        
-        if img_url:
-            desp = f"![周榜]({img_url})\n\n{text}"
-            if send_serverchan(desp):
-                print("  [OK] 推送成功")
-            else:
-                print("  [!] 推送失败")
-        else:
-            if send_serverchan(text):
-                print("  [OK] 推送成功（无图片）")
+        queue_push(text, poster_path=poster_path)
+        flush_outbox()
     else:
         print("  [i] 推送已禁用（测试模式）")
-        print(f"  [i] 海报位置: {poster_path}")
+        if poster_path:
+            print(f"  [i] 海报位置: {poster_path}")
 
     print("\n" + "=" * 50)
     print("  任务完成！")
     print("=" * 50)
 
 
+def main():
+    args = parse_args()
+    if args.flush_outbox:
+        print("  -> 重试待投递推送...")
+        delivered = flush_outbox()
+        print(f"  [OK] 本次投递成功 {delivered} 条")
+        return
+    if args.refresh_index:
+        ensure_dirs()
+        for server in SERVERS:
+            get_series_index(server, refresh=True)
+        return
+    if args.backfill:
+        main_backfill(args.backfill[0], args.backfill[1], args.workers)
+        return
+    if args.users:
+        main_users(args.week, args.workers)
+        return
+    if args.period or args.since or args.until:
+        main_range(args.since, args.until, args.period, text_only=args.text_only)
+        return
+    run_weekly(text_only=args.text_only)
+
+
 if __name__ == "__main__":
     main()